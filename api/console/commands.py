@@ -0,0 +1,47 @@
+class Command:
+    """Metadata for a console command.
+
+    ``handler`` is the name of the ConsoleConsumer coroutine that runs it,
+    called as ``handler(args, username)``. ``rate`` is the token bucket
+    ``(capacity, refill per second)`` applied per connection.
+    """
+
+    def __init__(self, name, handler, usage, op_required=False, min_args=0,
+                 aliases=(), rate=(5, 1.0), hidden=False):
+        self.name = name
+        self.handler = handler
+        self.usage = usage
+        self.op_required = op_required
+        self.min_args = min_args
+        self.aliases = tuple(aliases)
+        self.rate = rate
+        self.hidden = hidden
+
+
+class CommandRegistry:
+    def __init__(self):
+        self._commands = {}
+        self._lookup = {}
+
+    def register(self, command):
+        self._commands[command.name] = command
+        for name in (command.name, *command.aliases):
+            self._lookup[name] = command
+        return command
+
+    def get(self, name):
+        return self._lookup.get(name)
+
+    def __iter__(self):
+        return iter(self._commands.values())
+
+
+registry = CommandRegistry()
+
+
+def command(name, usage, **options):
+    """Register the decorated ConsoleConsumer method as a console command."""
+    def decorator(func):
+        registry.register(Command(name, func.__name__, usage, **options))
+        return func
+    return decorator
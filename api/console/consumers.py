@@ -1,18 +1,40 @@
+import asyncio
 import json
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from .models import Operator
-from game.models import World, Player
+from .commands import command, registry
+from .logbuffer import LEVELS, log_buffer
+from .operators import operator_cache
+from .profiler import profiler, summarize
+from game import regions
+from game.cache import player_cache
+from game.clock import world_clock
+from game.models import Player
+from game.throttle import TokenBucket, inbound_stats
+from voxel_server.ipc import publish
+
+logger = logging.getLogger(__name__)
 
 class ConsoleConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_group_name = "console"
+        self.command_tasks = set()
+        self.command_buckets = {}
+        self.log_level = LEVELS[0]
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
+        backlog = log_buffer.backlog(self.log_level)
+        if backlog is not None:
+            await self.send(text_data=backlog)
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
+        for task in self.command_tasks:
+            task.cancel()
+
     async def receive(self, text_data):
         data = json.loads(text_data)
         msg_type = data.get("type", "command")
@@ -33,42 +55,51 @@ class ConsoleConsumer(AsyncWebsocketConsumer):
             return
 
         # Broadcast the command to everyone (like a chat)
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "console_log",
-                "message": f"> {username}: {command_text}",
-                "level": "info"
-            }
-        )
+        log_buffer.append(self.channel_layer, f"> {username}: {command_text}", "chat")
 
         # Process command
         if command_text.startswith('/'):
             args = command_text.strip().split(' ')
             cmd = args.pop(0).lower()[1:]  # Remove the leading '/'
+            await self.dispatch_command(cmd, args, username)
 
-            if cmd == "time":
-                await self.handle_time(args, username)
-            elif cmd == "tp" or cmd == "teleport":
-                await self.handle_tp(args, username)
-            elif cmd == "fly":
-                await self.handle_fly(args, username)
-            elif cmd == "gamemode":
-                await self.handle_gamemode(args, username)
-            elif cmd == "help":
-                await self.handle_help()
-            else:
-                await self.send_log(f"Unknown command: {cmd}", "error")
+    async def dispatch_command(self, name, args, username):
+        cmd = registry.get(name)
+        if cmd is None:
+            await self.send_log(f"Unknown command: {name}", "error")
+            return
 
-    async def handle_gamemode(self, args, username):
-        if not await self.is_operator(username):
-             await self.send_log("Vous n'êtes pas opérateur", "error")
-             return
+        bucket = self.command_buckets.get(cmd.name)
+        if bucket is None:
+            bucket = self.command_buckets[cmd.name] = TokenBucket(*cmd.rate)
+        if not bucket.allow():
+            await self.send_log(f"Too many /{cmd.name} commands, slow down", "error")
+            return
 
-        if len(args) < 1:
-            await self.send_log("Usage: /gamemode <survival/creative> [player]", "error")
+        if cmd.op_required and not await self.is_operator(username):
+            await self.send_log("Vous n'êtes pas opérateur", "error")
             return
 
+        if len(args) < cmd.min_args:
+            await self.send_log(f"Usage: {cmd.usage}", "error")
+            return
+
+        # Run off the receive path so a slow command cannot stall this socket
+        task = asyncio.create_task(self.run_command(cmd, args, username))
+        self.command_tasks.add(task)
+        task.add_done_callback(self.command_tasks.discard)
+
+    async def run_command(self, cmd, args, username):
+        try:
+            await getattr(self, cmd.handler)(args, username)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Console command /%s failed", cmd.name)
+            await self.send_log(f"/{cmd.name} failed", "error")
+
+    @command("gamemode", "/gamemode <survival/creative> [player]", op_required=True, min_args=1)
+    async def handle_gamemode(self, args, username):
         mode = args[0].lower()
         if mode not in ["survival", "creative"]:
             await self.send_log("Invalid gamemode. Use 'survival' or 'creative'", "error")
@@ -95,22 +126,15 @@ class ConsoleConsumer(AsyncWebsocketConsumer):
         else:
             await self.send_log(f"Player {target_username} not found", "error")
 
-    @database_sync_to_async
-    def update_player_gamemode(self, username, mode):
-        try:
-            player = Player.objects.get(username=username)
-            player.gamemode = mode
-            player.save()
-            return True
-        except Player.DoesNotExist:
-            return False
+    async def update_player_gamemode(self, username, mode):
+        updated = await Player.objects.filter(username=username).aupdate(gamemode=mode)
+        player_cache.invalidate(username)
+        publish("player_changed", username)
+        return updated > 0
 
+    @command("time", "/time set <day/night/value>", op_required=True, min_args=2)
     async def handle_time(self, args, username):
-        if not await self.is_operator(username):
-            await self.send_log("Vous n'êtes pas opérateur", "error")
-            return
-
-        if len(args) < 2 or args[0] != "set":
+        if args[0] != "set":
             await self.send_log("Usage: /time set <day/night/value>", "error")
             return
 
@@ -127,30 +151,26 @@ class ConsoleConsumer(AsyncWebsocketConsumer):
                 await self.send_log("Invalid time value", "error")
                 return
 
-        await self.update_world_time(time_val)
-        
-        # Broadcast time update to console group (clients will update game time)
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "time_update",
-                "time": time_val
-            }
-        )
-        
+        await world_clock.load()
+        world_clock.set(time_val)
+        await world_clock.persist()
+        await world_clock.broadcast(self.channel_layer)
+
         await self.broadcast_log(f"Time set to {time_val}")
 
+    @command("tp", "/tp <x> <y> <z>", op_required=True, min_args=3, aliases=("teleport",))
     async def handle_tp(self, args, username):
-        if not await self.is_operator(username):
-             await self.send_log("Vous n'êtes pas opérateur", "error")
-             return
-
-        if len(args) < 3:
-            await self.send_log("Usage: /tp <x> <y> <z>", "error")
-            return
-            
         try:
             x, y, z = float(args[0]), float(args[1]), float(args[2])
+            # The game connection stops validating moves from the old position
+            await self.channel_layer.group_send(
+                "game_world",
+                {
+                    "type": "player_teleport",
+                    "username": username,
+                    "position": [x, y, z]
+                }
+            )
             # Send teleport command ONLY to the sender
             await self.send(text_data=json.dumps({
                 "type": "teleport",
@@ -160,11 +180,8 @@ class ConsoleConsumer(AsyncWebsocketConsumer):
         except ValueError:
             await self.send_log("Invalid coordinates", "error")
 
+    @command("fly", "/fly [on/off]", op_required=True)
     async def handle_fly(self, args, username):
-        if not await self.is_operator(username):
-             await self.send_log("Vous n'êtes pas opérateur", "error")
-             return
-             
         # Toggle fly mode for sender
         state = None
         if len(args) > 0:
@@ -176,19 +193,154 @@ class ConsoleConsumer(AsyncWebsocketConsumer):
         }))
         await self.broadcast_log(f"{username} toggled fly mode")
 
-    async def handle_help(self):
-        await self.send_log("Available commands: /tp, /fly, /time set")
+    @command("profile", "/profile <start/stop/dump> [count]", op_required=True, min_args=1)
+    async def handle_profile(self, args, username):
+        action = args[0].lower()
 
-    @database_sync_to_async
-    def is_operator(self, username):
-        return Operator.objects.filter(username=username).exists()
+        if action == "start":
+            try:
+                started = profiler.start()
+            except ValueError as e:
+                await self.send_log(f"Could not start the profiler: {e}", "error")
+                return
+            if not started:
+                await self.send_log("Profiler is already running", "error")
+                return
+            await self.broadcast_log(f"{username} started the profiler")
 
-    @database_sync_to_async
-    def update_world_time(self, time):
-        world = World.objects.first()
-        if world:
-            world.time = time
-            world.save()
+        elif action == "stop":
+            if not profiler.stop():
+                await self.send_log("Profiler is not running", "error")
+                return
+            await self.broadcast_log(f"{username} stopped the profiler")
+
+        elif action == "dump":
+            try:
+                count = int(args[1]) if len(args) > 1 else 10
+            except ValueError:
+                await self.send_log("Invalid count", "error")
+                return
+
+            path, stats = profiler.dump()
+            if stats is None:
+                await self.send_log("No profile recorded yet, use /profile start", "error")
+                return
+
+            await self.send_log(f"Profile written to {path}")
+            await self.send_log(f"{stats.total_calls} calls in {stats.total_tt * 1000:.1f}ms, top {count} by own time:")
+            for line in summarize(stats, count):
+                await self.send_log(line)
+
+        else:
+            await self.send_log("Usage: /profile <start/stop/dump> [count]", "error")
+
+    @command("netstats", "/netstats", op_required=True)
+    async def handle_netstats(self, args, username):
+        stats = inbound_stats
+        by_type = ", ".join(
+            f"{key.split('.', 1)[1]} {count}" for key, count in sorted(stats.items()) if key.startswith("throttled.")
+        )
+        await self.send_log(
+            f"Game traffic of this worker: {stats['received']} frames received, {stats['throttled']} throttled"
+            + (f" ({by_type})" if by_type else "")
+            + f", {stats['oversized']} oversized, {stats['coalesced']} position updates coalesced"
+        )
+
+    @command("fill", "/fill <x1> <y1> <z1> <x2> <y2> <z2> <block>", op_required=True, min_args=7, rate=(2, 0.1))
+    async def handle_fill(self, args, username):
+        try:
+            coords = [int(arg) for arg in args[:6]]
+            block = int(args[6])
+        except ValueError:
+            await self.send_log("Invalid coordinates or block id", "error")
+            return
+        if block < 0:
+            await self.send_log("Invalid block id", "error")
+            return
+
+        low, high = regions.make_box(*coords)
+        volume = regions.box_volume(low, high)
+        if not await self.check_region_volume(volume):
+            return
+
+        await self.broadcast_log(f"{username} is filling {volume} blocks")
+        await asyncio.shield(regions.start_job(self.run_fill(low, high, block)))
+
+    async def run_fill(self, low, high, block):
+        count = await regions.fill(low, high, block, self.region_progress("fill"))
+        await self.send_region_update({"min": low, "max": high, "blockType": block})
+        await self.broadcast_log(f"Filled {count} blocks")
+
+    @command("clone", "/clone <x1> <y1> <z1> <x2> <y2> <z2> <x> <y> <z>", op_required=True, min_args=9, rate=(2, 0.1))
+    async def handle_clone(self, args, username):
+        try:
+            coords = [int(arg) for arg in args[:9]]
+        except ValueError:
+            await self.send_log("Invalid coordinates", "error")
+            return
+
+        low, high = regions.make_box(*coords[:6])
+        if not await self.check_region_volume(regions.box_volume(low, high)):
+            return
+
+        await self.broadcast_log(f"{username} is cloning {low} - {high} to {tuple(coords[6:])}")
+        await asyncio.shield(regions.start_job(self.run_clone(low, high, coords[6:])))
+
+    async def run_clone(self, low, high, dest):
+        low, high, volume = await regions.clone(low, high, dest, self.region_progress("clone"))
+        if volume.size:
+            # Block ids in x, y, z order, like the loops of a fill
+            await self.send_region_update({"min": low, "max": high, "volume": volume.ravel().tolist()})
+        await self.broadcast_log(f"Cloned {volume.size} blocks")
+
+    async def check_region_volume(self, volume):
+        if volume == 0:
+            await self.send_log("Region is outside the world", "error")
+            return False
+        if volume > regions.MAX_BLOCKS:
+            await self.send_log(f"Region too large ({volume} > {regions.MAX_BLOCKS} blocks)", "error")
+            return False
+        return True
+
+    def region_progress(self, name):
+        # Jobs report after every batch; the console gets a line per second
+        last_report = time.monotonic()
+
+        async def progress(done, total):
+            nonlocal last_report
+            now = time.monotonic()
+            if done < total and now - last_report >= 1.0:
+                last_report = now
+                await self.broadcast_log(f"/{name}: {done * 100 // total}% ({done}/{total} chunks)")
+        return progress
+
+    async def send_region_update(self, region):
+        # One message for the whole region, encoded once for every player
+        await self.channel_layer.group_send(
+            "game_world",
+            {
+                "type": "region_update",
+                "text": json.dumps({"type": "region_update", **region}),
+            }
+        )
+
+    @command("loglevel", "/loglevel <chat|info|error>", min_args=1)
+    async def handle_loglevel(self, args, username):
+        level = args[0].lower()
+        if level not in LEVELS:
+            await self.send_log("Usage: /loglevel <chat|info|error>", "error")
+            return
+
+        self.log_level = level
+        await self.send_log(f"Showing {level} messages and above")
+
+    @command("help", "/help")
+    async def handle_help(self, args, username):
+        usages = ", ".join(cmd.usage for cmd in registry if not cmd.hidden)
+        await self.send_log(f"Available commands: {usages}")
+
+    async def is_operator(self, username):
+        return await operator_cache.is_operator(username)
 
     async def send_log(self, message, level="info"):
         await self.send(text_data=json.dumps({
@@ -198,17 +350,10 @@ class ConsoleConsumer(AsyncWebsocketConsumer):
         }))
 
     async def broadcast_log(self, message, level="info"):
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "console_log",
-                "message": message,
-                "level": level
-            }
-        )
-
-    async def console_log(self, event):
-        await self.send(text_data=json.dumps(event))
+        log_buffer.append(self.channel_layer, message, level)
 
-    async def time_update(self, event):
-        await self.send(text_data=json.dumps(event))
+    async def console_batch(self, event):
+        # Pre-encoded per level; nothing is sent if no line passes the filter
+        text = event["frames"].get(self.log_level)
+        if text is not None:
+            await self.send(text_data=text)
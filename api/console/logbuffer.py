@@ -0,0 +1,77 @@
+import asyncio
+import json
+from collections import deque
+
+from django.conf import settings
+
+from voxel_server.ipc import publish, subscribe
+
+# Lowest first: a subscriber at "info" sees info and error lines, no chat
+LEVELS = ("chat", "info", "error")
+
+
+def encode(frame_type, entries):
+    return json.dumps({"type": frame_type, "entries": entries})
+
+
+class LogBuffer:
+    """Ring buffer of recent console lines, fanned out in batches.
+
+    Lines appended within ``flush_interval`` seconds go to the console
+    group as one event, already encoded once per log level, so a burst
+    of chat costs a few frames per subscriber rather than one per line.
+    Both the history and the pending batch keep at most ``size`` lines.
+    Consoles connected to other worker processes get the batch through
+    the channel layer; their histories are kept in step with ``publish``.
+    """
+
+    def __init__(self, group, size=200, flush_interval=0.05):
+        self.group = group
+        self.flush_interval = flush_interval
+        self.lines = deque(maxlen=size)
+        self.pending = deque(maxlen=size)
+        self._task = None
+
+    def append(self, channel_layer, message, level="info"):
+        # Lines of an unknown level are shown like info, the flush task can't fail on them
+        entry = {"message": message, "level": level if level in LEVELS else "info"}
+        self.lines.append(entry)
+        self.pending.append(entry)
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_later(channel_layer))
+
+    async def _flush_later(self, channel_layer):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._task = None
+        batch = list(self.pending)
+        self.pending.clear()
+        publish("console_log", batch)
+        await channel_layer.group_send(self.group, {"type": "console_batch", "frames": self.frames(batch)})
+
+    def frames(self, entries):
+        """{level: encoded batch of the entries at or above it}, skipping empty ones."""
+        frames = {}
+        for rank, level in enumerate(LEVELS):
+            visible = [entry for entry in entries if LEVELS.index(entry["level"]) >= rank]
+            if visible:
+                frames[level] = encode("console_batch", visible)
+        return frames
+
+    def backlog(self, level):
+        rank = LEVELS.index(level)
+        entries = [entry for entry in self.lines if LEVELS.index(entry["level"]) >= rank]
+        return encode("console_backlog", entries) if entries else None
+
+
+log_buffer = LogBuffer(
+    "console",
+    size=getattr(settings, 'CONSOLE_LOG_SIZE', 200),
+    flush_interval=getattr(settings, 'CONSOLE_LOG_FLUSH_INTERVAL', 0.05),
+)
+
+
+@subscribe("console_log")
+def extend_history(batch):
+    log_buffer.lines.extend(batch)
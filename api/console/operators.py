@@ -0,0 +1,32 @@
+from .models import Operator
+
+
+class OperatorCache:
+    """In-memory set of operator usernames.
+
+    The table is loaded on first use and reloaded after any change to an
+    Operator row (see console.signals), so permission checks never touch
+    the database in the steady state.
+    """
+
+    def __init__(self):
+        self._usernames = None
+        self.generation = 0
+
+    async def is_operator(self, username):
+        while self._usernames is None:
+            generation = self.generation
+            usernames = set()
+            async for name in Operator.objects.values_list('username', flat=True):
+                usernames.add(name)
+            # A change during the query makes this load stale: read again
+            if generation == self.generation:
+                self._usernames = usernames
+        return username in self._usernames
+
+    def invalidate(self):
+        self.generation += 1
+        self._usernames = None
+
+
+operator_cache = OperatorCache()
@@ -0,0 +1,81 @@
+import cProfile
+import os
+import pstats
+import time
+
+from django.conf import settings
+
+
+class Profiler:
+    """cProfile session toggled from the console.
+
+    The profiler hooks the thread it is started from, which is the event
+    loop thread running every consumer. Nothing is installed while it is
+    stopped, so profiling costs nothing when off.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._profile = None
+        self._last = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._profile is not None
+
+    def start(self):
+        if self.running:
+            return False
+        profile = cProfile.Profile()
+        # Raises ValueError if another profiler (or a debugger's) is active
+        profile.enable()
+        self._profile = profile
+        self.started_at = time.monotonic()
+        return True
+
+    def stop(self):
+        if not self.running:
+            return False
+        self._profile.disable()
+        self._last = self._profile
+        self._profile = None
+        return True
+
+    def snapshot(self):
+        """Return pstats for the running session, or the last one."""
+        profile = self._profile or self._last
+        if profile is None:
+            return None
+
+        if profile is self._profile:
+            profile.disable()
+            stats = pstats.Stats(profile)
+            profile.enable()
+        else:
+            stats = pstats.Stats(profile)
+        return stats
+
+    def dump(self):
+        """Write the current/last session to disk and return (path, stats)."""
+        stats = self.snapshot()
+        if stats is None:
+            return None, None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S.pstats"))
+        stats.dump_stats(path)
+        return path, stats
+
+
+def summarize(stats, count=10):
+    """Top ``count`` functions by own time, one line each."""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+    lines = []
+    for (filename, line, func), (cc, nc, tt, ct, callers) in rows[:count]:
+        location = f"{os.path.basename(filename)}:{line}" if line else filename
+        lines.append(f"{tt * 1000:9.1f}ms own {ct * 1000:9.1f}ms cum {nc:>8} calls  {func} ({location})")
+    return lines
+
+
+profiler = Profiler(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from voxel_server.ipc import in_loop, publish, subscribe
+
+from .models import Operator
+from .operators import operator_cache
+
+
+@receiver(post_save, sender=Operator)
+@receiver(post_delete, sender=Operator)
+@in_loop
+def invalidate_operator_cache(sender, instance, **kwargs):
+    operator_cache.invalidate()
+    publish("operators_changed")
+
+
+@subscribe("operators_changed")
+def forget_remote_operators(payload):
+    operator_cache.invalidate()
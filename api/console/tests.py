@@ -1,3 +1,165 @@
-from django.test import TestCase
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from .logbuffer import LogBuffer
+from .models import Operator
+from .operators import OperatorCache, operator_cache
+from .profiler import Profiler, summarize
+
+
+class OperatorCacheTests(TestCase):
+    def setUp(self):
+        operator_cache.invalidate()
+
+    async def test_operator_changes_are_seen(self):
+        self.assertFalse(await operator_cache.is_operator("alice"))
+        operator = await Operator.objects.acreate(username="alice")
+        await asyncio.sleep(0)  # receivers hand the invalidation to the event loop
+        self.assertTrue(await operator_cache.is_operator("alice"))
+
+        await operator.adelete()
+        await asyncio.sleep(0)
+        self.assertFalse(await operator_cache.is_operator("alice"))
+
+    async def test_invalidation_during_load_is_not_lost(self):
+        cache = OperatorCache()
+        loads = [["alice"], []]
+
+        async def rows():
+            usernames = loads.pop(0)
+            for name in usernames:
+                # alice is de-opped while the first load is running
+                cache.invalidate()
+                yield name
+
+        with mock.patch.object(Operator.objects, "values_list", lambda *args, **kwargs: rows()):
+            self.assertFalse(await cache.is_operator("alice"))
+        self.assertEqual(loads, [])
+
+
+def busy_work():
+    return sum(i * i for i in range(2000))
+
+
+class ProfilerTests(SimpleTestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_dir.cleanup)
+        self.profiler = Profiler(os.path.join(self.output_dir.name, "profiles"))
+        self.addCleanup(self.profiler.stop)
+
+    def test_start_and_stop(self):
+        self.assertIsNone(self.profiler.snapshot())
+        self.assertTrue(self.profiler.start())
+        self.assertFalse(self.profiler.start())
+        self.assertTrue(self.profiler.running)
+        self.assertTrue(self.profiler.stop())
+        self.assertFalse(self.profiler.stop())
+        self.assertFalse(self.profiler.running)
+
+    def test_failed_enable_leaves_profiler_stopped(self):
+        with mock.patch.object(cProfile.Profile, "enable", side_effect=ValueError("already active")):
+            with self.assertRaises(ValueError):
+                self.profiler.start()
+        self.assertFalse(self.profiler.running)
+        self.assertFalse(self.profiler.stop())
+        self.assertTrue(self.profiler.start())
+
+    def test_snapshot_keeps_running_session(self):
+        self.profiler.start()
+        busy_work()
+        stats = self.profiler.snapshot()
+        self.assertIn("busy_work", [func for filename, line, func in stats.stats])
+        self.assertTrue(self.profiler.running)
+
+        self.profiler.stop()
+        stats = self.profiler.snapshot()
+        self.assertIn("busy_work", [func for filename, line, func in stats.stats])
+
+    def test_dump_writes_stats_file(self):
+        self.assertEqual(self.profiler.dump(), (None, None))
+        self.profiler.start()
+        busy_work()
+        self.profiler.stop()
+
+        path, stats = self.profiler.dump()
+        self.assertEqual(os.path.dirname(path), self.profiler.output_dir)
+        loaded = pstats.Stats(path)
+        self.assertEqual(set(loaded.stats), set(stats.stats))
+
+    def test_summarize_orders_by_own_time(self):
+        stats = mock.Mock(stats={
+            ("/srv/a.py", 3, "slow"): (1, 2, 0.5, 0.6, {}),
+            ("/srv/b.py", 7, "fast"): (1, 1, 0.001, 0.9, {}),
+            ("~", 0, "<built-in method len>"): (5, 5, 0.01, 0.01, {}),
+        })
+        lines = summarize(stats, count=2)
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith("slow (a.py:3)"))
+        self.assertIn("500.0ms own", lines[0])
+        self.assertTrue(lines[1].endswith("<built-in method len> (~)"))
+
+
+class LogBufferTests(SimpleTestCase):
+    def setUp(self):
+        self.buffer = LogBuffer("console", size=3, flush_interval=0.01)
+        self.layer = mock.Mock(group_send=mock.AsyncMock())
+        patcher = mock.patch("console.logbuffer.publish")
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def entries(self, text):
+        return [(entry["level"], entry["message"]) for entry in json.loads(text)["entries"]]
+
+    async def test_lines_are_sent_in_one_batch(self):
+        self.buffer.append(self.layer, "hello", "chat")
+        self.buffer.append(self.layer, "alice joined")
+        self.buffer.append(self.layer, "bad command", "error")
+        await self.buffer._task
+
+        self.layer.group_send.assert_awaited_once()
+        group, event = self.layer.group_send.await_args.args
+        self.assertEqual(group, "console")
+        frames = event["frames"]
+        self.assertEqual(
+            self.entries(frames["chat"]),
+            [("chat", "hello"), ("info", "alice joined"), ("error", "bad command")],
+        )
+        self.assertEqual(self.entries(frames["info"]), [("info", "alice joined"), ("error", "bad command")])
+        self.assertEqual(self.entries(frames["error"]), [("error", "bad command")])
+        self.publish.assert_called_once_with("console_log", [
+            {"message": "hello", "level": "chat"},
+            {"message": "alice joined", "level": "info"},
+            {"message": "bad command", "level": "error"},
+        ])
+        self.assertFalse(self.buffer.pending)
+
+    async def test_levels_without_lines_are_skipped(self):
+        self.buffer.append(self.layer, "hello", "chat")
+        await self.buffer._task
+        self.assertEqual(list(self.layer.group_send.await_args.args[1]["frames"]), ["chat"])
+
+    async def test_unknown_levels_are_shown_as_info(self):
+        self.buffer.append(self.layer, "done", "success")
+        await self.buffer._task
+        frames = self.layer.group_send.await_args.args[1]["frames"]
+        self.assertEqual(self.entries(frames["info"]), [("info", "done")])
+
+    async def test_history_is_bounded_and_filtered(self):
+        self.assertIsNone(self.buffer.backlog("chat"))
+        for n in range(4):
+            self.buffer.append(self.layer, f"line {n}", "error" if n == 1 else "chat")
+        await self.buffer._task
+
+        self.assertEqual(
+            self.entries(self.buffer.backlog("chat")),
+            [("error", "line 1"), ("chat", "line 2"), ("chat", "line 3")],
+        )
+        self.assertEqual(self.entries(self.buffer.backlog("error")), [("error", "line 1")])
@@ -1,6 +1,17 @@
+import atexit
+
 from django.apps import AppConfig
 
 
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .clock import world_clock
+        from .minimap import minimap_cache
+
+        # Daphne has no lifespan events, but exits normally on SIGTERM/SIGINT
+        atexit.register(minimap_cache.flush)
+        atexit.register(world_clock.save)
@@ -0,0 +1,161 @@
+"""Compressed world archives for export_world/import_world.
+
+An archive is a sequence of independently zlib-compressed frames::
+
+    MAGIC
+    frame*       kind (1 byte) | length (u32) | zlib(payload)
+    index frame  packed (x, z, offset) of every chunk frame, sorted
+    trailer      offset of the index frame (u64) | MAGIC
+
+Frames are written and read one at a time, so neither side holds more
+than a bounded window of the world in memory. The index lets a reader
+seek straight to one chunk without scanning the file.
+"""
+import json
+import struct
+import zlib
+from bisect import bisect_left
+from collections import deque
+from itertools import islice
+
+MAGIC = b"VXWA\x01"
+
+WORLD = b"W"
+CHUNK = b"C"
+PLAYERS = b"P"
+INDEX = b"I"
+
+PLAYER_FIELDS = (
+    "username", "x", "y", "z", "rotation_x", "rotation_y", "inventory", "gamemode", "health",
+)
+
+_FRAME = struct.Struct("<cI")
+_CHUNK_KEY = struct.Struct("<ii")
+_INDEX_ENTRY = struct.Struct("<iiQ")
+_TRAILER = struct.Struct("<Q")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def encode_chunk(x, z, modifications, level=6):
+    return zlib.compress(_CHUNK_KEY.pack(x, z) + dumps(modifications), level)
+
+
+def decode_chunk(data):
+    raw = zlib.decompress(data)
+    x, z = _CHUNK_KEY.unpack_from(raw)
+    return x, z, json.loads(raw[_CHUNK_KEY.size:])
+
+
+def encode_json(value, level=6):
+    return zlib.compress(dumps(value), level)
+
+
+def decode_json(data):
+    return json.loads(zlib.decompress(data))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def bounded_map(pool, func, iterable, window):
+    """Ordered pool.map() that keeps at most ``window`` items in flight."""
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ArchiveWriter:
+    """Appends already-compressed frames and builds the chunk index."""
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.offset = 0
+        self.index = []
+        self._write(MAGIC)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.offset += len(data)
+
+    def write(self, kind, payload, key=None):
+        if key is not None:
+            self.index.append((key[0], key[1], self.offset))
+        self._write(_FRAME.pack(kind, len(payload)))
+        self._write(payload)
+
+    def close(self):
+        self.index.sort()
+        index_offset = self.offset
+        packed = b"".join(_INDEX_ENTRY.pack(*entry) for entry in self.index)
+        self.write(INDEX, zlib.compress(packed))
+        self._write(_TRAILER.pack(index_offset) + MAGIC)
+
+
+class ArchiveReader:
+    """Sequential and indexed access to an archive file."""
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ArchiveError("Not a world archive")
+        self._index = None
+
+    def frames(self, kinds=None):
+        """Yield (kind, compressed payload) in file order, up to the index.
+
+        With ``kinds``, frames of other kinds are skipped without being read.
+        """
+        self.file.seek(len(MAGIC))
+        while True:
+            header = self.file.read(_FRAME.size)
+            if len(header) < _FRAME.size:
+                raise ArchiveError("Truncated archive")
+            kind, length = _FRAME.unpack(header)
+            if kind == INDEX:
+                return
+            if kinds is not None and kind not in kinds:
+                self.file.seek(length, 1)
+                continue
+            payload = self.file.read(length)
+            if len(payload) < length:
+                raise ArchiveError("Truncated archive")
+            yield kind, payload
+
+    def _read_frame_at(self, offset):
+        self.file.seek(offset)
+        kind, length = _FRAME.unpack(self.file.read(_FRAME.size))
+        return kind, self.file.read(length)
+
+    def index(self):
+        if self._index is None:
+            self.file.seek(-(_TRAILER.size + len(MAGIC)), 2)
+            trailer = self.file.read(_TRAILER.size + len(MAGIC))
+            if trailer[_TRAILER.size:] != MAGIC:
+                raise ArchiveError("Missing archive index")
+            kind, payload = self._read_frame_at(_TRAILER.unpack_from(trailer)[0])
+            packed = zlib.decompress(payload)
+            self._index = list(_INDEX_ENTRY.iter_unpack(packed))
+        return self._index
+
+    def chunk(self, x, z):
+        """Modifications of one chunk, or None if the archive has no such chunk."""
+        index = self.index()
+        i = bisect_left(index, (x, z, 0))
+        if i == len(index) or index[i][:2] != (x, z):
+            return None
+        kind, payload = self._read_frame_at(index[i][2])
+        return decode_chunk(payload)[2]
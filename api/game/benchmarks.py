@@ -0,0 +1,354 @@
+"""Microbenchmarks for the storage and serialization hot paths.
+
+Each benchmark is an async callable built by a fixture that first
+creates the synthetic data it needs. They run against the test database
+(see the ``benchmark`` management command), never the real world.
+"""
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from fnmatch import fnmatch
+from functools import partial
+
+from channels.db import database_sync_to_async
+
+from console.models import Operator
+
+from .cache import player_cache
+from .consumers import GameConsumer
+from .frames import WorldDataFrame
+from .models import World, Chunk, Player
+from .store import CHUNK_SIZE, WORLD_NAME, world_store
+from .terrain import CHUNK_HEIGHT
+
+BLOCKS_PER_CHUNK = 4096
+PLAYER_COUNT = 100
+WORLD_SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+benchmarks = {}
+
+
+def benchmark(name):
+    def register(fixture):
+        benchmarks[name] = fixture
+        return fixture
+    return register
+
+
+def reset_caches():
+    world_store.world = None
+    world_store.chunks.clear()
+    player_cache.clear()
+
+
+async def make_world(blocks, seed=1):
+    """A world with ``blocks`` modifications spread over full chunks."""
+    await Chunk.objects.all().adelete()
+    await World.objects.all().adelete()
+    reset_caches()
+    rng = random.Random(seed)
+    world = await World.objects.acreate(name=WORLD_NAME, seed=seed)
+
+    chunks = []
+    side = max(1, round((blocks / BLOCKS_PER_CHUNK) ** 0.5))
+    for n in range(0, blocks, BLOCKS_PER_CHUNK):
+        cx, cz = divmod(n // BLOCKS_PER_CHUNK, side)
+        modifications = {}
+        while len(modifications) < min(BLOCKS_PER_CHUNK, blocks - n):
+            x = cx * CHUNK_SIZE + rng.randrange(CHUNK_SIZE)
+            z = cz * CHUNK_SIZE + rng.randrange(CHUNK_SIZE)
+            modifications[f"{x},{rng.randrange(CHUNK_HEIGHT)},{z}"] = rng.randrange(1, 20)
+        chunks.append(Chunk(world=world, x=cx, z=cz, modifications=modifications))
+    await Chunk.objects.abulk_create(chunks, batch_size=64)
+    return world
+
+
+async def make_players(count=PLAYER_COUNT, seed=1):
+    await Player.objects.all().adelete()
+    reset_caches()
+    rng = random.Random(seed)
+    players = [
+        Player(username=f"player{n}", x=rng.uniform(-500, 500), y=rng.uniform(60, 90),
+               z=rng.uniform(-500, 500), inventory=[{"id": rng.randrange(1, 20), "count": 64}] * 9)
+        for n in range(count)
+    ]
+    await Player.objects.abulk_create(players)
+    return players
+
+
+def player_state(player):
+    return {
+        "id": f"specific.{player.username}",
+        "username": player.username,
+        "position": {"x": player.x, "y": player.y, "z": player.z},
+        "rotation": {"x": player.rotation_x, "y": player.rotation_y, "z": 0},
+        "inventory": player.inventory,
+        "gamemode": player.gamemode,
+        "health": player.health,
+    }
+
+
+@benchmark("save_block_update")
+async def save_block_update():
+    await make_world(BLOCKS_PER_CHUNK)
+    consumer = GameConsumer()
+    rng = random.Random(1)
+    # The chunk row is loaded by the first call, as it is on a live server
+    await consumer.save_block_update({"x": 0, "y": 0, "z": 0}, 1)
+
+    async def run():
+        position = {"x": rng.randrange(CHUNK_SIZE), "y": rng.randrange(CHUNK_HEIGHT), "z": rng.randrange(CHUNK_SIZE)}
+        await consumer.save_block_update(position, rng.randrange(20))
+    return run
+
+
+async def get_world_data(size):
+    await make_world(size)
+
+    async def run():
+        # A join with nothing cached yet
+        await WorldDataFrame().get()
+    return run
+
+
+async def rebuild_world_data(size):
+    await make_world(size)
+    frame = WorldDataFrame()
+    await frame.get()
+    rng = random.Random(1)
+
+    async def run():
+        # A join after one block edit
+        position = {"x": rng.randrange(CHUNK_SIZE), "y": rng.randrange(CHUNK_HEIGHT), "z": rng.randrange(CHUNK_SIZE)}
+        await world_store.set_block(position, rng.randrange(20))
+        frame.blocks_changed([(position["x"], position["y"], position["z"])])
+        await frame.get()
+    return run
+
+
+@benchmark("save_player_state")
+async def save_player_state():
+    players = await make_players()
+    for player in players:
+        player_cache.set(player)
+    consumer = GameConsumer()
+    states = [player_state(player) for player in players]
+    rng = random.Random(1)
+
+    async def run():
+        # A moved player, so the row is actually written
+        state = rng.choice(states)
+        state["position"]["x"] += 1
+        await consumer.save_player_state(state)
+    return run
+
+
+async def get_player(cached):
+    players = await make_players()
+    consumer = GameConsumer()
+    usernames = [player.username for player in players]
+    rng = random.Random(1)
+
+    async def run():
+        # The player lookup of a join; cold is a first join, cached a reconnect
+        if not cached:
+            player_cache.clear()
+        await consumer.get_or_create_player(rng.choice(usernames))
+    return run
+
+
+benchmark("get_player[cold]")(partial(get_player, False))
+benchmark("get_player[cached]")(partial(get_player, True))
+
+
+# The same queries through the async ORM and through database_sync_to_async,
+# which the consumers used before: the difference is the cost of the hop
+
+
+def is_operator(username):
+    return Operator.objects.filter(username=username).exists()
+
+
+async def ais_operator(username):
+    return await Operator.objects.filter(username=username).aexists()
+
+
+def save_player_row(state):
+    player = Player.objects.get(username=state["username"])
+    player.x = state["position"]["x"]
+    player.save(update_fields=["x"])
+
+
+async def asave_player_row(state):
+    player = await Player.objects.aget(username=state["username"])
+    player.x = state["position"]["x"]
+    await player.asave(update_fields=["x"])
+
+
+def save_block_row(position, block):
+    world, created = World.objects.get_or_create(name=WORLD_NAME)
+    chunk, created = Chunk.objects.get_or_create(
+        world=world, x=position["x"] // CHUNK_SIZE, z=position["z"] // CHUNK_SIZE
+    )
+    chunk.modifications[f"{position['x']},{position['y']},{position['z']}"] = block
+    chunk.save(update_fields=["modifications"])
+
+
+async def asave_block_row(position, block):
+    world, created = await World.objects.aget_or_create(name=WORLD_NAME)
+    chunk, created = await Chunk.objects.aget_or_create(
+        world=world, x=position["x"] // CHUNK_SIZE, z=position["z"] // CHUNK_SIZE
+    )
+    chunk.modifications[f"{position['x']},{position['y']},{position['z']}"] = block
+    await chunk.asave(update_fields=["modifications"])
+
+
+async def orm_is_operator(query):
+    await Operator.objects.all().adelete()
+    await Operator.objects.abulk_create([Operator(username=f"player{n}") for n in range(0, PLAYER_COUNT, 2)])
+    rng = random.Random(1)
+
+    async def run():
+        await query(f"player{rng.randrange(PLAYER_COUNT)}")
+    return run
+
+
+async def orm_save_player_state(query):
+    states = [player_state(player) for player in await make_players()]
+    rng = random.Random(1)
+
+    async def run():
+        state = rng.choice(states)
+        state["position"]["x"] += 1
+        await query(state)
+    return run
+
+
+async def orm_save_block_update(query):
+    await make_world(BLOCKS_PER_CHUNK)
+    rng = random.Random(1)
+
+    async def run():
+        position = {"x": rng.randrange(CHUNK_SIZE), "y": rng.randrange(CHUNK_HEIGHT), "z": rng.randrange(CHUNK_SIZE)}
+        await query(position, rng.randrange(20))
+    return run
+
+
+for name, fixture, sync_query, async_query in [
+    ("is_operator", orm_is_operator, is_operator, ais_operator),
+    ("save_player_state", orm_save_player_state, save_player_row, asave_player_row),
+    ("save_block_update", orm_save_block_update, save_block_row, asave_block_row),
+]:
+    benchmark(f"orm_{name}[sync_to_async]")(partial(fixture, database_sync_to_async(sync_query)))
+    benchmark(f"orm_{name}[async]")(partial(fixture, async_query))
+
+
+async def world_data(size):
+    await make_world(size)
+    text, compressed = await WorldDataFrame().get()
+    return json.loads(text)
+
+
+async def players_list_frame():
+    players = await make_players()
+    return {"type": "players_list", "players": [player_state(player) for player in players]}
+
+
+async def encode_world_data(size):
+    frame = await world_data(size)
+
+    async def run():
+        json.dumps(frame)
+    return run
+
+
+async def decode_world_data(size):
+    text = json.dumps(await world_data(size))
+
+    async def run():
+        json.loads(text)
+    return run
+
+
+@benchmark("encode_players_list")
+async def encode_players_list():
+    frame = await players_list_frame()
+
+    async def run():
+        json.dumps(frame)
+    return run
+
+
+@benchmark("decode_players_list")
+async def decode_players_list():
+    text = json.dumps(await players_list_frame())
+
+    async def run():
+        json.loads(text)
+    return run
+
+
+for label, size in WORLD_SIZES.items():
+    benchmark(f"get_world_data[{label}]")(partial(get_world_data, size))
+    benchmark(f"rebuild_world_data[{label}]")(partial(rebuild_world_data, size))
+    benchmark(f"encode_world_data[{label}]")(partial(encode_world_data, size))
+    benchmark(f"decode_world_data[{label}]")(partial(decode_world_data, size))
+
+
+async def measure(run, min_time=1.0, min_ops=3, repeat=5):
+    """Return (ops/s, peak bytes) of an async callable.
+
+    The rate is the median of ``repeat`` timing passes sharing ``min_time``,
+    so one pass disturbed by a GC cycle or a busy machine does not skew it.
+    Timing and memory are measured in separate passes because tracemalloc
+    slows allocation-heavy code several times over.
+    """
+    await run()  # warm up caches and connections
+
+    rates = []
+    for _ in range(repeat):
+        ops = 0
+        start = time.perf_counter()
+        while ops < min_ops or time.perf_counter() - start < min_time / repeat:
+            await run()
+            ops += 1
+        rates.append(ops / (time.perf_counter() - start))
+    rate = statistics.median(rates)
+
+    tracemalloc.start()
+    try:
+        await run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return rate, peak
+
+
+def select(patterns):
+    """Names of the benchmarks to run, in registration order.
+
+    A pattern that is the exact name of a benchmark selects only it, so
+    names with brackets work; anything else is matched as a glob.
+    """
+    if not patterns:
+        return list(benchmarks)
+    return [
+        name for name in benchmarks
+        if name in patterns or any(pattern not in benchmarks and fnmatch(name, pattern) for pattern in patterns)
+    ]
+
+
+async def run_benchmarks(names, min_time=1.0, report=None, repeat=5):
+    results = {}
+    for name in names:
+        run = await benchmarks[name]()
+        rate, peak = await measure(run, min_time, repeat=repeat)
+        results[name] = {"ops": rate, "peak": peak}
+        if report is not None:
+            report(name, results[name])
+        # Free the fixture's data before building the next one
+        del run
+        reset_caches()
+    return results
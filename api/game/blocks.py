@@ -0,0 +1,40 @@
+# Block ids shared with the client (src/World/Block.js BlockType).
+# Only the ids the server needs to reason about are listed here.
+
+AIR = 0
+STONE = 1
+DIRT = 2
+GRASS = 3
+BEDROCK = 4
+SAND = 7
+WATER = 8
+SNOW = 11
+MYCELIUM = 14
+MAGMA = 16
+TALL_GRASS = 25
+MAGIC_WATER = 36
+DEEPSLATE = 48
+TORCH = 100
+GRAVEL = 109
+CLAY = 110
+LAVA = 180
+LADDER = 198
+WHEAT_STAGE_0 = 207
+BEETROOT_STAGE_3 = 226
+OAK_DOOR_BOTTOM_OPEN = 266
+IRON_DOOR_TOP_OPEN = 271
+TORCH_WALL_NORTH = 272
+TORCH_WALL_WEST = 275
+
+# Blocks players can walk through (Block.js isSolid() is false for them):
+# liquids, plants, torches, ladders, crops and open doors
+NON_SOLID = frozenset([
+    AIR, WATER, MAGIC_WATER, LAVA, TALL_GRASS, TORCH, LADDER,
+    *range(WHEAT_STAGE_0, BEETROOT_STAGE_3 + 1),
+    *range(OAK_DOOR_BOTTOM_OPEN, IRON_DOOR_TOP_OPEN + 1),
+    *range(TORCH_WALL_NORTH, TORCH_WALL_WEST + 1),
+])
+
+
+def is_solid(block):
+    return block not in NON_SOLID
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class PlayerCache:
+    """Bounded LRU cache of Player rows keyed by username.
+
+    Entries expire after ``ttl`` seconds so a player who has been away for a
+    while is reloaded from the database instead of from a stale copy.
+    """
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, username):
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+
+        player, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[username]
+            return None
+
+        self._entries.move_to_end(username)
+        return player
+
+    def set(self, player):
+        self._entries[player.username] = (player, time.monotonic() + self.ttl)
+        self._entries.move_to_end(player.username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+player_cache = PlayerCache(
+    max_size=getattr(settings, 'PLAYER_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'PLAYER_CACHE_TTL', 600),
+)
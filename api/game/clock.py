@@ -0,0 +1,159 @@
+"""Server-side world clock.
+
+The time of day is not ticked: it is an anchor (a time and the
+monotonic instant it was set) plus a rate, so reading it is a
+multiplication and nothing runs per tick. Clients get the same
+anchor-and-rate pair in a ``time_sync`` message on join, on /time set
+and every few minutes, and advance their own copy in between.
+
+With several worker processes the leader (see voxel_server.ipc) owns
+the clock: it shares its anchor with the other workers, saves the time
+and sends the periodic syncs. /time set saves at once, and the leader
+saves once more when the process exits. Anchors are comparable between processes
+because time.monotonic() is system-wide on Linux.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from voxel_server.ipc import is_leader, publish, shared_dict, subscribe
+
+from .models import World
+from .store import world_store
+
+TICKS_PER_DAY = 24000
+NIGHT_START = 12000
+
+logger = logging.getLogger(__name__)
+
+shared_anchor = shared_dict("world_clock")
+
+
+class WorldClock:
+    """World time in ticks (0-24000, 6000 is noon), advancing ``rate`` ticks per second.
+
+    The running task saves the time every ``persist_interval`` seconds and
+    resyncs clients every ``sync_interval`` seconds; ``save`` is the
+    blocking write used at exit.
+    """
+
+    def __init__(self, rate=20, persist_interval=60, sync_interval=300):
+        self.rate = rate
+        self.persist_interval = persist_interval
+        self.sync_interval = sync_interval
+        self.anchor = 6000
+        self.anchor_at = time.monotonic()
+        self.loaded = False
+        self._database = None
+        self._task = None
+
+    def now(self):
+        return (self.anchor + (time.monotonic() - self.anchor_at) * self.rate) % TICKS_PER_DAY
+
+    def is_night(self):
+        return self.now() >= NIGHT_START
+
+    def set(self, value):
+        self.anchor = value % TICKS_PER_DAY
+        self.anchor_at = time.monotonic()
+        if self.loaded:
+            self.share()
+
+    def share(self):
+        if is_leader():
+            shared_anchor["anchor"] = [self.anchor, self.anchor_at]
+        else:
+            publish("world_clock", [self.anchor, self.anchor_at])
+
+    def adopt(self, anchor):
+        self.anchor, self.anchor_at = anchor
+        self.loaded = True
+
+    async def load(self):
+        """Resume from the saved time (or the leader's clock), once per process."""
+        if not self.loaded:
+            world = await world_store.get_world()
+            self.set(world.time)
+            self.loaded = True
+            self._database = connection.settings_dict["NAME"]
+            if is_leader():
+                self.share()
+
+    def sync_message(self):
+        return json.dumps({"type": "time_sync", "time": round(self.now(), 1), "rate": self.rate})
+
+    async def broadcast(self, channel_layer):
+        await channel_layer.group_send("game_world", {"type": "time_sync", "text": self.sync_message()})
+
+    async def persist(self):
+        world = await world_store.get_world()
+        world.time = int(self.now())
+        # update() rather than save(): the join frames need not be rebuilt for this
+        await World.objects.filter(pk=world.pk).aupdate(time=world.time)
+
+    def save(self):
+        """Write the time from outside the event loop, e.g. at exit."""
+        world = world_store.world
+        # Not if the database it was read from is gone (the test database)
+        if not self.loaded or world is None or not is_leader():
+            return
+        if connection.settings_dict["NAME"] != self._database:
+            return
+        world.time = int(self.now())
+        World.objects.filter(pk=world.pk).update(time=world.time)
+
+    def start(self, channel_layer):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(channel_layer))
+
+    async def _run(self, channel_layer):
+        await self.load()
+        loop = asyncio.get_running_loop()
+        next_persist = loop.time() + self.persist_interval
+        next_sync = loop.time() + self.sync_interval
+        while True:
+            await asyncio.sleep(max(0.0, min(next_persist, next_sync) - loop.time()))
+            due_persist = loop.time() >= next_persist
+            if due_persist:
+                next_persist += self.persist_interval
+            due_sync = loop.time() >= next_sync
+            if due_sync:
+                next_sync += self.sync_interval
+            if not is_leader():
+                continue
+            try:
+                if "anchor" not in shared_anchor.owned:
+                    # Became the leader since the last round
+                    self.share()
+                if due_persist:
+                    await self.persist()
+                if due_sync:
+                    await self.broadcast(channel_layer)
+            except Exception:
+                logger.exception("World clock update failed")
+
+
+world_clock = WorldClock(
+    rate=getattr(settings, 'WORLD_TIME_RATE', 20),
+    persist_interval=getattr(settings, 'WORLD_TIME_PERSIST_INTERVAL', 60),
+    sync_interval=getattr(settings, 'WORLD_TIME_SYNC_INTERVAL', 300),
+)
+
+
+@shared_anchor.on_change
+def leader_anchor_changed(key):
+    anchor = shared_anchor.get("anchor")
+    if anchor is not None and key not in shared_anchor.owned:
+        world_clock.adopt(anchor)
+
+
+@subscribe("world_clock")
+def remote_clock_set(anchor):
+    # /time set on another worker
+    if is_leader():
+        world_clock.adopt(anchor)
+        world_clock.share()
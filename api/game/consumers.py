@@ -1,16 +1,49 @@
+import asyncio
 import json
+import logging
+import math
+import time
+from django.conf import settings
+from django.utils import timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from .models import World, Chunk, Player
+from voxel_server.ipc import publish
+from .cache import player_cache
+from .clock import world_clock
+from .entities import entity_simulation
+from .frames import players_list_frame, world_data_frame
+from .minimap import MAX_LEVEL, encode_tile, minimap_cache, tile_span
+from .models import Player
+from .occupancy import MovementValidator, nearby_chunks, occupancy_index, parse_position
+from .presence import players
+from .store import world_store
+from .throttle import InboundLimiter, inbound_stats, peek_type
 
-CHUNK_SIZE = 16
+MAX_TILES_PER_REQUEST = 64  # Minimap.js sends at most as many
+MAP_TILE_RADIUS = getattr(settings, 'MINIMAP_TILE_RADIUS', 384)  # blocks around the player
+MAX_HIT_DAMAGE = 20
+DEFAULT_SPAWN = (0.0, 80.0, 0.0)  # Player.js spawnPoint
+MAX_SPAWN_DISTANCE = 8  # a bed is used from within the player's reach
+UPDATE_TICK = getattr(settings, 'GAME_UPDATE_TICK', 0.04)  # seconds; newer updates replace queued ones
+
+logger = logging.getLogger(__name__)
 
 class GameConsumer(AsyncWebsocketConsumer):
-    players = {}
+    # Shared with the other worker processes, if any
+    players = players
 
     async def connect(self):
         self.room_name = "world"
         self.room_group_name = "game_world"
+        self.limiter = InboundLimiter(
+            total=getattr(settings, 'GAME_MESSAGE_RATE', (200, 100)),
+            rates=getattr(settings, 'GAME_MESSAGE_RATES', {}),
+            default=getattr(settings, 'GAME_MESSAGE_DEFAULT_RATE', (10, 5)),
+            max_bytes=getattr(settings, 'GAME_MAX_MESSAGE_BYTES', 65536),
+        )
+        self.pending_update = None
+        self.update_task = None
+        self.last_update_at = 0.0
+        self.spawn_point = DEFAULT_SPAWN
 
         # Join room group
         await self.channel_layer.group_add(
@@ -21,6 +54,9 @@ class GameConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        if self.update_task is not None:
+            self.update_task.cancel()
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -33,7 +69,7 @@ class GameConsumer(AsyncWebsocketConsumer):
             await self.save_player_state(player_data)
             
             del self.players[self.channel_name]
-            
+
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -44,8 +80,18 @@ class GameConsumer(AsyncWebsocketConsumer):
 
     # Receive message from WebSocket
     async def receive(self, text_data):
+        # Floods are dropped before paying for json.loads when the type can be read off the frame
+        message_type = peek_type(text_data)
+        if not self.limiter.allow_frame(text_data):
+            return
+        if message_type is not None and not self.limiter.allow_type(message_type):
+            return
+
         data = json.loads(text_data)
-        message_type = data.get("type")
+        if message_type is None:
+            message_type = data.get("type")
+            if not self.limiter.allow_type(message_type):
+                return
 
         if message_type == "join":
             username = data.get("username", "Anonymous")
@@ -62,6 +108,14 @@ class GameConsumer(AsyncWebsocketConsumer):
                 "gamemode": player_obj.gamemode,
                 "health": player_obj.health
             }
+            # Clients that can inflate get the large join frames pre-compressed
+            self.compress_frames = data.get("compression") == "deflate"
+
+            position = (player_obj.x, player_obj.y, player_obj.z)
+            self.movement = MovementValidator(
+                occupancy_index, position, getattr(settings, 'MOVE_MAX_SPEED', 80), time.monotonic()
+            )
+            await occupancy_index.load(nearby_chunks(position))
 
             # Send player init data (ID and saved position)
             await self.send(text_data=json.dumps({
@@ -74,23 +128,11 @@ class GameConsumer(AsyncWebsocketConsumer):
                 "health": self.players[self.channel_name]["health"]
             }))
             
-            # Get world data
-            world_data = await self.get_world_data()
-            
-            # Send world data (Seed & Modifications & Time)
-            await self.send(text_data=json.dumps({
-                "type": "world_data",
-                "seed": world_data['seed'],
-                "time": world_data['time'],
-                "motd": world_data['motd'],
-                "modifications": world_data['modifications']
-            }))
-            
-            # Send current players list to the new player
-            await self.send(text_data=json.dumps({
-                "type": "players_list",
-                "players": list(self.players.values())
-            }))
+            # Send world data (Seed & Modifications & Time) and the current players list
+            await self.send_frame(await world_data_frame.get())
+            await self.send_frame(await players_list_frame.get(self.players))
+            await world_clock.load()
+            await self.send(text_data=world_clock.sync_message())
             
             # Notify others
             await self.channel_layer.group_send(
@@ -103,26 +145,33 @@ class GameConsumer(AsyncWebsocketConsumer):
 
         elif message_type == "update":
             if self.channel_name in self.players:
-                self.players[self.channel_name]["position"] = data.get("position")
-                self.players[self.channel_name]["rotation"] = data.get("rotation")
-                
-                # Broadcast update to others
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "player_update",
-                        "id": self.channel_name,
-                        "position": data.get("position"),
-                        "rotation": data.get("rotation")
-                    }
-                )
+                await self.queue_update(data)
 
         elif message_type == "inventory_update":
             if self.channel_name in self.players:
                 self.players[self.channel_name]["inventory"] = data.get("inventory")
+                self.players.touch(self.channel_name)
                 # We don't necessarily need to broadcast this to everyone unless we want to show held items or equipment
                 # For now, just save it in the session state so it gets saved to DB on disconnect
         
+        elif message_type == "map_tiles":
+            await self.send_map_tiles(data)
+
+        elif message_type == "entity_hit":
+            self.hit_entity(data)
+
+        elif message_type == "entity_explode":
+            self.explode_entity(data)
+
+        elif message_type == "spawn_point":
+            if self.channel_name in self.players:
+                self.set_spawn_point(data)
+
+        elif message_type == "respawn":
+            # Moves from the death spot to the spawn point are not walked
+            if self.channel_name in self.players:
+                self.movement.resync(self.spawn_point)
+
         elif message_type == "block_update":
             position = data.get("position")
             block_type = data.get("blockType")
@@ -140,62 +189,185 @@ class GameConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+    async def queue_update(self, data):
+        # At most one update per tick is applied; a newer one replaces the queued one
+        now = time.monotonic()
+        if self.update_task is None and now - self.last_update_at >= UPDATE_TICK:
+            self.last_update_at = now
+            await self.apply_update(data)
+            return
+
+        if self.pending_update is not None:
+            inbound_stats["coalesced"] += 1
+        self.pending_update = data
+        if self.update_task is None:
+            self.update_task = asyncio.create_task(self.flush_updates())
+
+    async def flush_updates(self):
+        try:
+            while self.pending_update is not None:
+                await asyncio.sleep(max(0.0, self.last_update_at + UPDATE_TICK - time.monotonic()))
+                data, self.pending_update = self.pending_update, None
+                self.last_update_at = time.monotonic()
+                try:
+                    await self.apply_update(data)
+                except Exception:
+                    logger.exception("Update from %s failed", self.channel_name)
+        finally:
+            self.update_task = None
+
+    async def apply_update(self, data):
+        position = parse_position(data.get("position"))
+        if position is None or not await self.validate_move(position):
+            return
+
+        position = dict(zip("xyz", position))
+        self.players[self.channel_name]["position"] = position
+        self.players[self.channel_name]["rotation"] = data.get("rotation")
+        self.players.touch(self.channel_name)
+
+        # Broadcast update to others
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                "type": "player_update",
+                "id": self.channel_name,
+                "position": position,
+                "rotation": data.get("rotation")
+            }
+        )
+
+    async def send_frame(self, encoded):
+        text, compressed = encoded
+        if self.compress_frames:
+            await self.send(bytes_data=compressed)
+        else:
+            await self.send(text_data=text)
+
+    async def validate_move(self, position):
+        # Rejected moves are neither relayed nor saved
+        await occupancy_index.load(nearby_chunks(position))
+        failing = self.movement.candidate is not None
+        if self.movement.check(position, time.monotonic()):
+            return True
+        if not failing:
+            logger.warning(
+                "Rejected move of %s from %s to %s",
+                self.players[self.channel_name]["username"], self.movement.position, position,
+            )
+        return False
+
+    def set_spawn_point(self, data):
+        position = parse_position(data.get("position"))
+        if position is None or math.dist(position, self.movement.position) > MAX_SPAWN_DISTANCE:
+            return
+        self.spawn_point = position
+
+    async def send_map_tiles(self, data):
+        player = self.players.get(self.channel_name)
+        try:
+            level = min(max(int(data.get("level", 0)), 0), MAX_LEVEL)
+            requested = [(int(tx), int(tz)) for tx, tz in data.get("tiles", [])]
+            px, pz = float(player["position"]["x"]), float(player["position"]["z"])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        # Only tiles near the player; the client is told which were refused
+        # so it can ask again later
+        span = tile_span(level)
+        coords, refused = [], []
+        for tx, tz in requested:
+            near = (
+                tx * span - MAP_TILE_RADIUS <= px < (tx + 1) * span + MAP_TILE_RADIUS
+                and tz * span - MAP_TILE_RADIUS <= pz < (tz + 1) * span + MAP_TILE_RADIUS
+            )
+            if near and len(coords) < MAX_TILES_PER_REQUEST:
+                coords.append((tx, tz))
+            else:
+                refused.append([tx, tz])
+
+        tiles = await minimap_cache.get_tiles(level, coords)
+        await self.send(text_data=json.dumps({
+            "type": "map_tiles",
+            "level": level,
+            "tiles": [{"x": tx, "z": tz, "data": encode_tile(data)} for (tx, tz), data in tiles.items()],
+            "refused": refused,
+        }))
+
+    def entity_source(self):
+        """The joined player's position, or None."""
+        try:
+            position = self.players[self.channel_name]["position"]
+            return (float(position["x"]), float(position["y"]), float(position["z"]))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def hit_entity(self, data):
+        source = self.entity_source()
+        try:
+            entity_id = int(data.get("id"))
+            damage = min(max(float(data.get("damage", 1)), 0), MAX_HIT_DAMAGE)
+        except (TypeError, ValueError):
+            return
+        if source is not None:
+            entity_simulation.hit(entity_id, damage, source)
+
+    def explode_entity(self, data):
+        source = self.entity_source()
+        try:
+            entity_id = int(data.get("id"))
+        except (TypeError, ValueError):
+            return
+        if source is not None:
+            entity_simulation.explode(entity_id, source)
+
     # Database methods
-    @database_sync_to_async
-    def get_or_create_player(self, username):
-        player, created = Player.objects.get_or_create(username=username)
+    async def get_or_create_player(self, username):
+        # Quick reconnects are served from memory
+        player = player_cache.get(username)
+        if player is None:
+            player, created = await Player.objects.aget_or_create(username=username)
+            player_cache.set(player)
         return player
 
-    @database_sync_to_async
-    def save_player_state(self, player_data):
-        try:
-            player = Player.objects.get(username=player_data['username'])
-            player.x = player_data['position']['x']
-            player.y = player_data['position']['y']
-            player.z = player_data['position']['z']
-            player.rotation_x = player_data['rotation']['x']
-            player.rotation_y = player_data['rotation']['y']
-            if 'inventory' in player_data:
-                player.inventory = player_data['inventory']
-            player.gamemode = player_data.get('gamemode', 'survival')
-            player.health = player_data.get('health', 20)
-            player.save()
-        except Player.DoesNotExist:
-            pass
-
-    @database_sync_to_async
-    def get_world_data(self):
-        world, created = World.objects.get_or_create(name="World 1")
-        
-        # Aggregate all modifications from chunks
-        all_modifications = {}
-        for chunk in world.chunks.all():
-            all_modifications.update(chunk.modifications)
-            
-        return {
-            "seed": world.seed,
-            "time": world.time,
-            "motd": world.motd,
-            "modifications": all_modifications
+    async def save_player_state(self, player_data):
+        fields = {
+            "x": player_data['position']['x'],
+            "y": player_data['position']['y'],
+            "z": player_data['position']['z'],
+            "rotation_x": player_data['rotation']['x'],
+            "rotation_y": player_data['rotation']['y'],
+            "gamemode": player_data.get('gamemode', 'survival'),
+            "health": player_data.get('health', 20),
         }
+        if 'inventory' in player_data:
+            fields["inventory"] = player_data['inventory']
 
-    @database_sync_to_async
-    def save_block_update(self, position, block_type):
-        world, created = World.objects.get_or_create(name="World 1")
-        
-        # Calculate chunk coordinates
-        chunk_x = int(position['x']) // CHUNK_SIZE
-        chunk_z = int(position['z']) // CHUNK_SIZE
-        
-        chunk, created = Chunk.objects.get_or_create(
-            world=world,
-            x=chunk_x,
-            z=chunk_z
-        )
-        
-        key = f"{position['x']},{position['y']},{position['z']}"
-        chunk.modifications[key] = block_type
-        chunk.save()
+        player = player_cache.get(player_data['username'])
+        if player is None:
+            # update() bypasses auto_now, so stamp it explicitly
+            fields["last_seen"] = timezone.now()
+            await Player.objects.filter(username=player_data['username']).aupdate(**fields)
+            publish("player_changed", player_data['username'])
+            return
+
+        # Write through the cached row, skipping the query when nothing moved
+        changed = {name: value for name, value in fields.items() if getattr(player, name) != value}
+        if not changed:
+            return
+
+        changed["last_seen"] = timezone.now()
+        updated = await Player.objects.filter(pk=player.pk).aupdate(**changed)
+        publish("player_changed", player.username)
+        if updated:
+            for name, value in changed.items():
+                setattr(player, name, value)
+            player_cache.set(player)
+        else:
+            player_cache.invalidate(player.username)
+
+    async def save_block_update(self, position, block_type):
+        await world_store.set_block(position, block_type)
 
     # Handlers for group messages
     async def player_joined(self, event):
@@ -228,20 +400,37 @@ class GameConsumer(AsyncWebsocketConsumer):
             "blockType": event["blockType"]
         }))
 
+    async def entity_update(self, event):
+        # Already encoded once per recipient by the simulation
+        await self.send(text_data=event["text"])
+
+    async def region_update(self, event):
+        await self.send(text_data=event["text"])
+
+    async def time_sync(self, event):
+        await self.send(text_data=event["text"])
+
     async def gamemode_update(self, event):
         # Check if this update is for this player
         if self.players.get(self.channel_name, {}).get("username") == event["username"]:
             # Update local state
             self.players[self.channel_name]["gamemode"] = event["gamemode"]
+            self.players.touch(self.channel_name)
             
             await self.send(text_data=json.dumps({
                 "type": "gamemode_update",
                 "gamemode": event["gamemode"]
             }))
 
+    async def player_teleport(self, event):
+        # /tp from the player's console: the jump is not a move to validate
+        if self.players.get(self.channel_name, {}).get("username") == event["username"]:
+            self.movement.resync(tuple(event["position"]))
+
     async def health_update(self, event):
         if self.players.get(self.channel_name, {}).get("username") == event["username"]:
             self.players[self.channel_name]["health"] = event["health"]
+            self.players.touch(self.channel_name)
             
             await self.send(text_data=json.dumps({
                 "type": "health_update",
@@ -0,0 +1,481 @@
+"""Server-authoritative mob simulation.
+
+Every mob of the world lives in one ``EntityWorld``: a structure of arrays
+(positions, velocities, AI state, timers...) indexed by slot. A tick
+updates the whole population with NumPy operations, so the cost grows
+with array length, not with a Python loop per mob.
+
+``EntitySimulation`` drives the ticks from an asyncio task while players
+are connected and sends each player a batched frame with the mobs near
+them.
+"""
+import asyncio
+import json
+import logging
+import math
+
+import numpy as np
+from django.conf import settings
+
+from voxel_server.ipc import is_leader, publish, subscribe
+
+from channels.layers import get_channel_layer
+
+from . import blocks
+from .clock import world_clock
+from .occupancy import nearby_chunks, occupancy_index
+from .regions import start_job
+from .store import CHUNK_SIZE, chunk_coords, world_store
+from .terrain import Terrain
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('zombie', 'skeleton', 'creeper', 'pig', 'chicken')
+ZOMBIE, SKELETON, CREEPER, PIG, CHICKEN = range(len(KINDS))
+KIND_IDS = {name: kind for kind, name in enumerate(KINDS)}
+
+# Per-kind tables, indexed by kind id (values from src/Entities/*.js)
+MOVE_SPEED = np.array([2.3, 2.5, 2.0, 2.0, 2.0], dtype=np.float32)
+DETECTION_RANGE = np.array([40, 40, 20, 0, 0], dtype=np.float32)
+MAX_HEALTH = np.array([20, 20, 20, 10, 4], dtype=np.float32)
+HOSTILE = np.array([True, True, True, False, False])
+
+IDLE, WANDER, CHASE, FLEE = range(4)
+
+GRAVITY = 32.0
+DESPAWN_DISTANCE = 128
+SKELETON_KEEP_AWAY = 8
+MAX_HIT_DISTANCE = 6
+EXPLOSION_RADIUS = 3
+GROUND_SEARCH = 8  # blocks below a mob's feet looked at for ground per tick
+
+
+class EntityWorld:
+    """Structure-of-arrays storage and vectorized tick for all mobs."""
+
+    def __init__(self, capacity=256, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.count = 0  # high-water mark of used slots
+        self.next_id = 1
+        self.index_version = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        def grow(name, shape, dtype, fill=0):
+            array = np.full(shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:len(old)] = old
+            setattr(self, name, array)
+
+        grow('alive', capacity, bool, False)
+        grow('ids', capacity, np.int64)
+        grow('kind', capacity, np.int8)
+        grow('state', capacity, np.int8)
+        grow('position', (capacity, 3), np.float32)
+        grow('velocity', (capacity, 3), np.float32)
+        grow('heading', capacity, np.float32)
+        grow('timer', capacity, np.float32)
+        grow('health', capacity, np.float32)
+        grow('ground', capacity, np.float32)
+        grow('column', (capacity, 2), np.int64, np.iinfo(np.int64).min)
+        self.capacity = capacity
+
+    def __len__(self):
+        return int(self.alive[:self.count].sum())
+
+    def spawn(self, kinds, positions):
+        """Add mobs; ``kinds`` and ``positions`` are arrays of equal length."""
+        kinds = np.asarray(kinds, dtype=np.int8)
+        n = len(kinds)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+
+        free = np.flatnonzero(~self.alive[:self.count])[:n]
+        fresh = n - len(free)
+        if self.count + fresh > self.capacity:
+            self._allocate(max(self.capacity * 2, self.count + fresh))
+        slots = np.concatenate([free, np.arange(self.count, self.count + fresh)])
+        self.count += fresh
+
+        ids = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+
+        self.alive[slots] = True
+        self.ids[slots] = ids
+        self.kind[slots] = kinds
+        self.state[slots] = IDLE
+        self.position[slots] = positions
+        self.velocity[slots] = 0
+        self.heading[slots] = self.rng.uniform(0, 2 * np.pi, n)
+        self.timer[slots] = 0
+        self.health[slots] = MAX_HEALTH[kinds]
+        self.column[slots] = np.iinfo(np.int64).min
+        return ids
+
+    def despawn(self, slots):
+        self.alive[slots] = False
+        # Shrink the high-water mark so ticks skip trailing dead slots
+        live = np.flatnonzero(self.alive[:self.count])
+        self.count = int(live[-1]) + 1 if len(live) else 0
+
+    def slot_of(self, entity_id):
+        match = np.flatnonzero(self.alive[:self.count] & (self.ids[:self.count] == entity_id))
+        return int(match[0]) if len(match) else None
+
+    def damage(self, entity_id, amount, source=None):
+        """Apply damage to one mob. Returns True if it died."""
+        slot = self.slot_of(entity_id)
+        if slot is None:
+            return False
+
+        self.health[slot] -= amount
+        if self.health[slot] <= 0:
+            self.despawn([slot])
+            return True
+
+        if not HOSTILE[self.kind[slot]] and source is not None:
+            # Passive mobs run away from whoever hit them
+            away = self.position[slot] - np.asarray(source, dtype=np.float32)
+            self.heading[slot] = np.arctan2(away[0], away[2])
+            self.state[slot] = FLEE
+            self.timer[slot] = 3.0
+        return False
+
+    def chunks(self):
+        """Chunk coordinates the live mobs stand in."""
+        n = self.count
+        cells = np.floor(self.position[:n][self.alive[:n]][:, [0, 2]]).astype(np.int64) // CHUNK_SIZE
+        return [tuple(key) for key in np.unique(cells, axis=0).tolist()]
+
+    def tick(self, dt, players, index):
+        """Advance every mob by ``dt`` seconds.
+
+        ``players`` is an (P, 3) array of player positions and ``index`` the
+        occupancy index walls and ground are read from.
+        """
+        n = self.count
+        if n == 0:
+            return
+
+        alive = self.alive[:n]
+        kind = self.kind[:n]
+        state = self.state[:n]
+        pos = self.position[:n]
+        vel = self.velocity[:n]
+        heading = self.heading[:n]
+        timer = self.timer[:n]
+
+        if len(players):
+            # Nearest player for every mob, on the horizontal plane
+            delta = players[None, :, :] - pos[:, None, :]
+            dist_sq = delta[:, :, 0] ** 2 + delta[:, :, 2] ** 2
+            nearest = dist_sq.argmin(axis=1)
+            to_player = delta[np.arange(n), nearest]
+            player_dist = np.sqrt(dist_sq[np.arange(n), nearest])
+        else:
+            to_player = np.zeros((n, 3), dtype=np.float32)
+            player_dist = np.full(n, np.inf, dtype=np.float32)
+
+        speed = MOVE_SPEED[kind]
+        timer -= dt
+
+        # Hostiles chase the nearest player in range; others wander or flee
+        chasing = alive & HOSTILE[kind] & (player_dist < DETECTION_RANGE[kind])
+        fleeing = alive & (state == FLEE) & (timer > 0)
+        roaming = alive & ~chasing & ~fleeing
+
+        # Roaming mobs pick a new idle/walk decision when their timer runs out
+        rethink = roaming & (timer <= 0)
+        count = int(rethink.sum())
+        if count:
+            timer[rethink] = self.rng.uniform(2, 6, count)
+            walk = self.rng.random(count) < 0.5
+            state[rethink] = np.where(walk, WANDER, IDLE)
+            heading[rethink] = np.where(walk, self.rng.uniform(0, 2 * np.pi, count), heading[rethink])
+        state[roaming & ~rethink & (state == CHASE)] = IDLE
+        state[chasing] = CHASE
+
+        chase_heading = np.arctan2(to_player[:, 0], to_player[:, 2])
+        heading[:] = np.where(chasing, chase_heading, heading)
+
+        factor = np.select(
+            [
+                chasing & (kind == SKELETON) & (player_dist < SKELETON_KEEP_AWAY),
+                chasing,
+                fleeing,
+                roaming & (state == WANDER),
+            ],
+            [-0.6, 1.0, 1.5, 0.5],
+            0.0,
+        ).astype(np.float32)
+        vel[:, 0] = np.sin(heading) * speed * factor
+        vel[:, 2] = np.cos(heading) * speed * factor
+        vel[:, 1] -= GRAVITY * dt
+
+        before = pos.copy()
+        pos += vel * dt
+
+        # Walls and ground are only looked up again when a mob enters a new
+        # column, has no ground below yet, or blocks changed
+        column = np.floor(pos[:, [0, 2]]).astype(np.int64)
+        check = alive & (np.any(column != self.column[:n], axis=1) | ~np.isfinite(self.ground[:n]))
+        if index.version != self.index_version:
+            self.index_version = index.version
+            check = alive
+        if check.any():
+            self._collide(np.flatnonzero(check), before, index)
+
+        ground = self.ground[:n]
+        landed = pos[:, 1] <= ground
+        pos[:, 1] = np.where(landed, ground, pos[:, 1])
+        vel[:, 1] = np.where(landed, 0, vel[:, 1])
+
+        if len(players):
+            far = alive & (player_dist > DESPAWN_DISTANCE)
+        else:
+            far = alive
+        if far.any():
+            self.despawn(np.flatnonzero(far))
+
+    def _collide(self, slots, before, index):
+        pos = self.position
+        feet = np.floor(before[slots, 1]).astype(np.int64)
+        # Two blocks above the feet, down to GROUND_SEARCH blocks below them
+        ys = feet[:, None] + np.arange(2, -GROUND_SEARCH - 1, -1)
+        solid = index.is_solid(
+            np.repeat(pos[slots, 0], ys.shape[1]), ys.ravel(), np.repeat(pos[slots, 2], ys.shape[1]),
+        ).reshape(ys.shape)
+
+        # A one block step is climbed, anything taller (or under a low
+        # ceiling) is a wall: the mob stays put and wanderers turn around
+        blocked = solid[:, 1] | (solid[:, 2] & solid[:, 0])
+        if blocked.any():
+            stopped = slots[blocked]
+            pos[stopped, 0] = before[stopped, 0]
+            pos[stopped, 2] = before[stopped, 2]
+            turning = stopped[self.state[stopped] != CHASE]
+            self.heading[turning] += np.pi
+
+        slots, feet, below = slots[~blocked], feet[~blocked], solid[~blocked, 2:]
+        # Top of the first solid block from the feet down; none yet means falling
+        self.ground[slots] = np.where(below.any(axis=1), feet + 1 - below.argmax(axis=1), -np.inf)
+        self.column[slots] = np.floor(pos[slots][:, [0, 2]]).astype(np.int64)
+
+    def visible_from(self, position, radius):
+        """Slots of live mobs within ``radius`` blocks of ``position``."""
+        n = self.count
+        delta = self.position[:n] - np.asarray(position, dtype=np.float32)
+        near = (delta ** 2).sum(axis=1) < radius * radius
+        return np.flatnonzero(self.alive[:n] & near)
+
+    def encode(self, slots):
+        """Columnar, JSON-ready description of the given mobs."""
+        return {
+            "ids": self.ids[slots].tolist(),
+            "kinds": self.kind[slots].tolist(),
+            "pos": np.round(self.position[slots].astype(np.float64), 2).ravel().tolist(),
+            "rot": np.round(self.heading[slots].astype(np.float64), 2).tolist(),
+        }
+
+
+class EntitySimulation:
+    """Runs the EntityWorld tick loop and fans out per-player updates."""
+
+    def __init__(self, tick_rate=10, sync_every=2, view_distance=64,
+                 max_hostile=20, max_passive=10, max_entities=5000):
+        self.tick_rate = tick_rate
+        self.sync_every = sync_every
+        self.view_distance = view_distance
+        self.max_hostile = max_hostile
+        self.max_passive = max_passive
+        self.max_entities = max_entities
+        self.world = EntityWorld()
+        self.terrain = None
+        self._task = None
+        self._ticks = 0
+        self._showing = set()  # channels last sent a non-empty frame
+
+    def start(self, channel_layer, get_players):
+        """Start ticking if needed. ``get_players`` returns {channel: player}."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(channel_layer, get_players))
+
+    async def _run(self, channel_layer, get_players):
+        world = await world_store.get_world()
+        if self.terrain is None or self.terrain.seed != world.seed:
+            self.terrain = Terrain(world.seed)
+
+        dt = 1.0 / self.tick_rate
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            players = dict(get_players())
+            if not players:
+                break
+
+            # With several worker processes the mobs live in one of them
+            if is_leader():
+                try:
+                    await self.step(dt, players, channel_layer)
+                except Exception:
+                    logger.exception("Entity tick failed")
+
+            next_tick += dt
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    def _player_positions(self, players):
+        rows = []
+        for player in players.values():
+            position = player.get("position") or {}
+            try:
+                rows.append((float(position["x"]), float(position["y"]), float(position["z"])))
+            except (KeyError, TypeError, ValueError):
+                rows.append((np.inf, np.inf, np.inf))
+        return np.array(rows, dtype=np.float32).reshape(-1, 3)
+
+    async def step(self, dt, players, channel_layer):
+        positions = self._player_positions(players)
+        await occupancy_index.load(self.world.chunks())
+        self.world.tick(dt, positions, occupancy_index)
+
+        self._ticks += 1
+        if self._ticks % (self.tick_rate * 5) == 0:
+            self.spawn_around(positions)
+
+        if self._ticks % self.sync_every == 0:
+            self._showing &= players.keys()
+            for (channel_name, player), position in zip(players.items(), positions):
+                slots = self.world.visible_from(position, self.view_distance)
+                # An empty frame is only needed once, to clear what the client shows
+                if not len(slots) and channel_name not in self._showing:
+                    continue
+                if len(slots):
+                    self._showing.add(channel_name)
+                else:
+                    self._showing.discard(channel_name)
+                await channel_layer.send(channel_name, {
+                    "type": "entity_update",
+                    "text": json.dumps({"type": "entities", "names": KINDS, **self.world.encode(slots)}),
+                })
+
+    def hit(self, entity_id, damage, source):
+        if not is_leader():
+            publish("entity_hit", [entity_id, damage, source])
+            return
+        slot = self.world.slot_of(entity_id)
+        if slot is None or not self._within_reach(slot, source):
+            return
+        self.world.damage(entity_id, damage, source)
+
+    def explode(self, entity_id, source):
+        """A client saw this creeper's fuse run out next to its player."""
+        if not is_leader():
+            publish("entity_explode", [entity_id, source])
+            return
+        slot = self.world.slot_of(entity_id)
+        if slot is None or self.world.kind[slot] != CREEPER or not self._within_reach(slot, source):
+            return
+        x, y, z = self.world.position[slot].tolist()
+        self.world.despawn([slot])
+        start_job(blast((math.floor(x), math.floor(y + 1), math.floor(z)), EXPLOSION_RADIUS))
+
+    def _within_reach(self, slot, source):
+        # Ignore players further away than the client's reach
+        dx, dy, dz = (self.world.position[slot][i] - source[i] for i in range(3))
+        return dx * dx + dy * dy + dz * dz <= MAX_HIT_DISTANCE * MAX_HIT_DISTANCE
+
+    def is_night(self):
+        return world_clock.is_night()
+
+    def spawn_around(self, positions):
+        """Top up mobs around each player, like Game.updateMobSpawning did."""
+        finite = positions[np.isfinite(positions).all(axis=1)]
+        if not len(finite) or len(self.world) >= self.max_entities:
+            return
+
+        n = self.world.count
+        alive = self.world.alive[:n]
+        hostile = HOSTILE[self.world.kind[:n]]
+        night = self.is_night()
+        rng = self.world.rng
+
+        kinds, spots = [], []
+        for position in finite:
+            near = self.world.visible_from(position, 64)
+            near_hostile = int(hostile[near].sum()) if len(near) else 0
+            if night and near_hostile < self.max_hostile:
+                kinds.append(rng.integers(ZOMBIE, CREEPER + 1, 2))
+                spots.append(self._spawn_points(position, 2, 24, 64))
+            if not night and len(near) - near_hostile < self.max_passive:
+                kinds.append(rng.integers(PIG, CHICKEN + 1, 1))
+                spots.append(self._spawn_points(position, 1, 16, 64))
+        if not kinds:
+            return
+
+        kinds = np.concatenate(kinds)
+        spots = np.concatenate(spots)
+        height, top_y, top_block = self.terrain.surface(spots[:, 0], spots[:, 1])
+
+        # Hostiles need dry ground, passive mobs need grass
+        ok = np.where(HOSTILE[kinds], top_block != blocks.WATER, top_block == blocks.GRASS)
+        ok &= alive.sum() + np.arange(len(kinds)) < self.max_entities
+        if not ok.any():
+            return
+
+        spawn_pos = np.stack([spots[ok, 0] + 0.5, height[ok], spots[ok, 1] + 0.5], axis=1)
+        self.world.spawn(kinds[ok], spawn_pos)
+
+    def _spawn_points(self, position, count, min_dist, max_dist):
+        rng = self.world.rng
+        angle = rng.uniform(0, 2 * np.pi, count)
+        dist = rng.uniform(min_dist, max_dist, count)
+        return np.stack([
+            np.floor(position[0] + np.cos(angle) * dist),
+            np.floor(position[2] + np.sin(angle) * dist),
+        ], axis=1)
+
+
+async def blast(center, radius):
+    """Clear the solid blocks of a sphere, as Creeper.explode() does offline."""
+    span = np.arange(-radius, radius + 1)
+    offsets = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+    points = offsets[(offsets ** 2).sum(axis=1) <= radius * radius] + np.asarray(center)
+    points = points[points[:, 1] > 0]  # the bedrock layer stays
+
+    await occupancy_index.load(nearby_chunks(center))
+    points = points[occupancy_index.is_solid(points[:, 0], points[:, 1], points[:, 2])]
+    if not len(points):
+        return
+
+    changes = {}
+    flat = []
+    for x, y, z in points.tolist():
+        changes.setdefault(chunk_coords(x, z), []).append((x, y, z, blocks.AIR))
+        flat.extend((x, y, z, blocks.AIR))
+    await world_store.set_blocks(changes)
+    await get_channel_layer().group_send("game_world", {
+        "type": "region_update",
+        "text": json.dumps({"type": "region_update", "blocks": flat}),
+    })
+
+
+entity_simulation = EntitySimulation(
+    tick_rate=getattr(settings, 'ENTITY_TICK_RATE', 10),
+    view_distance=getattr(settings, 'ENTITY_VIEW_DISTANCE', 64),
+    max_entities=getattr(settings, 'ENTITY_MAX', 5000),
+)
+
+
+@subscribe("entity_hit")
+def apply_remote_hit(payload):
+    entity_id, damage, source = payload
+    if is_leader():
+        entity_simulation.hit(entity_id, damage, tuple(source))
+
+
+@subscribe("entity_explode")
+def apply_remote_explosion(payload):
+    entity_id, source = payload
+    if is_leader():
+        entity_simulation.explode(entity_id, tuple(source))
@@ -0,0 +1,212 @@
+"""Cached, pre-compressed encodings of the frames sent on join.
+
+Every joining player gets the whole world snapshot (world_data) and the
+players_list. Both are kept encoded between joins: the JSON is split into
+fragments (one per chunk, one per player) that are each serialized and
+deflated on their own, so a block edit or a joining player only
+re-encodes its own fragment. Building the frame is then a concatenation.
+
+Fragments are deflated with a full flush, which makes them independent
+raw deflate blocks. Wrapped in a zlib header and trailer they form one
+valid zlib stream that clients inflate with DecompressionStream('deflate').
+"""
+import abc
+import asyncio
+import json
+import struct
+import zlib
+
+from django.conf import settings
+
+from .models import Chunk
+from .store import CHUNK_SIZE, world_store
+
+# Streamed to everyone by player_update (clients send them 20 times a
+# second), so changes to them alone leave the players_list frame as it is
+MOVEMENT_FIELDS = ("position", "rotation")
+
+ZLIB_HEADER = b"\x78\x9c"
+FINAL_BLOCK = zlib.compressobj(wbits=-15).flush()  # empty last block
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def deflate(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+class SplicedFrame:
+    """JSON members deflated one fragment at a time and spliced into a frame.
+
+    A fragment is the text of some members of the frame's big object or
+    array (``"k":v,"k":v`` or ``v,v``). The commas between fragments are
+    deflated once and reused.
+    """
+
+    def __init__(self, level=6):
+        self.level = level
+        self.fragments = {}
+        self.comma = deflate(b",", level)
+
+    def set(self, key, members):
+        if members:
+            data = members.encode()
+            self.fragments[key] = (data, deflate(data, self.level))
+        else:
+            self.fragments.pop(key, None)
+
+    def discard(self, key):
+        self.fragments.pop(key, None)
+
+    def encode(self, head, tail):
+        """Return (text, zlib bytes) of ``head`` + members + ``tail``."""
+        head, tail = head.encode(), tail.encode()
+        texts = [head]
+        deflated = [ZLIB_HEADER, deflate(head, self.level)]
+        for n, (data, compressed) in enumerate(self.fragments.values()):
+            if n:
+                texts.append(b",")
+                deflated.append(self.comma)
+            texts.append(data)
+            deflated.append(compressed)
+        texts.append(tail)
+
+        checksum = 1
+        for data in texts:
+            checksum = zlib.adler32(data, checksum)
+        deflated += [deflate(tail, self.level), FINAL_BLOCK, struct.pack(">I", checksum)]
+        return b"".join(texts).decode(), b"".join(deflated)
+
+
+class CachedFrame(abc.ABC):
+    """Frame encoded at most once per change, whoever asks for it.
+
+    ``get()`` returns (text, zlib bytes). Joins arriving while the frame
+    is being built wait for that build instead of starting their own.
+    """
+
+    def __init__(self, level=6):
+        self.frame = SplicedFrame(level)
+        self.dirty = set()
+        self.generation = 0
+        self._encoded = None
+        self._building = None
+        self._building_generation = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self, key=None):
+        if key is not None:
+            self.dirty.add(key)
+        self.generation += 1
+        self._encoded = None
+
+    async def get(self, *args):
+        if self._encoded is not None:
+            return self._encoded
+        if self._building is None or self._building_generation != self.generation:
+            self._building = asyncio.ensure_future(self._build(*args))
+            self._building_generation = self.generation
+        return await asyncio.shield(self._building)
+
+    async def _build(self, *args):
+        # Builds are serialized: only a build touches the fragments
+        async with self._lock:
+            generation = self.generation
+            dirty, self.dirty = self.dirty, set()
+            try:
+                encoded = await self.build(dirty, *args)
+            except BaseException:
+                self.dirty |= dirty
+                raise
+            if generation == self.generation:
+                self._encoded = encoded
+            return encoded
+
+    @abc.abstractmethod
+    async def build(self, dirty, *args):
+        """Bring the fragments of the ``dirty`` keys up to date and encode."""
+
+
+class WorldDataFrame(CachedFrame):
+    """The world_data frame: seed, time, motd and every stored modification."""
+
+    def __init__(self, level=6):
+        super().__init__(level)
+        self.world_id = None
+
+    def blocks_changed(self, positions):
+        for cx, cz in {(x // CHUNK_SIZE, z // CHUNK_SIZE) for x, y, z in positions}:
+            self.invalidate((cx, cz))
+
+    async def build(self, dirty):
+        world = await world_store.get_world()
+        if world.pk != self.world_id:
+            self.frame.fragments.clear()
+            await self.load_all(world)
+            self.world_id = world.pk
+
+        # Snapshot the chunks on the event loop, encode them off it
+        changed = []
+        for cx, cz in dirty:
+            chunk = await world_store.get_chunk(cx, cz)
+            changed.append(((cx, cz), dict(chunk.modifications) if chunk is not None else {}))
+        head = dumps({"type": "world_data", "seed": world.seed, "time": world.time, "motd": world.motd})
+        return await asyncio.to_thread(self.encode, changed, head[:-1] + ',"modifications":{')
+
+    async def load_all(self, world):
+        rows = []
+        async for x, z, modifications in Chunk.objects.filter(world=world).values_list("x", "z", "modifications"):
+            rows.append(((x, z), modifications))
+            if len(rows) >= 64:
+                await asyncio.to_thread(self.set_fragments, rows)
+                rows = []
+        await asyncio.to_thread(self.set_fragments, rows)
+
+    def set_fragments(self, rows):
+        for key, modifications in rows:
+            self.frame.set(key, dumps(modifications)[1:-1])
+
+    def encode(self, changed, head):
+        self.set_fragments(changed)
+        return self.frame.encode(head, "}}")
+
+
+class PlayersListFrame(CachedFrame):
+    """The players_list frame, one fragment per connected player.
+
+    A fragment is only rebuilt when its player joins, leaves or changes a
+    field other than MOVEMENT_FIELDS; the position a joining client reads
+    may be a moment old until the next player_update.
+    """
+
+    def __init__(self, level=6):
+        super().__init__(level)
+        self.listed = {}
+
+    def player_changed(self, key, state):
+        listed = None
+        if state is not None:
+            listed = {field: value for field, value in state.items() if field not in MOVEMENT_FIELDS}
+        if listed == self.listed.get(key):
+            return
+        if listed is None:
+            del self.listed[key]
+        else:
+            self.listed[key] = listed
+        self.invalidate(key)
+
+    async def build(self, dirty, players):
+        for key in dirty:
+            state = players.get(key)
+            if state is None:
+                self.frame.discard(key)
+            else:
+                self.frame.set(key, dumps(state))
+        return self.frame.encode('{"type":"players_list","players":[', "]}")
+
+
+world_data_frame = WorldDataFrame(level=getattr(settings, 'JOIN_FRAME_COMPRESSION', 6))
+players_list_frame = PlayersListFrame(level=getattr(settings, 'JOIN_FRAME_COMPRESSION', 6))
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from game import benchmarks
+
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the storage and serialization microbenchmarks on a throwaway test "
+        "database and compare them with the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("patterns", nargs="*",
+                            help="Only run these benchmarks (exact names, else glob patterns)")
+        parser.add_argument("--baseline", default=settings.BASE_DIR / "benchmarks.json",
+                            help="Baseline results file")
+        parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+        parser.add_argument("--check", action="store_true", help="Fail if any benchmark regressed")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed relative slowdown or memory growth before flagging (default 0.25)")
+        parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to time each benchmark for")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Timing passes per benchmark; the median is reported (default 5)")
+
+    def handle(self, *args, patterns, baseline, save, check, tolerance, min_time, repeat, **options):
+        if repeat < 1:
+            raise CommandError("--repeat must be at least 1")
+        names = benchmarks.select(patterns)
+        if not names:
+            raise CommandError("No benchmark matches " + ", ".join(patterns))
+
+        try:
+            with open(baseline) as f:
+                previous = json.load(f)
+        except FileNotFoundError:
+            previous = {}
+
+        self.tolerance = tolerance
+        self.previous = previous
+        self.regressions = []
+        self.stdout.write(f"{'benchmark':<36} {'ops/s':>12} {'peak':>12}   vs baseline")
+
+        # The synthetic worlds go into the test database, like the test runner's
+        connection = connections["default"]
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = asyncio.run(benchmarks.run_benchmarks(names, min_time, self.report, repeat))
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if save:
+            with open(baseline, "w") as f:
+                json.dump({**previous, **results}, f, indent=2, sort_keys=True)
+                f.write("\n")
+            self.stdout.write(f"Baseline written to {baseline}")
+
+        if self.regressions:
+            message = "Regressed: " + ", ".join(self.regressions)
+            if check:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+
+    def report(self, name, result):
+        line = f"{name:<36} {result['ops']:>12.1f} {format_bytes(result['peak']):>12}"
+        base = self.previous.get(name)
+        if base is None:
+            self.stdout.write(line + "   (new)")
+            return
+
+        speed = result["ops"] / base["ops"] - 1
+        memory = result["peak"] / base["peak"] - 1 if base["peak"] else 0
+        line += f"   {speed:+7.1%} ops/s {memory:+7.1%} peak"
+        if speed < -self.tolerance or memory > self.tolerance:
+            self.regressions.append(name)
+            line = self.style.ERROR(line)
+        self.stdout.write(line)
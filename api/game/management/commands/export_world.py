@@ -0,0 +1,100 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from game import archive
+from game.models import World, Chunk, Player
+from game.store import WORLD_NAME
+
+PLAYER_BATCH = 500
+
+
+@contextmanager
+def read_snapshot(using=DEFAULT_DB_ALIAS):
+    """Run every query of the block against one consistent snapshot."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            yield
+        return
+
+    # atomic() would BEGIN IMMEDIATE (see DATABASES) and lock out the game
+    # server's writes; a deferred read transaction in WAL mode does not
+    with connection.cursor() as cursor:
+        cursor.execute("BEGIN DEFERRED")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("ROLLBACK")
+
+
+class Command(BaseCommand):
+    help = "Export a world, its chunks and all players to a compressed archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--world", default=WORLD_NAME, help="Name of the world to export")
+        parser.add_argument("--level", type=int, default=6, help="zlib compression level (1-9)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Threads compressing chunks")
+        parser.add_argument("--chunk-size", type=int, default=256, help="Rows fetched per query round trip")
+
+    def handle(self, *args, path, world, level, workers, chunk_size, **options):
+        temp_path = f"{path}.part"
+        chunks = players = 0
+
+        try:
+            with read_snapshot(), open(temp_path, "wb") as f, ThreadPoolExecutor(workers) as pool:
+                world_obj = World.objects.filter(name=world).first()
+                if world_obj is None:
+                    raise CommandError(f"World {world!r} does not exist")
+
+                writer = archive.ArchiveWriter(f)
+                writer.write(archive.WORLD, archive.encode_json({
+                    "name": world_obj.name,
+                    "seed": world_obj.seed,
+                    "time": world_obj.time,
+                    "motd": world_obj.motd,
+                    "created_at": world_obj.created_at.isoformat(),
+                }, level))
+
+                rows = (
+                    Chunk.objects.filter(world=world_obj)
+                    .order_by("x", "z")
+                    .values_list("x", "z", "modifications")
+                    .iterator(chunk_size=chunk_size)
+                )
+                # Compression runs in the pool while the next rows are fetched
+                encoded = archive.bounded_map(
+                    pool, lambda row: (row[0], row[1], archive.encode_chunk(*row, level)), rows, workers * 4
+                )
+                for x, z, payload in encoded:
+                    writer.write(archive.CHUNK, payload, key=(x, z))
+                    chunks += 1
+
+                rows = (
+                    Player.objects.order_by("pk")
+                    .values(*archive.PLAYER_FIELDS)
+                    .iterator(chunk_size=chunk_size)
+                )
+                for batch in archive.batched(rows, PLAYER_BATCH):
+                    writer.write(archive.PLAYERS, archive.encode_json(batch, level))
+                    players += len(batch)
+
+                writer.close()
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        os.replace(temp_path, path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {world!r}: {chunks} chunks, {players} players, {os.path.getsize(path)} bytes"
+        ))
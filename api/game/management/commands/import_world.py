@@ -0,0 +1,113 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from game import archive
+from game.minimap import minimap_cache
+from game.models import World, Chunk, Player
+
+DELETE_BATCH = 1000
+PLAYER_BATCH = 500
+
+
+def delete_world(world):
+    # A cascading delete would load every chunk at once to send signals
+    while pks := list(Chunk.objects.filter(world=world).values_list("pk", flat=True)[:DELETE_BATCH]):
+        Chunk.objects.filter(pk__in=pks).delete()
+    world.delete()
+
+
+class Command(BaseCommand):
+    help = "Import a world archive written by export_world."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--name", help="World name to import as (defaults to the archived name)")
+        parser.add_argument("--replace", action="store_true", help="Replace an existing world with that name")
+        parser.add_argument("--batch-size", type=int, default=32, help="Frames per bulk insert")
+        parser.add_argument("--workers", type=int,
+                            help="Threads running bulk inserts (default: 1 on SQLite, 4 otherwise)")
+
+    def handle(self, *args, path, name, replace, batch_size, workers, **options):
+        if workers is None:
+            # SQLite has a single writer; more threads would only wait on its lock
+            workers = 1 if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite' else 4
+
+        try:
+            with open(path, "rb") as f:
+                reader = archive.ArchiveReader(f)
+                frames = reader.frames()
+                kind, payload = next(frames, (None, None))
+                if kind != archive.WORLD:
+                    raise CommandError("Archive does not start with a world")
+                info = archive.decode_json(payload)
+                name = name or info["name"]
+
+                existing = World.objects.filter(name=name).first()
+                if existing is not None and not replace:
+                    raise CommandError(f"World {name!r} already exists, use --replace to overwrite it")
+
+                # Import under a temporary name so a failure leaves the old world intact
+                world = World.objects.create(
+                    name=f"{name} (importing)"[:100], seed=info["seed"], time=info["time"], motd=info["motd"]
+                )
+                try:
+                    chunks = self.import_frames(world, frames, batch_size, workers)
+                    players = self.swap(reader, world, existing, name, info)
+                except BaseException:
+                    delete_world(world)
+                    raise
+        except (OSError, archive.ArchiveError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        # Cached minimap tiles of these seeds no longer match the stored blocks
+        seeds = {info["seed"]} | ({existing.seed} if existing is not None else set())
+        for seed in seeds:
+            minimap_cache.remove_seed(seed)
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {name!r}: {chunks} chunks, {players} players"))
+        self.stdout.write("Restart the game server so it reloads the world.")
+
+    def swap(self, reader, world, existing, name, info):
+        """Put the imported world in place of ``existing``. Returns the number of players."""
+        # Players are not per world, so they change together with the swap. They
+        # are read again from the archive, one frame (PLAYER_BATCH rows) at a time
+        count = 0
+        with transaction.atomic():
+            if existing is not None:
+                delete_world(existing)
+            World.objects.filter(pk=world.pk).update(name=name, created_at=parse_datetime(info["created_at"]))
+            for kind, payload in reader.frames(kinds={archive.PLAYERS}):
+                players = [Player(**row) for row in archive.decode_json(payload)]
+                Player.objects.bulk_create(
+                    players, batch_size=PLAYER_BATCH, update_conflicts=True, unique_fields=["username"],
+                    update_fields=[field for field in archive.PLAYER_FIELDS if field != "username"],
+                )
+                count += len(players)
+        return count
+
+    def import_frames(self, world, frames, batch_size, workers):
+        def decode(batch):
+            chunks = []
+            for kind, payload in batch:
+                if kind == archive.CHUNK:
+                    x, z, modifications = archive.decode_chunk(payload)
+                    chunks.append(Chunk(world_id=world.pk, x=x, z=z, modifications=modifications))
+            return chunks
+
+        def insert(chunks):
+            try:
+                Chunk.objects.bulk_create(chunks)
+            finally:
+                # Each pool thread has its own connection
+                connections.close_all()
+            return len(chunks)
+
+        # read -> decompress/decode -> bulk insert, each stage bounded. Chunks go
+        # into the temporary world; players are left for the swap
+        with ThreadPoolExecutor(os.cpu_count() or 1) as decoders, ThreadPoolExecutor(workers) as writers:
+            decoded = archive.bounded_map(decoders, decode, archive.batched(frames, batch_size), workers * 2)
+            return sum(archive.bounded_map(writers, insert, decoded, workers * 2))
@@ -0,0 +1,80 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+RESTART_DELAY = 1  # seconds before a crashed worker is started again
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the game with several daphne worker processes sharing one port. "
+        "Workers exchange channel layer messages over a Unix socket (voxel_server.ipc)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'GAME_WORKERS', None),
+                            help="Number of processes (default: one per CPU).")
+        parser.add_argument('--host', default="127.0.0.1")
+        parser.add_argument('--port', type=int, default=8011)
+        parser.add_argument('--socket', default=str(getattr(settings, 'GAME_IPC_SOCKET', "run/channels.sock")),
+                            help="Path of the channel layer socket.")
+
+    def handle(self, *args, **options):
+        count = options['workers'] or os.cpu_count() or 1
+        if count < 1:
+            raise CommandError("--workers must be at least 1")
+
+        address = (options['host'], options['port'])
+        env = dict(os.environ, VOXEL_IPC_SOCKET=os.path.abspath(options['socket']))
+        # With SO_REUSEPORT each worker gets its own socket and the kernel
+        # spreads connections; a shared socket is mostly accepted by one
+        reuse_port = hasattr(socket, "SO_REUSEPORT")
+        try:
+            if reuse_port:
+                listeners = [socket.create_server(address, backlog=1024, reuse_port=True) for _ in range(count)]
+            else:
+                listeners = [socket.create_server(address, backlog=1024)] * count
+        except OSError as e:
+            raise CommandError(f"Cannot listen on {address[0]}:{address[1]}: {e}")
+
+        def spawn(n):
+            fd = listeners[n].fileno()
+            return subprocess.Popen(
+                [sys.executable, "-m", "daphne", "--fd", str(fd), "voxel_server.asgi:application"],
+                pass_fds=[fd], env=env, cwd=settings.BASE_DIR,
+            )
+
+        workers = [spawn(n) for n in range(count)]
+        self.stdout.write(f"Serving on {options['host']}:{options['port']} with {count} workers")
+
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+        signal.signal(signal.SIGTERM, stop)
+
+        try:
+            while not stopping:
+                time.sleep(RESTART_DELAY)
+                for n, worker in enumerate(workers):
+                    if worker.poll() is not None:
+                        self.stderr.write(f"Worker {worker.pid} exited with {worker.returncode}, restarting")
+                        workers[n] = spawn(n)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for worker in workers:
+                if worker.poll() is None:
+                    worker.terminate()
+            for worker in workers:
+                worker.wait()
+            for listener in listeners:
+                listener.close()
+
@@ -0,0 +1,358 @@
+import asyncio
+import base64
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from . import blocks
+from .store import CHUNK_SIZE, parse_key, world_store
+from .terrain import Terrain
+
+TILE_SIZE = 16  # samples per tile edge
+MAX_LEVEL = 4  # level L samples every 2**L blocks, so a tile covers 16 * 2**L blocks
+MARKER = '.minimap'  # in every directory of tiles; only those are ever deleted
+
+
+def tile_span(level):
+    return TILE_SIZE << level
+
+
+def _write_file(path, data):
+    directory = os.path.dirname(path)
+    marker = os.path.join(directory, MARKER)
+    if not os.path.exists(marker):
+        os.makedirs(directory, exist_ok=True)
+        open(marker, 'wb').close()
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _write_files(files):
+    for path, data in files:
+        _write_file(path, data)
+
+
+def _generated_block(y, height, top_y, top_block):
+    # Best guess for a generated block below the surface, for dug-out columns
+    if y > top_y:
+        return blocks.AIR
+    if y == top_y:
+        return top_block
+    if y >= height:
+        return blocks.WATER
+    if y > height - 4:
+        return blocks.DIRT
+    return blocks.STONE
+
+
+class Tile:
+    """Top block height and id for a TILE_SIZE x TILE_SIZE grid of columns.
+
+    Generated values are kept next to the final ones so a column can be
+    recomputed from its modifications alone when a block changes.
+    """
+
+    __slots__ = ('height', 'generated_y', 'generated_block', 'top_y', 'top_block', 'dirty')
+
+    def __init__(self, height, top_y, top_block):
+        self.height = height
+        self.generated_y = top_y
+        self.generated_block = top_block
+        self.top_y = top_y.copy()
+        self.top_block = top_block.copy()
+        self.dirty = True
+
+    def apply_column(self, i, j, column):
+        """Overlay the modifications of one column ({y: block})."""
+        height = int(self.height[i, j])
+        gen_y = int(self.generated_y[i, j])
+        gen_block = int(self.generated_block[i, j])
+
+        placed = [y for y, block in column.items() if block != blocks.AIR]
+        y = max(placed) if placed else -1
+        if y > gen_y:
+            block = int(column[y])
+        else:
+            y = gen_y
+            while y > 0 and column.get(y) == blocks.AIR:
+                y -= 1
+            block = column.get(y)
+            if block is None:
+                block = _generated_block(y, height, gen_y, gen_block)
+            block = int(block)
+
+        self.top_y[i, j] = y
+        self.top_block[i, j] = block
+        self.dirty = True
+
+    def encode(self):
+        # 256 bytes of heights followed by 256 little-endian uint16 block ids
+        heights = np.clip(self.top_y, 0, 255).astype(np.uint8)
+        return heights.tobytes() + self.top_block.astype('<u2').tobytes()
+
+    def to_bytes(self):
+        return b''.join(
+            array.astype('<i2').tobytes()
+            for array in (self.height, self.generated_y, self.generated_block, self.top_y, self.top_block)
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        arrays = np.frombuffer(data, dtype='<i2').astype(np.int32).reshape(5, TILE_SIZE, TILE_SIZE)
+        tile = cls(arrays[0], arrays[1], arrays[2])
+        tile.top_y = arrays[3].copy()
+        tile.top_block = arrays[4].copy()
+        tile.dirty = False
+        return tile
+
+
+class MinimapCache:
+    """Server-side minimap tiles at several zoom levels.
+
+    Tiles are computed from the terrain port plus stored modifications,
+    kept in a bounded in-memory LRU and written to ``cache_dir`` when
+    evicted (off the event loop) or flushed at shutdown, so they survive
+    restarts. The directory keeps at most ``max_disk_tiles`` files of the
+    current seed, dropping the least recently used, and a subdirectory per
+    seed marked with a MARKER file. Block updates patch the affected
+    column of every cached tile that samples it.
+    """
+
+    def __init__(self, cache_dir, max_tiles=4096, max_disk_tiles=16384):
+        self.cache_dir = cache_dir
+        self.max_tiles = max_tiles
+        self.max_disk_tiles = max_disk_tiles
+        self._tiles = OrderedDict()
+        self._files = OrderedDict()  # tile keys on disk, least recently used first
+        self._writing = {}  # key -> False once a block change made the file being written stale
+        self._terrain = None
+
+    def _get_terrain(self, seed):
+        if self._terrain is None or self._terrain.seed != seed:
+            self._terrain = Terrain(seed)
+            self._tiles.clear()
+            self._scan_files(seed)
+        return self._terrain
+
+    def _scan_files(self, seed):
+        """Index the tiles already on disk; other seeds' tiles are removed."""
+        self._files.clear()
+        try:
+            entries = list(os.scandir(self.cache_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            if entry.name != str(seed):
+                self._remove_dir(entry.path)
+                continue
+            # Tiles from before the marker existed are adopted
+            open(os.path.join(entry.path, MARKER), 'ab').close()
+            files = sorted(os.scandir(entry.path), key=lambda f: f.stat().st_mtime)
+            for f in files:
+                try:
+                    level, tx, tz = map(int, f.name.removesuffix('.tile').split('_'))
+                except ValueError:
+                    continue
+                self._files[(level, tx, tz)] = None
+        self._prune_files(seed)
+
+    def _remove_dir(self, path):
+        if os.path.exists(os.path.join(path, MARKER)):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def remove_seed(self, seed):
+        """Delete the tiles of ``seed`` on disk, e.g. after its blocks were replaced."""
+        self._remove_dir(os.path.join(self.cache_dir, str(seed)))
+        if self._terrain is not None and self._terrain.seed == seed:
+            self._terrain = None
+
+    def _prune_files(self, seed):
+        while len(self._files) > self.max_disk_tiles:
+            key, _ = self._files.popitem(last=False)
+            self._remove(seed, key)
+
+    def _remove(self, seed, key):
+        self._files.pop(key, None)
+        try:
+            os.remove(self._path(seed, *key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, seed, level, tx, tz):
+        return os.path.join(self.cache_dir, str(seed), f"{level}_{tx}_{tz}.tile")
+
+    def _remember(self, key, tile):
+        """Cache ``tile``; returns the evicted tiles that need writing."""
+        self._tiles[key] = tile
+        self._tiles.move_to_end(key)
+        evicted = []
+        while len(self._tiles) > self.max_tiles:
+            old_key, old_tile = self._tiles.popitem(last=False)
+            if old_tile.dirty:
+                evicted.append((old_key, old_tile))
+        return evicted
+
+    def _add_file(self, seed, key):
+        self._files[key] = None
+        self._files.move_to_end(key)
+        self._prune_files(seed)
+
+    def _write(self, seed, key, tile):
+        _write_file(self._path(seed, *key), tile.to_bytes())
+        tile.dirty = False
+        self._add_file(seed, key)
+
+    async def _write_evicted(self, seed, tiles):
+        files = []
+        for key, tile in tiles:
+            files.append((self._path(seed, *key), tile.to_bytes()))
+            tile.dirty = False
+            self._writing[key] = True
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, _write_files, files)
+            written = True
+        except OSError:
+            # Only a cache: the tiles are computed again when next needed
+            written = False
+        for key, tile in tiles:
+            if self._writing.pop(key, False) and written:
+                self._add_file(seed, key)
+            else:
+                self._remove(seed, key)
+
+    def _read(self, seed, key):
+        if key not in self._files:
+            return None
+        try:
+            with open(self._path(seed, *key), 'rb') as f:
+                tile = Tile.from_bytes(f.read())
+        except (FileNotFoundError, ValueError):
+            self._files.pop(key, None)
+            return None
+        self._files.move_to_end(key)
+        return tile
+
+    async def get_tiles(self, level, coords):
+        """Return {(tx, tz): encoded bytes} for the requested tiles."""
+        world = await world_store.get_world()
+        terrain = self._get_terrain(world.seed)
+        step = 1 << level
+
+        result = {}
+        missing = []
+        evicted = []
+        for tx, tz in coords:
+            key = (level, tx, tz)
+            tile = self._tiles.get(key) or self._read(world.seed, key)
+            if tile is None:
+                missing.append((tx, tz))
+                continue
+            evicted += self._remember(key, tile)
+            result[(tx, tz)] = tile.encode()
+
+        if missing:
+            # Evaluate every missing tile in a single vectorized terrain pass
+            offsets = np.arange(TILE_SIZE) * step
+            xs = np.concatenate([tx * tile_span(level) + offsets for tx, tz in missing])
+            zs = np.concatenate([tz * tile_span(level) + offsets for tx, tz in missing])
+            grid_x = np.repeat(xs.reshape(-1, TILE_SIZE, 1), TILE_SIZE, axis=2)
+            grid_z = np.repeat(zs.reshape(-1, 1, TILE_SIZE), TILE_SIZE, axis=1)
+            height, top_y, top_block = await asyncio.to_thread(terrain.surface, grid_x, grid_z)
+
+            for n, (tx, tz) in enumerate(missing):
+                tile = Tile(height[n], top_y[n], top_block[n])
+                await self._apply_modifications(tile, level, tx, tz)
+                evicted += self._remember((level, tx, tz), tile)
+                result[(tx, tz)] = tile.encode()
+
+        if evicted:
+            await self._write_evicted(world.seed, evicted)
+        return result
+
+    async def _apply_modifications(self, tile, level, tx, tz):
+        span = tile_span(level)
+        step = 1 << level
+        x0, z0 = tx * span, tz * span
+        await world_store.load_region(
+            x0 // CHUNK_SIZE, z0 // CHUNK_SIZE,
+            (x0 + span - 1) // CHUNK_SIZE, (z0 + span - 1) // CHUNK_SIZE,
+        )
+
+        columns = {}
+        for cx in range(x0 // CHUNK_SIZE, (x0 + span - 1) // CHUNK_SIZE + 1):
+            for cz in range(z0 // CHUNK_SIZE, (z0 + span - 1) // CHUNK_SIZE + 1):
+                for key, block in world_store.cached_modifications(cx, cz).items():
+                    x, y, z = parse_key(key)
+                    if (x - x0) % step or (z - z0) % step:
+                        continue
+                    columns.setdefault(((x - x0) // step, (z - z0) // step), {})[y] = block
+
+        for (i, j), column in columns.items():
+            tile.apply_column(i, j, column)
+
+    def blocks_changed(self, positions):
+        """Patch every cached tile that samples one of the changed columns."""
+        if self._terrain is None:
+            return
+        seed = self._terrain.seed
+
+        by_chunk = {}
+        for x, z in {(x, z) for x, y, z in positions}:
+            by_chunk.setdefault((x // CHUNK_SIZE, z // CHUNK_SIZE), set()).add((x, z))
+
+        stale = set()
+        for (cx, cz), changed in by_chunk.items():
+            patches = []
+            for x, z in changed:
+                for level in range(MAX_LEVEL + 1):
+                    step = 1 << level
+                    if x % step or z % step:
+                        continue
+                    span = tile_span(level)
+                    key = (level, x // span, z // span)
+                    stale.add(key)
+                    tile = self._tiles.get(key)
+                    if tile is not None:
+                        patches.append((tile, (x % span) // step, (z % span) // step, (x, z)))
+            if not patches:
+                continue
+
+            # One pass over the chunk's modifications for all its changed columns
+            wanted = {column for *_, column in patches}
+            columns = {}
+            for mod_key, block in world_store.cached_modifications(cx, cz).items():
+                mx, my, mz = parse_key(mod_key)
+                if (mx, mz) in wanted:
+                    columns.setdefault((mx, mz), {})[my] = block
+            for tile, i, j, column in patches:
+                tile.apply_column(i, j, columns.get(column, {}))
+
+        # The disk copies are stale either way; tiles are rewritten on eviction
+        for key in stale:
+            if key in self._writing:
+                self._writing[key] = False
+            self._remove(seed, key)
+
+    def flush(self):
+        """Write the tiles changed since they were read (at shutdown)."""
+        if self._terrain is None:
+            return
+        for key, tile in self._tiles.items():
+            if tile.dirty:
+                self._write(self._terrain.seed, key, tile)
+
+
+def encode_tile(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+minimap_cache = MinimapCache(
+    getattr(settings, 'MINIMAP_CACHE_DIR', settings.BASE_DIR / 'minimap_cache'),
+    max_tiles=getattr(settings, 'MINIMAP_CACHE_TILES', 4096),
+    max_disk_tiles=getattr(settings, 'MINIMAP_DISK_TILES', 16384),
+)
@@ -0,0 +1,235 @@
+"""Per-chunk occupancy bitsets and server-side movement checks.
+
+The server never sees the client's meshes, so it keeps its own answer to
+"is this block solid?" for the chunks around players: one bit per block,
+built from the terrain port plus stored modifications and patched on
+every block update. Movement updates are checked against it in a single
+batched lookup per message.
+"""
+import asyncio
+import math
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .blocks import is_solid
+from .store import CHUNK_SIZE, parse_key, world_store
+from .terrain import CHUNK_HEIGHT, Terrain
+
+# Body points checked below the reported (camera) position: eye and knees.
+# Knees rather than feet so standing on slabs and other short blocks is fine.
+BODY_OFFSETS = np.array([0.0, -1.0])
+PATH_STEP = 0.5  # blocks between samples along a movement
+BURST_SECONDS = 1.0  # movement budget that can be banked for network jitter
+RESYNC_UPDATES = 20  # consistent rejected updates accepted as a desync
+RESYNC_DISTANCE = 8  # blocks from the last accepted position a desync may be
+
+
+class OccupancyIndex:
+    """Solid/non-solid bit for every block of the chunks around players.
+
+    A chunk is a (16, 16, 32) uint8 array: each column's 256 blocks packed
+    along y with np.packbits, 8 KiB per chunk. Chunks are kept in a bounded
+    LRU. Blocks of chunks that are not built yet read as non-solid, so
+    checks stay permissive while they load. ``version`` goes up whenever
+    bits change, for callers that cache what they read.
+    """
+
+    def __init__(self, max_chunks=1024):
+        self.max_chunks = max_chunks
+        self.version = 0
+        self._chunks = OrderedDict()
+        self._terrain = None
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, key):
+        return key in self._chunks
+
+    async def load(self, coords):
+        """Build the bitsets of the given chunk coordinates if needed."""
+        world = await world_store.get_world()
+        if self._terrain is None or self._terrain.seed != world.seed:
+            self._terrain = Terrain(world.seed)
+            self._chunks.clear()
+
+        missing = []
+        for key in coords:
+            if key in self._chunks:
+                self._chunks.move_to_end(key)
+            else:
+                missing.append(key)
+        if not missing:
+            return
+
+        cxs = [cx for cx, cz in missing]
+        czs = [cz for cx, cz in missing]
+        await world_store.load_region(min(cxs), min(czs), max(cxs), max(czs))
+
+        # All missing chunks go through the terrain in a single pass
+        offsets = np.arange(CHUNK_SIZE)
+        xs = np.array(cxs)[:, None, None] * CHUNK_SIZE + offsets[None, :, None]
+        zs = np.array(czs)[:, None, None] * CHUNK_SIZE + offsets[None, None, :]
+        xs, zs = np.broadcast_arrays(xs, zs)
+        solid = await asyncio.to_thread(self._terrain.solid, xs, zs)
+
+        for n, (cx, cz) in enumerate(missing):
+            for key, block in world_store.cached_modifications(cx, cz).items():
+                x, y, z = parse_key(key)
+                if 0 <= y < CHUNK_HEIGHT:
+                    solid[n, x - cx * CHUNK_SIZE, z - cz * CHUNK_SIZE, y] = is_solid(block)
+            self._chunks[(cx, cz)] = np.packbits(solid[n], axis=-1)
+        self.version += 1
+
+        while len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+
+    def is_solid(self, x, y, z):
+        """Vectorized solidity lookup for arrays of world coordinates."""
+        x = np.floor(np.asarray(x, dtype=np.float64)).astype(np.int64)
+        y = np.floor(np.asarray(y, dtype=np.float64)).astype(np.int64)
+        z = np.floor(np.asarray(z, dtype=np.float64)).astype(np.int64)
+        cx = x // CHUNK_SIZE
+        cz = z // CHUNK_SIZE
+
+        result = np.zeros(x.shape, dtype=bool)
+        inside = (y >= 0) & (y < CHUNK_HEIGHT)
+        for key in set(zip(cx[inside].tolist(), cz[inside].tolist())):
+            bits = self._chunks.get(key)
+            if bits is None:
+                continue
+            mask = inside & (cx == key[0]) & (cz == key[1])
+            ym = y[mask]
+            packed = bits[x[mask] % CHUNK_SIZE, z[mask] % CHUNK_SIZE, ym >> 3]
+            result[mask] = (packed >> (7 - (ym & 7))) & 1
+        return result
+
+    def blocks_changed(self, positions, blocks):
+        if not self._chunks or not positions:
+            return
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 3)
+        solid = np.fromiter((is_solid(block) for block in blocks), dtype=bool, count=len(positions))
+        x, y, z = positions.T
+        cx = x // CHUNK_SIZE
+        cz = z // CHUNK_SIZE
+        inside = (y >= 0) & (y < CHUNK_HEIGHT)
+
+        for key in np.unique(np.stack([cx, cz], axis=1), axis=0).tolist():
+            bits = self._chunks.get(tuple(key))
+            if bits is None:
+                continue
+            mask = inside & (cx == key[0]) & (cz == key[1])
+            unpacked = np.unpackbits(bits, axis=-1)
+            unpacked[x[mask] % CHUNK_SIZE, z[mask] % CHUNK_SIZE, y[mask]] = solid[mask]
+            self._chunks[tuple(key)] = np.packbits(unpacked, axis=-1)
+            self.version += 1
+
+
+def nearby_chunks(position, radius=1):
+    cx = math.floor(position[0]) // CHUNK_SIZE
+    cz = math.floor(position[2]) // CHUNK_SIZE
+    return [
+        (cx + dx, cz + dz)
+        for dx in range(-radius, radius + 1)
+        for dz in range(-radius, radius + 1)
+    ]
+
+
+def parse_position(position):
+    """(x, y, z) floats from a client position dict, or None if malformed."""
+    try:
+        values = (float(position["x"]), float(position["y"]), float(position["z"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in values):
+        return None
+    return values
+
+
+class MovementValidator:
+    """Speed and collision checks for one player's position updates.
+
+    Speed is limited with a token budget refilled at ``max_speed`` blocks
+    per second, so updates bunched up by the network do not count as
+    bursts. A move is also rejected when it ends
+    with the body inside solid blocks or passes through a wall on the way.
+
+    /tp and respawns call ``resync`` with the new position. A player who
+    keeps reporting plausible moves from a position the server rejected
+    anyway (a desync, e.g. a door the server still sees closed) is resynced
+    there after RESYNC_UPDATES updates, but only within RESYNC_DISTANCE of
+    the last accepted position: anything farther needs /tp or a respawn.
+    """
+
+    __slots__ = ('index', 'max_speed', 'position', 'budget', 'last_time',
+                 'candidate', 'candidate_time', 'streak', 'accepted', 'rejected')
+
+    def __init__(self, index, position, max_speed, now):
+        self.index = index
+        self.max_speed = max_speed
+        self.position = position
+        self.budget = max_speed * BURST_SECONDS
+        self.last_time = now
+        self.candidate = None
+        self.candidate_time = now
+        self.streak = 0
+        self.accepted = 0
+        self.rejected = 0
+
+    def _collides(self, start, end, distance):
+        # Eye and knee points along the path, ending at the new position
+        steps = max(1, math.ceil(distance / PATH_STEP))
+        t = np.arange(1, steps + 1) / steps
+        path = np.asarray(start) + (np.asarray(end) - np.asarray(start)) * t[:, None]
+        solid = self.index.is_solid(
+            np.repeat(path[:, 0], len(BODY_OFFSETS)),
+            (path[:, 1, None] + BODY_OFFSETS).ravel(),
+            np.repeat(path[:, 2], len(BODY_OFFSETS)),
+        ).reshape(steps, len(BODY_OFFSETS))
+        # Cutting the corner of a block is fine; the whole body inside one is not
+        return bool(solid[-1].any() or solid[:-1].all(axis=1).any())
+
+    def check(self, position, now):
+        """Return True if moving to ``position`` is plausible."""
+        elapsed = max(0.0, now - self.last_time)
+        self.last_time = now
+        self.budget = min(self.max_speed * BURST_SECONDS, self.budget + self.max_speed * elapsed)
+
+        distance = math.dist(self.position, position)
+        if distance <= self.budget and not self._collides(self.position, position, distance):
+            self.budget -= distance
+            self.position = position
+            self.candidate = None
+            self.streak = 0
+            self.accepted += 1
+            return True
+
+        self.rejected += 1
+        if self.candidate is not None and (
+            math.dist(self.candidate, position) <= self.max_speed * (now - self.candidate_time) + PATH_STEP
+            and math.dist(self.position, position) <= RESYNC_DISTANCE
+            and not self._collides(position, position, 0)
+        ):
+            self.streak += 1
+        else:
+            self.streak = 0
+        self.candidate = position
+        self.candidate_time = now
+
+        if self.streak >= RESYNC_UPDATES:
+            self.resync(position)
+            return True
+        return False
+
+    def resync(self, position):
+        self.position = position
+        self.budget = self.max_speed * BURST_SECONDS
+        self.candidate = None
+        self.streak = 0
+
+
+occupancy_index = OccupancyIndex(
+    max_chunks=getattr(settings, 'OCCUPANCY_CHUNKS', 1024),
+)
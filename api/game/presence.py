@@ -0,0 +1,4 @@
+"""Players connected to any worker process, keyed by channel name."""
+from voxel_server.ipc import shared_dict
+
+players = shared_dict("players")
@@ -0,0 +1,158 @@
+"""Bulk block edits over boxes of the world (/fill and /clone).
+
+Edits are split into batches of whole chunks: every chunk in a batch is
+written once with a bulk UPDATE/INSERT, and the event loop gets control
+back between batches, so a fill of millions of blocks neither floods the
+database nor stalls other players.
+"""
+import asyncio
+import logging
+
+import numpy as np
+from django.conf import settings
+
+from .store import CHUNK_SIZE, parse_key, world_store
+from .terrain import CHUNK_HEIGHT, Terrain
+
+BATCH_BLOCKS = 16384  # blocks written per batch, rounded up to whole chunks
+MAX_BLOCKS = getattr(settings, 'REGION_MAX_BLOCKS', 4_000_000)
+
+logger = logging.getLogger(__name__)
+
+# Running jobs, so they outlive the console connection that started them
+jobs = set()
+
+
+def start_job(coro):
+    task = asyncio.create_task(coro)
+    jobs.add(task)
+    task.add_done_callback(_job_done)
+    return task
+
+
+def _job_done(task):
+    jobs.discard(task)
+    # Nobody may be waiting for the result any more
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Region job failed", exc_info=task.exception())
+
+
+def make_box(x1, y1, z1, x2, y2, z2):
+    """Normalize two corners to (low, high), clamping y to the world height."""
+    low = (min(x1, x2), max(min(y1, y2), 0), min(z1, z2))
+    high = (max(x1, x2), min(max(y1, y2), CHUNK_HEIGHT - 1), max(z1, z2))
+    return low, high
+
+
+def box_volume(low, high):
+    return max(0, high[0] - low[0] + 1) * max(0, high[1] - low[1] + 1) * max(0, high[2] - low[2] + 1)
+
+
+def box_chunks(low, high):
+    return [
+        (cx, cz)
+        for cx in range(low[0] // CHUNK_SIZE, high[0] // CHUNK_SIZE + 1)
+        for cz in range(low[2] // CHUNK_SIZE, high[2] // CHUNK_SIZE + 1)
+    ]
+
+
+async def _write_batches(chunks, entries_for, progress):
+    total = len(chunks)
+    done = 0
+    written = 0
+    while done < total:
+        changes = {}
+        size = 0
+        while done < total and (not changes or size < BATCH_BLOCKS):
+            key = chunks[done]
+            entries = entries_for(key)
+            if entries:
+                changes[key] = entries
+                size += len(entries)
+            done += 1
+
+        await world_store.set_blocks(changes)
+        written += size
+        if progress is not None:
+            await progress(done, total)
+    return written
+
+
+async def fill(low, high, block, progress=None):
+    """Set every block of the box to ``block``. Returns the number written.
+
+    ``progress`` is awaited as ``progress(chunks_done, chunks_total)``
+    after each batch.
+    """
+    ys = range(low[1], high[1] + 1)
+
+    def entries_for(key):
+        cx, cz = key
+        xs = range(max(low[0], cx * CHUNK_SIZE), min(high[0], cx * CHUNK_SIZE + CHUNK_SIZE - 1) + 1)
+        zs = range(max(low[2], cz * CHUNK_SIZE), min(high[2], cz * CHUNK_SIZE + CHUNK_SIZE - 1) + 1)
+        return [(x, y, z, block) for x in xs for y in ys for z in zs]
+
+    return await _write_batches(box_chunks(low, high), entries_for, progress)
+
+
+async def read_box(low, high):
+    """Current blocks of a box, as an array indexed [x, y, z] from ``low``.
+
+    Generated terrain (see Terrain.blocks) with the stored modifications
+    over it.
+    """
+    world = await world_store.get_world()
+    terrain = Terrain(world.seed)
+    volume = np.empty([h - l + 1 for l, h in zip(low, high)], dtype=np.int16)
+
+    chunks = box_chunks(low, high)
+    for cx in sorted({cx for cx, cz in chunks}):
+        # A row of chunks at a time, so a long box never overflows the store's LRU
+        await world_store.load_region(cx, low[2] // CHUNK_SIZE, cx, high[2] // CHUNK_SIZE)
+        for cz in range(low[2] // CHUNK_SIZE, high[2] // CHUNK_SIZE + 1):
+            x0, x1 = max(low[0], cx * CHUNK_SIZE), min(high[0], cx * CHUNK_SIZE + CHUNK_SIZE - 1)
+            z0, z1 = max(low[2], cz * CHUNK_SIZE), min(high[2], cz * CHUNK_SIZE + CHUNK_SIZE - 1)
+            xs, zs = np.meshgrid(np.arange(x0, x1 + 1), np.arange(z0, z1 + 1), indexing='ij')
+            columns = await asyncio.to_thread(terrain.blocks, xs, zs)
+            volume[x0 - low[0]:x1 - low[0] + 1, :, z0 - low[2]:z1 - low[2] + 1] = (
+                columns[:, :, low[1]:high[1] + 1].transpose(0, 2, 1)
+            )
+            for key, block in world_store.cached_modifications(cx, cz).items():
+                x, y, z = parse_key(key)
+                if low[0] <= x <= high[0] and low[1] <= y <= high[1] and low[2] <= z <= high[2]:
+                    volume[x - low[0], y - low[1], z - low[2]] = block
+    return volume
+
+
+async def clone(low, high, dest, progress=None):
+    """Copy a box so its low corner lands on ``dest``.
+
+    Every block of the destination is written, generated terrain and air
+    included, so it ends up identical to the source. Blocks that would
+    land outside the world height are left out. Returns (low, high,
+    volume) of what was written, ``volume`` indexed [x, y, z] from ``low``.
+    """
+    # Read the whole source first so overlapping boxes copy the original blocks
+    volume = await read_box(low, high)
+
+    y0 = max(0, -dest[1])
+    y1 = min(volume.shape[1], CHUNK_HEIGHT - dest[1])
+    volume = volume[:, y0:max(y0, y1), :]
+    dest_low = (dest[0], dest[1] + y0, dest[2])
+    dest_high = tuple(l + n - 1 for l, n in zip(dest_low, volume.shape))
+    if not volume.size:
+        return dest_low, dest_high, volume
+
+    def entries_for(key):
+        cx, cz = key
+        x0, x1 = max(dest_low[0], cx * CHUNK_SIZE), min(dest_high[0], cx * CHUNK_SIZE + CHUNK_SIZE - 1)
+        z0, z1 = max(dest_low[2], cz * CHUNK_SIZE), min(dest_high[2], cz * CHUNK_SIZE + CHUNK_SIZE - 1)
+        xs, ys, zs = np.meshgrid(
+            np.arange(x0, x1 + 1), np.arange(dest_low[1], dest_high[1] + 1), np.arange(z0, z1 + 1),
+            indexing='ij',
+        )
+        part = volume[x0 - dest_low[0]:x1 - dest_low[0] + 1, :, z0 - dest_low[2]:z1 - dest_low[2] + 1]
+        return list(zip(xs.ravel().tolist(), ys.ravel().tolist(), zs.ravel().tolist(), part.ravel().tolist()))
+
+    await _write_batches(box_chunks(dest_low, dest_high), entries_for, progress)
+    return dest_low, dest_high, volume
@@ -0,0 +1,112 @@
+from channels.layers import get_channel_layer
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from voxel_server.ipc import in_loop, publish, subscribe
+
+from .cache import player_cache
+from .clock import world_clock
+from .entities import entity_simulation
+from .frames import players_list_frame, world_data_frame
+from .minimap import minimap_cache
+from .models import Chunk, Player, World
+from .occupancy import occupancy_index
+from .presence import players
+from .store import blocks_changed, world_store
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+@in_loop
+def invalidate_cached_player(sender, instance, **kwargs):
+    # Admin edits and deletions must not be overwritten by a stale cached row
+    player_cache.invalidate(instance.username)
+    publish("player_changed", instance.username)
+
+
+@subscribe("player_changed")
+def forget_remote_player(username):
+    player_cache.invalidate(username)
+
+
+@receiver(post_save, sender=Chunk)
+@in_loop
+def refresh_stored_chunk(sender, instance, **kwargs):
+    world_store.refresh_chunk(instance)
+    world_data_frame.invalidate((instance.x, instance.z))
+    # Block writes of the store reach other workers through blocks_changed
+    if kwargs.get("update_fields") is None:
+        publish("chunk_changed", [instance.x, instance.z])
+
+
+@receiver(post_delete, sender=Chunk)
+@in_loop
+def forget_stored_chunk(sender, instance, **kwargs):
+    world_store.refresh_chunk(instance, deleted=True)
+    world_data_frame.invalidate((instance.x, instance.z))
+    publish("chunk_changed", [instance.x, instance.z])
+
+
+@subscribe("chunk_changed")
+def forget_remote_chunk(key):
+    world_store.chunks.pop(tuple(key), None)
+    world_data_frame.invalidate(tuple(key))
+
+
+@receiver(post_save, sender=World)
+@in_loop
+def refresh_stored_world(sender, instance, **kwargs):
+    world_store.refresh_world(instance)
+    # Time, seed or motd changed
+    world_data_frame.invalidate()
+    publish("world_changed")
+
+
+@receiver(post_delete, sender=World)
+@in_loop
+def forget_stored_world(sender, instance, **kwargs):
+    world_store.refresh_world(instance, deleted=True)
+    world_data_frame.invalidate()
+    publish("world_changed")
+
+
+@subscribe("world_changed")
+def forget_remote_world(payload):
+    # Read again on next use
+    world_store.world = None
+    world_store.chunks.clear()
+    world_data_frame.invalidate()
+
+
+@receiver(blocks_changed)
+def update_minimap_tiles(sender, positions, **kwargs):
+    minimap_cache.blocks_changed(positions)
+
+
+@receiver(blocks_changed)
+def update_world_data_frame(sender, positions, **kwargs):
+    world_data_frame.blocks_changed(positions)
+
+
+@receiver(blocks_changed)
+def update_occupancy(sender, positions, blocks, **kwargs):
+    occupancy_index.blocks_changed(positions, blocks)
+
+
+@receiver(blocks_changed)
+def share_blocks(sender, positions, blocks, remote=False, **kwargs):
+    if not remote:
+        publish("blocks_changed", {"positions": positions, "blocks": blocks})
+
+
+@subscribe("blocks_changed")
+def apply_remote_blocks(payload):
+    world_store.apply_blocks([tuple(position) for position in payload["positions"]], payload["blocks"])
+
+
+@players.on_change
+def player_changed(channel):
+    players_list_frame.player_changed(channel, players.get(channel))
+    # Whichever worker the player is on, the per-host loops run in the leader
+    entity_simulation.start(get_channel_layer(), lambda: players)
+    world_clock.start(get_channel_layer())
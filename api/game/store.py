@@ -0,0 +1,247 @@
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.dispatch import Signal
+
+from voxel_server.ipc import is_shared
+
+from .models import World, Chunk
+
+CHUNK_SIZE = 16
+WORLD_NAME = "World 1"
+
+# Sent after blocks are written, with positions=[(x, y, z), ...] and the
+# matching block ids in blocks=[...]; remote=True when another worker
+# process wrote them
+blocks_changed = Signal()
+
+
+def chunk_coords(x, z):
+    return int(x) // CHUNK_SIZE, int(z) // CHUNK_SIZE
+
+
+def parse_key(key):
+    x, y, z = key.split(',')
+    return int(float(x)), int(float(y)), int(float(z))
+
+
+def merge_modifications(world, values):
+    """Write {(cx, cz): {key: block}} into the current Chunk rows.
+
+    The rows are read and written back in one transaction (IMMEDIATE on
+    sqlite, row locks elsewhere), so blocks another worker process wrote
+    to the same chunks meanwhile are kept. Returns the rows written.
+    """
+    try:
+        return _merge_modifications(world, values)
+    except IntegrityError:
+        # Another process created one of the rows: merge into it instead
+        return _merge_modifications(world, values)
+
+
+def _merge_modifications(world, values):
+    cxs = [cx for cx, cz in values]
+    czs = [cz for cx, cz in values]
+    with transaction.atomic():
+        rows = Chunk.objects.select_for_update().filter(
+            world=world, x__range=(min(cxs), max(cxs)), z__range=(min(czs), max(czs)),
+        )
+        found = [chunk for chunk in rows if (chunk.x, chunk.z) in values]
+        for chunk in found:
+            chunk.modifications.update(values[(chunk.x, chunk.z)])
+        keys = {(chunk.x, chunk.z) for chunk in found}
+        created = [
+            Chunk(world=world, x=cx, z=cz, modifications=dict(entries))
+            for (cx, cz), entries in values.items() if (cx, cz) not in keys
+        ]
+        if found:
+            Chunk.objects.bulk_update(found, ['modifications'])
+        if created:
+            Chunk.objects.bulk_create(created)
+    return found + created
+
+
+class WorldStore:
+    """In-memory mirror of the World row and the Chunk rows read so far.
+
+    Chunk rows are loaded on first use and kept, so a block update only
+    costs the UPDATE of its chunk and server-side caches can read
+    modifications without going back to the database. Chunks known to have
+    no row are remembered as ``None``. At most ``max_chunks`` entries are
+    kept; the least recently used are read again when next needed.
+
+    With several worker processes the mirror may miss a write made by
+    another one a moment ago, so writes are merged into the rows as read
+    again under the write lock (see ``merge_modifications``).
+    """
+
+    def __init__(self, max_chunks=4096):
+        self.max_chunks = max_chunks
+        self.world = None
+        self.chunks = OrderedDict()
+
+    async def get_world(self):
+        if self.world is None:
+            self.world, created = await World.objects.aget_or_create(name=WORLD_NAME)
+        return self.world
+
+    async def load_region(self, cx0, cz0, cx1, cz1):
+        """Make sure every chunk in the inclusive range is cached."""
+        wanted = []
+        for cx in range(cx0, cx1 + 1):
+            for cz in range(cz0, cz1 + 1):
+                if (cx, cz) in self.chunks:
+                    self.chunks.move_to_end((cx, cz))
+                else:
+                    wanted.append((cx, cz))
+        if not wanted:
+            return
+
+        world = await self.get_world()
+        rows = Chunk.objects.filter(world=world, x__range=(cx0, cx1), z__range=(cz0, cz1))
+        async for chunk in rows:
+            self.chunks.setdefault((chunk.x, chunk.z), chunk)
+        for key in wanted:
+            self.chunks.setdefault(key, None)
+
+        # The region just read is the most recent, so it is never what goes
+        while len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False)
+
+    async def get_chunk(self, cx, cz, create=False):
+        await self.load_region(cx, cz, cx, cz)
+
+        chunk = self.chunks[(cx, cz)]
+        if chunk is None and create:
+            world = await self.get_world()
+            chunk, created = await Chunk.objects.aget_or_create(world=world, x=cx, z=cz)
+            self.chunks[(cx, cz)] = chunk
+        return chunk
+
+    def cached_modifications(self, cx, cz):
+        """Modifications of an already loaded chunk (empty if unknown)."""
+        chunk = self.chunks.get((cx, cz))
+        return chunk.modifications if chunk is not None else {}
+
+    async def set_block(self, position, block_type):
+        cx, cz = chunk_coords(position['x'], position['z'])
+        key = f"{position['x']},{position['y']},{position['z']}"
+        if is_shared():
+            await self.load_region(cx, cz, cx, cz)
+            await self.merge_rows(await self.get_world(), {(cx, cz): {key: block_type}})
+        else:
+            chunk = await self.get_chunk(cx, cz, create=True)
+            # Saved from a copy, like set_blocks: a failed write leaves the mirror alone
+            saved = Chunk(
+                pk=chunk.pk, world_id=chunk.world_id, x=cx, z=cz,
+                modifications={**chunk.modifications, key: block_type},
+            )
+            await saved.asave(update_fields=['modifications'])
+            self.chunks[(cx, cz)] = saved
+
+        blocks_changed.send(
+            sender=WorldStore,
+            positions=[(int(position['x']), int(position['y']), int(position['z']))],
+            blocks=[block_type],
+        )
+
+    async def set_blocks(self, changes):
+        """Apply {(cx, cz): [(x, y, z, block), ...]}, writing each chunk once."""
+        if not changes:
+            return
+        world = await self.get_world()
+        cxs = [cx for cx, cz in changes]
+        czs = [cz for cx, cz in changes]
+        await self.load_region(min(cxs), min(czs), max(cxs), max(czs))
+
+        values, positions, block_ids = {}, [], []
+        for (cx, cz), entries in changes.items():
+            values[(cx, cz)] = {f"{x},{y},{z}": block for x, y, z, block in entries}
+            positions.extend([(x, y, z) for x, y, z, block in entries])
+            block_ids.extend([block for x, y, z, block in entries])
+
+        if is_shared():
+            await self.merge_rows(world, values)
+        else:
+            await self.write_rows(world, values)
+        blocks_changed.send(sender=WorldStore, positions=positions, blocks=block_ids)
+
+    async def merge_rows(self, world, values):
+        """Write {(cx, cz): {key: block}} into the rows as they are now."""
+        for chunk in await sync_to_async(merge_modifications)(world, values):
+            self.chunks[(chunk.x, chunk.z)] = chunk
+
+    async def write_rows(self, world, values):
+        """Write {(cx, cz): {key: block}} over the mirrored rows."""
+        # Rows are written from copies; the mirror only changes once they are saved
+        updated, created = [], []
+        for (cx, cz), entries in values.items():
+            chunk = self.chunks.get((cx, cz))
+            if chunk is None:
+                created.append(Chunk(world=world, x=cx, z=cz, modifications=entries))
+            else:
+                updated.append(Chunk(
+                    pk=chunk.pk, world=world, x=cx, z=cz,
+                    modifications={**chunk.modifications, **entries},
+                ))
+
+        if updated:
+            await Chunk.objects.abulk_update(updated, ['modifications'])
+        if created:
+            # Rows created meanwhile (another worker, the admin) are skipped here
+            # and merged into below
+            await Chunk.objects.abulk_create(created, ignore_conflicts=True)
+            keys = {(chunk.x, chunk.z) for chunk in created}
+            cxs = [cx for cx, cz in keys]
+            czs = [cz for cx, cz in keys]
+            rows = Chunk.objects.filter(
+                world=world,
+                x__range=(min(cxs), max(cxs)), z__range=(min(czs), max(czs)),
+            )
+            created, merged = [], []
+            async for chunk in rows:
+                if (chunk.x, chunk.z) not in keys:
+                    continue
+                created.append(chunk)
+                wanted = values[(chunk.x, chunk.z)]
+                if any(chunk.modifications.get(key) != block for key, block in wanted.items()):
+                    chunk.modifications.update(wanted)
+                    merged.append(chunk)
+            if merged:
+                await Chunk.objects.abulk_update(merged, ['modifications'])
+
+        # Bulk writes skip post_save, so the mirror is updated here
+        for chunk in updated + created:
+            self.chunks[(chunk.x, chunk.z)] = chunk
+
+    def apply_blocks(self, positions, blocks):
+        """Mirror blocks written by another worker process, then announce them here."""
+        for (x, y, z), block in zip(positions, blocks):
+            key = chunk_coords(x, z)
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                chunk.modifications[f"{x},{y},{z}"] = block
+            elif key in self.chunks:
+                # The row was created there: read it on next use
+                del self.chunks[key]
+        blocks_changed.send(sender=WorldStore, positions=positions, blocks=blocks, remote=True)
+
+    def refresh_chunk(self, chunk, deleted=False):
+        # Keep the mirror in sync with writes made outside the store (admin)
+        if self.world is None or chunk.world_id != self.world.pk:
+            return
+        self.chunks[(chunk.x, chunk.z)] = None if deleted else chunk
+
+    def refresh_world(self, world, deleted=False):
+        if self.world is None or world.pk != self.world.pk:
+            return
+        if deleted:
+            self.world = None
+            self.chunks.clear()
+        else:
+            self.world = world
+
+
+world_store = WorldStore(max_chunks=getattr(settings, 'WORLD_STORE_CHUNKS', 4096))
@@ -0,0 +1,482 @@
+"""Server-side port of the client terrain generator (src/World/World.js).
+
+The client generates terrain from the world seed with simplex-noise and a
+small LCG. This module reproduces the same noise tables and height/biome
+functions with NumPy so the server can reason about generated terrain
+(heightmaps, surface blocks) without any client involvement. Every
+function takes arrays of world coordinates and evaluates them in one pass.
+
+Trees, villages and other decorations are not ported, nor are ores; only
+the terrain shape, its caves and the blocks it is made of.
+"""
+import math
+
+import numpy as np
+
+from . import blocks
+
+CHUNK_SIZE = 16
+CHUNK_HEIGHT = 256
+SEA_LEVEL = 40
+
+BIOMES = (
+    'Ocean', 'Beach', 'Mountain', 'Desert', 'Savanna', 'Mushrooms',
+    'Swamp', 'Jungle', 'Birch Forest', 'Pine Forest', 'Plains',
+)
+OCEAN, BEACH, MOUNTAIN, DESERT, SAVANNA, MUSHROOMS, SWAMP, JUNGLE, BIRCH_FOREST, PINE_FOREST, PLAINS = range(len(BIOMES))
+
+_F2 = 0.5 * (math.sqrt(3.0) - 1.0)
+_G2 = (3.0 - math.sqrt(3.0)) / 6.0
+_F3 = 1.0 / 3.0
+_G3 = 1.0 / 6.0
+
+_GRAD2 = np.array([1, 1, -1, 1, 1, -1, -1, -1, 1, 0, -1, 0, 1, 0, -1, 0, 0, 1, 0, -1, 0, 1, 0, -1], dtype=np.float64)
+_GRAD3 = np.array([
+    1, 1, 0, -1, 1, 0, 1, -1, 0, -1, -1, 0, 1, 0, 1, -1, 0, 1,
+    1, 0, -1, -1, 0, -1, 0, 1, 1, 0, -1, 1, 0, 1, -1, 0, -1, -1,
+], dtype=np.float64)
+
+
+class SeededRandom:
+    """Same LCG as src/Utils/SeededRandom.js (JS % semantics)."""
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def random(self):
+        self.seed = math.fmod(self.seed * 9301 + 49297, 233280)
+        return self.seed / 233280
+
+
+def _lcg(seed):
+    # Vectorized SeededRandom.random(): returns (next_seed, value)
+    seed = np.fmod(seed * 9301 + 49297, 233280)
+    return seed, seed / 233280
+
+
+def _build_permutation_table(random):
+    p = list(range(256))
+    for i in range(255):
+        r = i + int(random() * (256 - i))
+        p[i], p[r] = p[r], p[i]
+    return np.array(p + p, dtype=np.int64)
+
+
+def _smoothstep(edge0, edge1, x):
+    t = np.clip((x - edge0) / (edge1 - edge0), 0, 1)
+    return t * t * (3 - 2 * t)
+
+
+class Noise2D:
+    """Vectorized equivalent of simplex-noise's createNoise2D."""
+
+    def __init__(self, random):
+        self.perm = _build_permutation_table(random)
+        self.grad_x = _GRAD2[(self.perm % 12) * 2]
+        self.grad_y = _GRAD2[(self.perm % 12) * 2 + 1]
+
+    def __call__(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        perm, gx, gy = self.perm, self.grad_x, self.grad_y
+
+        s = (x + y) * _F2
+        i = np.floor(x + s)
+        j = np.floor(y + s)
+        t = (i + j) * _G2
+        x0 = x - (i - t)
+        y0 = y - (j - t)
+        i1 = (x0 > y0).astype(np.int64)
+        j1 = 1 - i1
+        x1 = x0 - i1 + _G2
+        y1 = y0 - j1 + _G2
+        x2 = x0 - 1.0 + 2.0 * _G2
+        y2 = y0 - 1.0 + 2.0 * _G2
+        ii = i.astype(np.int64) & 255
+        jj = j.astype(np.int64) & 255
+
+        t0 = 0.5 - x0 * x0 - y0 * y0
+        gi0 = ii + perm[jj]
+        n0 = np.where(t0 >= 0, (t0 * t0) * (t0 * t0) * (gx[gi0] * x0 + gy[gi0] * y0), 0.0)
+
+        t1 = 0.5 - x1 * x1 - y1 * y1
+        gi1 = ii + i1 + perm[jj + j1]
+        n1 = np.where(t1 >= 0, (t1 * t1) * (t1 * t1) * (gx[gi1] * x1 + gy[gi1] * y1), 0.0)
+
+        t2 = 0.5 - x2 * x2 - y2 * y2
+        gi2 = ii + 1 + perm[jj + 1]
+        n2 = np.where(t2 >= 0, (t2 * t2) * (t2 * t2) * (gx[gi2] * x2 + gy[gi2] * y2), 0.0)
+
+        return 70.0 * (n0 + n1 + n2)
+
+
+class Noise3D:
+    """Vectorized equivalent of simplex-noise's createNoise3D."""
+
+    def __init__(self, random):
+        self.perm = _build_permutation_table(random)
+        self.grad_x = _GRAD3[(self.perm % 12) * 3]
+        self.grad_y = _GRAD3[(self.perm % 12) * 3 + 1]
+        self.grad_z = _GRAD3[(self.perm % 12) * 3 + 2]
+
+    def __call__(self, x, y, z):
+        x, y, z = np.broadcast_arrays(
+            np.asarray(x, dtype=np.float64),
+            np.asarray(y, dtype=np.float64),
+            np.asarray(z, dtype=np.float64),
+        )
+        perm, gx, gy, gz = self.perm, self.grad_x, self.grad_y, self.grad_z
+
+        s = (x + y + z) * _F3
+        i = np.floor(x + s)
+        j = np.floor(y + s)
+        k = np.floor(z + s)
+        t = (i + j + k) * _G3
+        x0 = x - (i - t)
+        y0 = y - (j - t)
+        z0 = z - (k - t)
+
+        xy = x0 >= y0
+        yz = y0 >= z0
+        xz = x0 >= z0
+        i1 = (xy & (yz | xz)).astype(np.int64)
+        j1 = (~xy & yz).astype(np.int64)
+        k1 = ((xy & ~yz & ~xz) | (~xy & ~yz)).astype(np.int64)
+        i2 = (xy | (yz & xz)).astype(np.int64)
+        j2 = ((xy & yz) | ~xy).astype(np.int64)
+        k2 = ((xy & ~yz) | (~xy & ~(yz & xz))).astype(np.int64)
+
+        x1 = x0 - i1 + _G3
+        y1 = y0 - j1 + _G3
+        z1 = z0 - k1 + _G3
+        x2 = x0 - i2 + 2.0 * _G3
+        y2 = y0 - j2 + 2.0 * _G3
+        z2 = z0 - k2 + 2.0 * _G3
+        x3 = x0 - 1.0 + 3.0 * _G3
+        y3 = y0 - 1.0 + 3.0 * _G3
+        z3 = z0 - 1.0 + 3.0 * _G3
+        ii = i.astype(np.int64) & 255
+        jj = j.astype(np.int64) & 255
+        kk = k.astype(np.int64) & 255
+
+        def corner(cx, cy, cz, gi):
+            t = 0.6 - cx * cx - cy * cy - cz * cz
+            t2 = t * t
+            return np.where(t < 0, 0.0, t2 * t2 * (gx[gi] * cx + gy[gi] * cy + gz[gi] * cz))
+
+        n0 = corner(x0, y0, z0, ii + perm[jj + perm[kk]])
+        n1 = corner(x1, y1, z1, ii + i1 + perm[jj + j1 + perm[kk + k1]])
+        n2 = corner(x2, y2, z2, ii + i2 + perm[jj + j2 + perm[kk + k2]])
+        n3 = corner(x3, y3, z3, ii + 1 + perm[jj + 1 + perm[kk + 1]])
+
+        return 32.0 * (n0 + n1 + n2 + n3)
+
+
+class Terrain:
+    """Terrain functions for one world seed. Mirrors World.js."""
+
+    def __init__(self, seed):
+        self.seed = seed
+        rng = SeededRandom(seed)
+        # Same creation order as World.setupNoise(), they share one LCG stream
+        self.noise3d = Noise3D(rng.random)
+        self.noise2d = Noise2D(rng.random)
+        self.biome_noise = Noise2D(rng.random)
+        self.humidity_noise = Noise2D(rng.random)
+        self.river_noise = Noise2D(rng.random)
+        self.river_noise2 = Noise2D(rng.random)
+        self.river_warp_x = Noise2D(rng.random)
+        self.river_warp_z = Noise2D(rng.random)
+
+    def _nearest_feature(self, x, z, grid_size, salt, fx, fz, chance, radius=None):
+        # Shared shape of getVolcanoData/getLakeData: one candidate per grid cell
+        grid_x = np.floor(x / grid_size)
+        grid_z = np.floor(z / grid_size)
+        closest = np.full(x.shape, np.inf)
+        found = np.zeros(x.shape, dtype=bool)
+        feature_radius = np.zeros(x.shape)
+
+        for dx in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                gx = grid_x + dx
+                gz = grid_z + dz
+                seed = np.fmod(self.seed * salt + gx * fx + gz * fz, 1)
+                seed, roll = _lcg(seed)
+                seed, rx = _lcg(seed)
+                seed, rz = _lcg(seed)
+                fx_pos = gx * grid_size + rx * grid_size
+                fz_pos = gz * grid_size + rz * grid_size
+                dist = np.sqrt((x - fx_pos) ** 2 + (z - fz_pos) ** 2)
+
+                better = (roll < chance) & (dist < closest)
+                closest = np.where(better, dist, closest)
+                found |= better
+                if radius is not None:
+                    seed, rr = _lcg(seed)
+                    feature_radius = np.where(better, radius[0] + rr * radius[1], feature_radius)
+
+        return found, closest, feature_radius
+
+    def volcano(self, x, z):
+        found, dist, _ = self._nearest_feature(x, z, 512, 10000, 3412.123, 9871.321, 0.1)
+        return found, dist
+
+    def lake(self, x, z):
+        return self._nearest_feature(x, z, 350, 30000, 5123.123, 8901.321, 0.25, radius=(12, 28))
+
+    def river(self, x, z):
+        warp_scale = 0.002
+        warp_strength = 120
+        wx = x + self.river_warp_x(x * warp_scale, z * warp_scale) * warp_strength
+        wz = z + self.river_warp_z(x * warp_scale, z * warp_scale) * warp_strength
+
+        n1 = self.river_noise(wx * 0.0025, wz * 0.001)
+        n2 = self.river_noise2(wx * 0.001, wz * 0.0025)
+        detail = self.noise2d(x * 0.01, z * 0.01) * 0.015
+        r1 = np.abs(n1) + detail * 0.5
+        r2 = np.abs(n2) + detail * 0.5
+
+        width_noise = self.noise2d(x * 0.003, z * 0.003)
+        base_width = 0.035 + width_noise * 0.012
+
+        first = r1 < r2
+        river_dist = np.where(first, r1, r2)
+        width = np.where(first, base_width, base_width * 0.65)
+        is_river = river_dist < width
+        t = np.where(is_river, 1 - river_dist / width, 0)
+        depth = np.floor(t * 4) + 2
+        return is_river, depth, river_dist, width
+
+    def biome(self, x, z):
+        x = np.asarray(x, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        elevation = self.biome_noise(x * 0.001, z * 0.001)
+        humidity = self.humidity_noise(x * 0.001, z * 0.001)
+        temp = self.biome_noise(x * 0.002 + 500, z * 0.002 + 500)
+
+        return np.select(
+            [
+                elevation < -0.2,
+                elevation < -0.1,
+                elevation > 0.6,
+                humidity < -0.4,
+                humidity < -0.15,
+                humidity > 0.6,
+                humidity > 0.35,
+                humidity > 0.15,
+                temp > 0.2,
+                temp < -0.2,
+            ],
+            [OCEAN, BEACH, MOUNTAIN, DESERT, SAVANNA, MUSHROOMS, SWAMP, JUNGLE, BIRCH_FOREST, PINE_FOREST],
+            PLAINS,
+        )
+
+    def height(self, x, z):
+        x = np.asarray(x, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        sea = SEA_LEVEL
+        elevation = self.biome_noise(x * 0.001, z * 0.001)
+        humidity = self.humidity_noise(x * 0.001, z * 0.001)
+        local = self.noise2d(x * 0.02, z * 0.02)
+
+        # Volcanoes replace the whole height profile
+        has_volcano, volcano_dist = self.volcano(x, z)
+        volcano_radius = 150
+        crater_radius = 20
+        base = sea + 10
+        peak = 240
+        volcano_h = base + (peak - base) * (1 - np.power(volcano_dist / volcano_radius, 0.8))
+        rim = base + (peak - base) * (1 - math.pow(crater_radius / volcano_radius, 0.8))
+        crater_h = 5 + (rim - 5) * np.power(volcano_dist / crater_radius, 4)
+        volcano_h = np.where(volcano_dist < crater_radius, crater_h, volcano_h) + local * 3
+        in_volcano = has_volcano & (volcano_dist < volcano_radius)
+
+        elev_blend = 0.06
+        hum_blend = 0.08
+
+        ocean_t = np.clip((elevation + 0.2) / -0.8, 0, 1)
+        ocean_h = sea - (ocean_t * 30) + (local * 2)
+        beach_t = np.clip((elevation + 0.2) / 0.1, 0, 1)
+        beach_h = sea + (beach_t * 3) + (local * 1)
+
+        land_base = sea + 3 + (elevation + 0.1) * 30
+        desert_h = land_base + local * 2
+        savanna_h = land_base + local * 3
+        swamp_h = sea + 1 + local * 2
+        jungle_h = land_base + local * 6
+        mushroom_h = land_base + local * 8
+        forest_h = land_base + local * 5
+
+        mountain_factor = np.maximum(0, (elevation - 0.6) * 2.5)
+        mountain_h = land_base + np.power(mountain_factor, 1.2) * 180 + (local * 10)
+        mountain_h = np.where(mountain_factor > 0.5, np.maximum(mountain_h, 100 + local * 10), mountain_h)
+
+        def step(edge):
+            return _smoothstep(edge - hum_blend, edge + hum_blend, humidity)
+
+        w_desert = 1 - step(-0.4)
+        w_savanna = step(-0.4) * (1 - step(-0.15))
+        w_forest = step(-0.15) * (1 - step(0.15))
+        w_jungle = step(0.15) * (1 - step(0.35))
+        w_swamp = step(0.35) * (1 - step(0.6))
+        w_mushroom = step(0.6)
+        w_total = w_desert + w_savanna + w_forest + w_jungle + w_swamp + w_mushroom
+        with np.errstate(invalid='ignore', divide='ignore'):
+            land_h = np.where(
+                w_total > 0,
+                (w_desert * desert_h + w_savanna * savanna_h + w_forest * forest_h
+                 + w_jungle * jungle_h + w_swamp * swamp_h + w_mushroom * mushroom_h) / w_total,
+                forest_h,
+            )
+
+        ocean_to_beach = _smoothstep(-0.2 - elev_blend, -0.2 + elev_blend, elevation)
+        beach_to_land = _smoothstep(-0.1 - elev_blend, -0.1 + elev_blend, elevation)
+        land_to_mountain = _smoothstep(0.6 - elev_blend, 0.6 + elev_blend, elevation)
+
+        height = ocean_h * (1 - ocean_to_beach) + beach_h * ocean_to_beach
+        height = height * (1 - beach_to_land) + land_h * beach_to_land
+        height = height * (1 - land_to_mountain) + mountain_h * land_to_mountain
+
+        # Rivers and lakes only carve ordinary land
+        is_ocean = elevation < -0.2
+        is_beach = (elevation >= -0.2) & (elevation < -0.1)
+        is_mountain = elevation > 0.6
+        is_desert = ~is_ocean & ~is_beach & ~is_mountain & (humidity < -0.4)
+        carve = ~is_ocean & ~is_beach & ~is_mountain & ~is_desert
+
+        if carve.any():
+            is_river, depth, river_dist, width = self.river(x, z)
+            river_bed = is_river & (height > sea - 5)
+            bank = ~river_bed & (river_dist < width * 3) & (height > sea + 2)
+            bank_blend = np.clip((river_dist - width) / (width * 2), 0, 1)
+            carved = np.where(river_bed, np.minimum(height, sea - depth), height)
+            carved = np.where(bank, (sea + 1) + (carved - (sea + 1)) * bank_blend, carved)
+
+            has_lake, lake_dist, lake_radius = self.lake(x, z)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                lt = lake_dist / lake_radius
+                lake_bed = has_lake & (lake_dist < lake_radius)
+                shore = has_lake & ~lake_bed & (lake_dist < lake_radius * 1.4) & (carved > sea + 2)
+                shore_blend = np.clip((lake_dist - lake_radius) / (lake_radius * 0.4), 0, 1)
+                carved = np.where(lake_bed, np.minimum(carved, sea + 1 - (1 - lt * lt) * 7), carved)
+                carved = np.where(shore, (sea + 2) + (carved - (sea + 2)) * shore_blend, carved)
+
+            height = np.where(carve, carved, height)
+
+        height = np.where(in_volcano, volcano_h, height)
+        return np.clip(np.floor(height), 1, CHUNK_HEIGHT - 1).astype(np.int32)
+
+    def surface(self, x, z):
+        """Return (height, top_y, top_block) for each column.
+
+        ``height`` is getHeight() (first air block above the ground),
+        ``top_y``/``top_block`` describe the highest generated block
+        as seen from above, including sea and river water.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        height = self.height(x, z)
+        biome = self.biome(x, z)
+        ground_y = height - 1
+
+        has_volcano, volcano_dist = self.volcano(x, z)
+        crater = has_volcano & (volcano_dist < 25)
+        river_bed = (height < SEA_LEVEL) & (biome != OCEAN) & (biome != BEACH)
+        top_block = np.select(
+            [
+                crater & (ground_y < 15),
+                crater,
+                river_bed,
+                (biome == DESERT) | (biome == BEACH) | (biome == OCEAN),
+                biome == MUSHROOMS,
+                (biome == MOUNTAIN) & (ground_y > 130),
+                biome == MOUNTAIN,
+            ],
+            [blocks.MAGMA, blocks.STONE, blocks.SAND, blocks.SAND, blocks.MYCELIUM, blocks.SNOW, blocks.STONE],
+            blocks.GRASS,
+        )
+
+        water = (height <= SEA_LEVEL) & ((biome == OCEAN) | (biome == BEACH) | (height < SEA_LEVEL))
+        top_y = np.where(water, SEA_LEVEL, ground_y)
+        top_block = np.where(water, blocks.WATER, top_block)
+        return height, top_y.astype(np.int32), top_block.astype(np.int32)
+
+    def solid(self, x, z):
+        """Return which generated blocks of each column are solid.
+
+        The result has shape ``x.shape + (CHUNK_HEIGHT,)``. Caves are carved
+        like Chunk.generateData(); water and decorations count as non-solid.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        return self._solid(x, z, self.height(x, z), self._crater(x, z))
+
+    def blocks(self, x, z):
+        """Return the generated block id of every block of each column.
+
+        Same shape as ``solid()``. Follows Chunk.generateData() except that
+        ores and stone variants are plain stone, the random magma of crater
+        walls is stone, and decorations (trees, cacti) are left out.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+        height = self.height(x, z)
+        crater = self._crater(x, z)
+        solid = self._solid(x, z, height, crater)
+
+        biome = self.biome(x, z)[..., None]
+        h = height[..., None]
+        y = np.arange(CHUNK_HEIGHT)
+        depth = h - 1 - y  # 0 for the top ground block
+        stone = np.where(y < 16, blocks.DEEPSLATE, blocks.STONE)
+        river_bed = (h < SEA_LEVEL) & (biome != OCEAN) & (biome != BEACH)
+        bed_hash = np.abs(np.sin(x * 0.5 + z * 0.7))[..., None] % 1
+        bed = np.select([bed_hash < 0.25, bed_hash < 0.45], [blocks.GRAVEL, blocks.CLAY], blocks.SAND)
+        ground = np.select(
+            [
+                crater[..., None],
+                river_bed & (depth == 0),
+                river_bed & (depth < 3),
+                river_bed,
+                (biome == DESERT) | (biome == BEACH) | (biome == OCEAN),
+                (biome == MUSHROOMS) & (depth == 0),
+                biome == MUSHROOMS,
+                (biome == MOUNTAIN) & (depth == 0) & (y > 130),
+                (biome == MOUNTAIN) & (depth < 3),
+                biome == MOUNTAIN,
+                (biome == SWAMP) & (depth == 1),
+                depth == 0,
+                depth < 3,
+            ],
+            [
+                np.where(y < 15, blocks.MAGMA, blocks.STONE),
+                bed, blocks.SAND, stone, blocks.SAND, blocks.MYCELIUM, blocks.DIRT,
+                blocks.SNOW, blocks.STONE, stone, blocks.CLAY, blocks.GRASS, blocks.DIRT,
+            ],
+            stone,
+        )
+
+        water = (y >= h) & (y <= SEA_LEVEL) & ((biome == OCEAN) | (biome == BEACH) | (h < SEA_LEVEL))
+        result = np.where(solid, ground, np.where(water, blocks.WATER, blocks.AIR)).astype(np.int16)
+        result[..., 0] = blocks.BEDROCK
+        return result
+
+    def _crater(self, x, z):
+        has_volcano, volcano_dist = self.volcano(x, z)
+        return has_volcano & (volcano_dist < 25)
+
+    def _solid(self, x, z, height, crater):
+        crater = crater[..., None]
+        top = int(height.max())
+        y = np.arange(top)
+        h = height[..., None]
+        wx = x[..., None]
+        wz = z[..., None]
+        cave = self.noise3d(wx * 0.05, y * 0.05, wz * 0.05) > 0.4
+        entrance = self.noise3d(wx * 0.03, y * 0.05, wz * 0.03) > 0.6
+        carved = ((y < h - 3) & cave) | ((y > h - 10) & entrance)
+
+        solid = np.zeros(x.shape + (CHUNK_HEIGHT,), dtype=bool)
+        solid[..., :top] = (y < h) & (crater | ~carved)
+        solid[..., 0] = True  # bedrock
+        return solid
@@ -1,3 +1,798 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import os
+import tempfile
+import zlib
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from . import benchmarks, blocks, regions
+from .cache import PlayerCache
+from .clock import WorldClock
+from .consumers import GameConsumer
+from .entities import CHASE, CREEPER, PIG, WANDER, ZOMBIE, EntitySimulation, EntityWorld
+from .frames import CachedFrame, PlayersListFrame, SplicedFrame, WorldDataFrame
+from .minimap import MinimapCache
+from .models import Chunk, Player, World
+from .occupancy import RESYNC_UPDATES, MovementValidator, OccupancyIndex, nearby_chunks, occupancy_index
+from .regions import jobs, start_job
+from .store import CHUNK_SIZE, WorldStore, world_store
+from .terrain import SeededRandom, Terrain
+from .throttle import InboundLimiter, TokenBucket, inbound_stats, peek_type
+
+
+class PlayerCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = PlayerCache(max_size=2, ttl=10)
+
+    def test_get_returns_cached_row(self):
+        player = Player(username="alice")
+        self.cache.set(player)
+        self.assertIs(self.cache.get("alice"), player)
+        self.assertIsNone(self.cache.get("bob"))
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch("game.cache.time.monotonic", return_value=100):
+            self.cache.set(Player(username="alice"))
+        with mock.patch("game.cache.time.monotonic", return_value=109):
+            self.assertIsNotNone(self.cache.get("alice"))
+        with mock.patch("game.cache.time.monotonic", return_value=111):
+            self.assertIsNone(self.cache.get("alice"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set(Player(username="alice"))
+        self.cache.set(Player(username="bob"))
+        self.cache.get("alice")
+        self.cache.set(Player(username="carol"))
+        self.assertIsNotNone(self.cache.get("alice"))
+        self.assertIsNone(self.cache.get("bob"))
+        self.assertIsNotNone(self.cache.get("carol"))
+
+    def test_invalidate(self):
+        self.cache.set(Player(username="alice"))
+        self.cache.invalidate("alice")
+        self.cache.invalidate("nobody")
+        self.assertIsNone(self.cache.get("alice"))
+
+
+class SolidBlocks:
+    """Occupancy index stand-in with an explicit set of solid blocks."""
+
+    def __init__(self, solid=()):
+        self.solid = set(solid)
+        self.version = 0
+
+    def is_solid(self, x, y, z):
+        return np.array([
+            (math.floor(a), math.floor(b), math.floor(c)) in self.solid
+            for a, b, c in zip(np.atleast_1d(x), np.atleast_1d(y), np.atleast_1d(z))
+        ], dtype=bool)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        with mock.patch("game.throttle.time.monotonic", return_value=100):
+            bucket = TokenBucket(3, 2)
+            self.assertEqual([bucket.allow() for _ in range(4)], [True, True, True, False])
+        with mock.patch("game.throttle.time.monotonic", return_value=100.5):
+            self.assertTrue(bucket.allow())
+            self.assertFalse(bucket.allow())
+        with mock.patch("game.throttle.time.monotonic", return_value=200):
+            # Refills up to the capacity, not beyond
+            self.assertTrue(bucket.allow(cost=3))
+            self.assertFalse(bucket.allow())
+
+
+class InboundLimiterTests(SimpleTestCase):
+    def setUp(self):
+        inbound_stats.clear()
+        self.limiter = InboundLimiter(total=(5, 1), rates={"update": (2, 1)}, default=(1, 1), max_bytes=50)
+
+    def test_oversized_and_connection_limits(self):
+        self.assertFalse(self.limiter.allow_frame("x" * 51))
+        self.assertEqual([self.limiter.allow_frame("{}") for _ in range(6)], [True] * 5 + [False])
+        self.assertEqual(inbound_stats["oversized"], 1)
+        self.assertEqual(inbound_stats["throttled.connection"], 1)
+
+    def test_per_type_limits(self):
+        self.assertEqual([self.limiter.allow_type("update") for _ in range(3)], [True, True, False])
+        # Unknown types share one bucket
+        self.assertTrue(self.limiter.allow_type("made_up"))
+        self.assertFalse(self.limiter.allow_type("other_made_up"))
+        self.assertEqual(set(self.limiter.buckets), {"update", "other"})
+        self.assertEqual(inbound_stats["throttled.update"], 1)
+        self.assertEqual(inbound_stats["throttled.other"], 1)
+
+    def test_peek_type(self):
+        self.assertEqual(peek_type('{"type": "update", "position": {}}'), "update")
+        self.assertIsNone(peek_type('{"position": {}, "type": "update"}'))
+        self.assertIsNone(peek_type("not json"))
+
+
+class MovementValidatorTests(SimpleTestCase):
+    def make(self, solid=()):
+        return MovementValidator(SolidBlocks(solid), (0.5, 70.5, 0.5), max_speed=10, now=0)
+
+    def test_speed_budget(self):
+        validator = self.make()
+        self.assertTrue(validator.check((5.5, 70.5, 0.5), 0.5))
+        self.assertFalse(validator.check((50.5, 70.5, 0.5), 1.0))
+        self.assertEqual(validator.position, (5.5, 70.5, 0.5))
+
+    def test_walls_block_moves(self):
+        wall = [(3, y, z) for y in range(65, 75) for z in range(-2, 3)]
+        validator = self.make(wall)
+        self.assertFalse(validator.check((5.5, 70.5, 0.5), 1.0))
+        self.assertFalse(validator.check((3.5, 70.5, 0.5), 1.0))
+        self.assertTrue(validator.check((2.5, 70.5, 0.5), 1.0))
+
+    def test_consistent_rejected_moves_resync_nearby(self):
+        # A wall the client no longer has, e.g. a door opened meanwhile
+        validator = self.make([(3, y, z) for y in range(65, 75) for z in range(-2, 3)])
+        x = 4.5
+        for n in range(RESYNC_UPDATES):
+            self.assertFalse(validator.check((x, 70.5, 0.5), 1 + n * 0.05))
+            x += 0.1
+        self.assertTrue(validator.check((x, 70.5, 0.5), 1 + RESYNC_UPDATES * 0.05))
+        self.assertEqual(validator.position, (x, 70.5, 0.5))
+
+    def test_far_positions_are_never_adopted(self):
+        validator = self.make()
+        x = 1000.5
+        for n in range(RESYNC_UPDATES * 5):
+            self.assertFalse(validator.check((x, 70.5, 0.5), 1 + n * 0.05))
+            x += 0.2
+        self.assertEqual(validator.position, (0.5, 70.5, 0.5))
+
+    def test_resync_accepts_moves_from_new_position(self):
+        validator = self.make()
+        validator.resync((1000.5, 70.5, 0.5))
+        self.assertTrue(validator.check((1001.5, 70.5, 0.5), 0.1))
+
+
+class OccupancyIndexTests(TestCase):
+    def setUp(self):
+        world_store.world = None
+        world_store.chunks.clear()
+        self.index = OccupancyIndex()
+
+    async def test_load_packs_terrain_and_modifications(self):
+        await world_store.set_blocks({(0, 0): [(3, 200, 4, blocks.STONE), (5, 0, 5, blocks.AIR)]})
+        await self.index.load([(0, 0)])
+
+        world = await world_store.get_world()
+        xs, zs = np.meshgrid(np.arange(CHUNK_SIZE), np.arange(CHUNK_SIZE), indexing='ij')
+        expected = Terrain(world.seed).solid(xs, zs)
+        expected[3, 4, 200] = True
+        expected[5, 5, 0] = False
+        x, z, y = np.meshgrid(np.arange(CHUNK_SIZE), np.arange(CHUNK_SIZE), np.arange(256), indexing='ij')
+        self.assertTrue(np.array_equal(self.index.is_solid(x, y, z), expected))
+        self.assertEqual(self.index._chunks[(0, 0)].shape, (CHUNK_SIZE, CHUNK_SIZE, 32))
+
+    async def test_unknown_blocks_are_not_solid(self):
+        await self.index.load([(0, 0)])
+        self.assertEqual(self.index.is_solid([1, 1, 20], [0, -1, 0], [1, 1, 1]).tolist(), [True, False, False])
+        self.assertFalse(self.index.is_solid(1, 256, 1))
+
+    async def test_blocks_changed_patches_bits(self):
+        await self.index.load([(0, 0), (-1, 0)])
+        self.index.blocks_changed([(2, 250, 2), (-1, 251, 3), (2, 0, 2)], [blocks.DIRT, blocks.STONE, blocks.WATER])
+        self.assertEqual(
+            self.index.is_solid([2, -1, 2, 2], [250, 251, 0, 249], [2, 3, 2, 2]).tolist(),
+            [True, True, False, False],
+        )
+        # Chunks that are not loaded are skipped
+        self.index.blocks_changed([(100, 250, 100)], [blocks.DIRT])
+        self.assertNotIn((6, 6), self.index)
+
+
+class UpdateCoalescingTests(SimpleTestCase):
+    def setUp(self):
+        self.consumer = GameConsumer()
+        self.consumer.channel_name = "game.alice"
+        self.consumer.pending_update = None
+        self.consumer.update_task = None
+        self.consumer.last_update_at = 0.0
+        self.applied = []
+        self.consumer.apply_update = mock.AsyncMock(side_effect=self.applied.append)
+
+    @mock.patch("game.consumers.UPDATE_TICK", 0.05)
+    async def test_updates_within_a_tick_are_coalesced(self):
+        coalesced = inbound_stats["coalesced"]
+        for n in range(4):
+            await self.consumer.queue_update({"n": n})
+        # The first is applied at once, the rest wait for the next tick
+        self.assertEqual(self.applied, [{"n": 0}])
+
+        await self.consumer.update_task
+        self.assertEqual(self.applied, [{"n": 0}, {"n": 3}])
+        self.assertEqual(inbound_stats["coalesced"] - coalesced, 2)
+        self.assertIsNone(self.consumer.update_task)
+
+    @mock.patch("game.consumers.UPDATE_TICK", 0.05)
+    async def test_failed_update_does_not_stop_the_queue(self):
+        self.consumer.apply_update.side_effect = [None, ValueError("bad"), None]
+        await self.consumer.queue_update({"n": 0})
+        await self.consumer.queue_update({"n": 1})
+        with self.assertLogs("game.consumers", "ERROR"):
+            await self.consumer.update_task
+        await self.consumer.queue_update({"n": 2})
+        await self.consumer.update_task
+        self.assertEqual(self.consumer.apply_update.await_count, 3)
+
+
+class TeleportTests(SimpleTestCase):
+    def setUp(self):
+        self.consumer = GameConsumer()
+        self.consumer.channel_name = "game.alice"
+        self.consumer.players = {"game.alice": {"username": "alice"}}
+        self.consumer.movement = MovementValidator(SolidBlocks(), (0.5, 70.5, 0.5), max_speed=10, now=0)
+
+    async def test_teleport_moves_the_validator(self):
+        await self.consumer.player_teleport({"username": "bob", "position": [500, 70, 500]})
+        self.assertEqual(self.consumer.movement.position, (0.5, 70.5, 0.5))
+        await self.consumer.player_teleport({"username": "alice", "position": [500, 70, 500]})
+        self.assertTrue(self.consumer.movement.check((500.5, 70, 500), 0.1))
+
+    def test_spawn_point_must_be_near(self):
+        self.consumer.spawn_point = (0.0, 80.0, 0.0)
+        self.consumer.set_spawn_point({"position": {"x": 300, "y": 71, "z": 0}})
+        self.assertEqual(self.consumer.spawn_point, (0.0, 80.0, 0.0))
+        self.consumer.set_spawn_point({"position": {"x": 2, "y": 71, "z": 1}})
+        self.assertEqual(self.consumer.spawn_point, (2.0, 71.0, 1.0))
+
+
+class FrameAssertions:
+    def assertInflatesTo(self, encoded, expected):
+        text, compressed = encoded
+        self.assertEqual(json.loads(text), expected)
+        self.assertEqual(zlib.decompress(compressed).decode(), text)
+
+
+class SplicedFrameTests(FrameAssertions, SimpleTestCase):
+    def test_fragments_splice_into_one_stream(self):
+        frame = SplicedFrame()
+        self.assertInflatesTo(frame.encode('{"a":[', "]}"), {"a": []})
+        frame.set("one", '{"x":1}')
+        frame.set("two", '{"x":2},{"x":3}')
+        self.assertInflatesTo(frame.encode('{"a":[', "]}"), {"a": [{"x": 1}, {"x": 2}, {"x": 3}]})
+
+        frame.set("one", '{"x":"\u00e9"}')
+        frame.discard("two")
+        frame.set("three", "")
+        self.assertInflatesTo(frame.encode('{"a":[', "]}"), {"a": [{"x": "\u00e9"}]})
+
+    async def test_players_list_frame(self):
+        players = {"c1": {"username": "alice"}, "c2": {"username": "bob"}}
+        frame = PlayersListFrame()
+        frame.invalidate("c1")
+        await frame.get(players)
+        frame.invalidate("c2")
+        self.assertInflatesTo(await frame.get(players), {"type": "players_list", "players": list(players.values())})
+
+        del players["c1"]
+        frame.invalidate("c1")
+        self.assertInflatesTo(await frame.get(players), {"type": "players_list", "players": [{"username": "bob"}]})
+
+    async def test_players_list_ignores_movement(self):
+        state = {"id": "c1", "username": "alice", "position": {"x": 0, "y": 0, "z": 0}, "gamemode": 0}
+        players = {"c1": state}
+        frame = PlayersListFrame()
+        frame.player_changed("c1", state)
+        encoded = await frame.get(players)
+
+        state["position"] = {"x": 5, "y": 0, "z": 0}
+        state["rotation"] = {"x": 0, "y": 1, "z": 0}
+        frame.player_changed("c1", state)
+        self.assertIs(await frame.get(players), encoded)
+
+        state["gamemode"] = 1
+        frame.player_changed("c1", state)
+        self.assertInflatesTo(await frame.get(players), {"type": "players_list", "players": [state]})
+
+        del players["c1"]
+        frame.player_changed("c1", None)
+        frame.player_changed("c2", None)
+        self.assertInflatesTo(await frame.get(players), {"type": "players_list", "players": []})
+        self.assertEqual(frame.listed, {})
+
+    def test_cached_frames_must_build(self):
+        with self.assertRaises(TypeError):
+            CachedFrame()
+
+
+class WorldDataFrameTests(FrameAssertions, TestCase):
+    def setUp(self):
+        world_store.world = None
+        world_store.chunks.clear()
+
+    async def test_matches_stored_modifications(self):
+        world = await world_store.get_world()
+        await world_store.set_blocks({(0, 0): [(1, 2, 3, 4)], (-1, 5): [(-3, 9, 80, 1), (-4, 9, 80, 0)]})
+        frame = WorldDataFrame()
+        expected = {
+            "type": "world_data", "seed": world.seed, "time": world.time, "motd": world.motd,
+            "modifications": {"1,2,3": 4, "-3,9,80": 1, "-4,9,80": 0},
+        }
+        self.assertInflatesTo(await frame.get(), expected)
+
+        await world_store.set_block({"x": 1, "y": 2, "z": 3}, 7)
+        frame.blocks_changed([(1, 2, 3)])
+        expected["modifications"]["1,2,3"] = 7
+        self.assertInflatesTo(await frame.get(), expected)
+
+
+class BenchmarkSelectionTests(SimpleTestCase):
+    def test_exact_names_win_over_patterns(self):
+        self.assertEqual(benchmarks.select(["get_world_data[10k]"]), ["get_world_data[10k]"])
+        self.assertEqual(benchmarks.select(["get_player*"]), ["get_player[cold]", "get_player[cached]"])
+        self.assertEqual(benchmarks.select(["nothing*"]), [])
+        self.assertEqual(benchmarks.select([]), list(benchmarks.benchmarks))
+
+
+class OrmBenchmarkTests(TransactionTestCase):
+    async def written(self, name, variant, model, field):
+        run = await benchmarks.benchmarks[f"orm_{name}[{variant}]"]()
+        for _ in range(3):
+            await run()
+        return [value async for value in model.objects.order_by("pk").values_list(field, flat=True)]
+
+    async def test_both_variants_write_the_same_rows(self):
+        # Same fixtures and seeds, so only the way the queries are run differs
+        for name, model, field in [("save_block_update", Chunk, "modifications"), ("save_player_state", Player, "x")]:
+            self.assertEqual(
+                await self.written(name, "sync_to_async", model, field),
+                await self.written(name, "async", model, field),
+            )
+        benchmarks.reset_caches()
+
+
+class WorldStoreTests(TestCase):
+    async def test_set_blocks_merges_into_rows_created_meanwhile(self):
+        store = WorldStore()
+        world = await store.get_world()
+        await store.load_region(0, 0, 1, 0)
+        # Another worker creates chunk (0, 0) after it was read as missing
+        await Chunk.objects.abulk_create([Chunk(world=world, x=0, z=0, modifications={"1,1,1": 5})])
+
+        await store.set_blocks({(0, 0): [(2, 2, 2, 7)], (1, 0): [(17, 2, 2, 7)]})
+
+        chunk = await Chunk.objects.aget(world=world, x=0, z=0)
+        self.assertEqual(chunk.modifications, {"1,1,1": 5, "2,2,2": 7})
+        self.assertEqual(store.cached_modifications(0, 0), {"1,1,1": 5, "2,2,2": 7})
+        self.assertEqual(store.cached_modifications(1, 0), {"17,2,2": 7})
+
+    async def test_failed_write_leaves_mirror_alone(self):
+        store = WorldStore()
+        world = await store.get_world()
+        await store.set_blocks({(0, 0): [(1, 1, 1, 5)]})
+        with mock.patch.object(Chunk.objects, "abulk_update", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await store.set_blocks({(0, 0): [(2, 2, 2, 7)]})
+        self.assertEqual(store.cached_modifications(0, 0), {"1,1,1": 5})
+
+    async def test_failed_set_block_leaves_mirror_alone(self):
+        store = WorldStore()
+        await store.set_block({"x": 1, "y": 1, "z": 1}, 5)
+        with mock.patch.object(Chunk, "asave", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await store.set_block({"x": 2, "y": 2, "z": 2}, 7)
+        self.assertEqual(store.cached_modifications(0, 0), {"1,1,1": 5})
+
+    @mock.patch("game.store.is_shared", return_value=True)
+    async def test_writes_of_other_workers_are_kept(self, is_shared):
+        store = WorldStore()
+        world = await store.get_world()
+        await store.set_blocks({(0, 0): [(1, 1, 1, 5)]})
+        # Another worker writes the same chunk, and this mirror has not seen it yet
+        await Chunk.objects.filter(world=world, x=0, z=0).aupdate(modifications={"1,1,1": 5, "3,3,3": 9})
+        await store.load_region(1, 0, 1, 0)
+        await Chunk.objects.abulk_create([Chunk(world=world, x=1, z=0, modifications={"17,1,1": 4})])
+
+        await store.set_block({"x": 2, "y": 2, "z": 2}, 7)
+        await store.set_blocks({(1, 0): [(18, 2, 2, 7)]})
+
+        expected = {(0, 0): {"1,1,1": 5, "3,3,3": 9, "2,2,2": 7}, (1, 0): {"17,1,1": 4, "18,2,2": 7}}
+        for (cx, cz), modifications in expected.items():
+            chunk = await Chunk.objects.aget(world=world, x=cx, z=cz)
+            self.assertEqual(chunk.modifications, modifications)
+            self.assertEqual(store.cached_modifications(cx, cz), modifications)
+
+
+class RegionJobTests(SimpleTestCase):
+    async def test_failures_are_logged(self):
+        async def fail():
+            raise RuntimeError("disk full")
+
+        with self.assertLogs("game.regions", "ERROR") as logs:
+            task = start_job(fail())
+            with self.assertRaises(RuntimeError):
+                await task
+            await asyncio.sleep(0)
+        self.assertIn("Region job failed", logs.output[0])
+
+
+class RegionTests(TestCase):
+    def setUp(self):
+        world_store.world = None
+        world_store.chunks.clear()
+
+    async def modifications(self):
+        return {
+            key: block
+            async for chunk in Chunk.objects.all()
+            for key, block in chunk.modifications.items()
+        }
+
+    async def test_fill_writes_every_block_of_the_box(self):
+        count = await regions.fill((14, 60, 3), (17, 61, 4), blocks.STONE)
+
+        self.assertEqual(count, 16)
+        expected = {f"{x},{y},{z}": blocks.STONE for x in range(14, 18) for y in (60, 61) for z in (3, 4)}
+        self.assertEqual(await self.modifications(), expected)
+        self.assertEqual(await Chunk.objects.acount(), 2)
+
+    async def test_clone_copies_terrain_and_clears_empty_blocks(self):
+        world = await world_store.get_world()
+        terrain = Terrain(world.seed)
+        columns = terrain.blocks(np.array([[5]]), np.array([[5]]))[0, 0]
+        ground = int(terrain.height(np.array([5]), np.array([5]))[0])
+        # A player-placed block above the ground, and one where the copy has air
+        await world_store.set_block({"x": 5, "y": ground + 1, "z": 5}, blocks.GRAVEL)
+        await world_store.set_block({"x": 40, "y": 101, "z": 40}, blocks.STONE)
+
+        low, high, volume = await regions.clone((5, ground - 2, 5), (5, ground + 2, 5), (40, 100, 40))
+
+        self.assertEqual((low, high), ((40, 100, 40), (40, 104, 40)))
+        expected = [*columns[ground - 2:ground + 1].tolist(), blocks.GRAVEL, blocks.AIR]
+        self.assertEqual(volume.ravel().tolist(), expected)
+        stored = await self.modifications()
+        self.assertEqual([stored[f"40,{y},40"] for y in range(100, 105)], expected)
+
+    async def test_clone_leaves_out_blocks_above_the_world(self):
+        low, high, volume = await regions.clone((0, 10, 0), (0, 13, 0), (0, 254, 0))
+        self.assertEqual((low, high), ((0, 254, 0), (0, 255, 0)))
+        self.assertEqual(volume.shape, (1, 2, 1))
+        self.assertEqual(set(await self.modifications()), {"0,254,0", "0,255,0"})
+
+
+class TerrainTests(SimpleTestCase):
+    def setUp(self):
+        self.terrain = Terrain(12345)
+        self.xs, self.zs = np.meshgrid(np.arange(-40, 40, 5), np.arange(-40, 40, 5), indexing='ij')
+
+    def test_seeded_random_matches_javascript(self):
+        # Values printed by src/Utils/SeededRandom.js, negative seeds included
+        for seed, expected in [
+            (12345, [0.4131601508916324, 0.01388460219478738, 0.3520061728395062]),
+            (-777, [-0.7680898491083676, -0.7923653978052126, -0.5792438271604938]),
+        ]:
+            rng = SeededRandom(seed)
+            self.assertEqual([rng.random() for _ in range(3)], expected)
+
+    def test_noise_is_vectorized(self):
+        values = self.terrain.noise2d(self.xs * 0.1, self.zs * 0.1)
+        self.assertEqual(values[3, 7], self.terrain.noise2d(self.xs[3, 7] * 0.1, self.zs[3, 7] * 0.1))
+        self.assertTrue(np.all(np.abs(values) <= 1))
+
+    def test_heights_depend_on_the_seed_only(self):
+        height = self.terrain.height(self.xs, self.zs)
+        self.assertTrue(np.array_equal(height, Terrain(12345).height(self.xs, self.zs)))
+        self.assertFalse(np.array_equal(height, Terrain(54321).height(self.xs, self.zs)))
+        self.assertTrue(np.all((height >= 1) & (height < 256)))
+
+    def test_blocks_agree_with_solid_and_surface(self):
+        solid = self.terrain.solid(self.xs, self.zs)
+        column_blocks = self.terrain.blocks(self.xs, self.zs)
+        self.assertTrue(np.array_equal(solid, np.vectorize(blocks.is_solid)(column_blocks)))
+        self.assertTrue(np.all(column_blocks[..., 0] == blocks.BEDROCK))
+
+        height, top_y, top_block = self.terrain.surface(self.xs, self.zs)
+        ground = np.take_along_axis(column_blocks, (height - 1)[..., None], axis=-1)[..., 0]
+        # Where the top ground block is not dug out by a cave entrance
+        uncovered = np.take_along_axis(solid, (height - 1)[..., None], axis=-1)[..., 0] & (top_y == height - 1)
+        self.assertTrue(uncovered.any())
+        self.assertTrue(np.array_equal(ground[uncovered], top_block[uncovered]))
+
+
+class MinimapTests(TestCase):
+    def setUp(self):
+        world_store.world = None
+        world_store.chunks.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+
+    def decode(self, data):
+        heights = np.frombuffer(data[:256], dtype=np.uint8).reshape(16, 16)
+        return heights, np.frombuffer(data[256:], dtype='<u2').reshape(16, 16)
+
+    async def test_tiles_show_terrain_and_modifications(self):
+        cache = MinimapCache(self.cache_dir)
+        world = await world_store.get_world()
+        xs, zs = np.meshgrid(np.arange(16), np.arange(16), indexing='ij')
+        height, top_y, top_block = Terrain(world.seed).surface(xs, zs)
+
+        heights, ids = self.decode((await cache.get_tiles(0, [(0, 0)]))[(0, 0)])
+        self.assertTrue(np.array_equal(heights, top_y))
+        self.assertTrue(np.array_equal(ids, top_block))
+
+        await world_store.set_block({"x": 3, "y": 250, "z": 4}, blocks.GRAVEL)
+        cache.blocks_changed([(3, 250, 4)])
+        heights, ids = self.decode((await cache.get_tiles(0, [(0, 0)]))[(0, 0)])
+        self.assertEqual((heights[3, 4], ids[3, 4]), (250, blocks.GRAVEL))
+
+    async def test_evicted_tiles_are_written_and_read_back(self):
+        cache = MinimapCache(self.cache_dir, max_tiles=1)
+        world = await world_store.get_world()
+        first = await cache.get_tiles(1, [(0, 0)])
+        self.assertEqual(os.listdir(self.cache_dir), [])  # new tiles are written when evicted
+        await cache.get_tiles(1, [(5, 5)])
+
+        directory = os.path.join(self.cache_dir, str(world.seed))
+        self.assertEqual(sorted(os.listdir(directory)), [".minimap", "1_0_0.tile"])
+        with mock.patch.object(Terrain, "surface", side_effect=AssertionError("recomputed")):
+            self.assertEqual(await MinimapCache(self.cache_dir).get_tiles(1, [(0, 0)]), first)
+
+        cache.flush()
+        self.assertIn("1_5_5.tile", os.listdir(directory))
+
+    async def test_only_tile_directories_are_removed(self):
+        for name, marked in [("1", True), ("photos", False)]:
+            os.makedirs(os.path.join(self.cache_dir, name))
+            if marked:
+                open(os.path.join(self.cache_dir, name, ".minimap"), "w").close()
+        await MinimapCache(self.cache_dir).get_tiles(0, [(0, 0)])
+        self.assertEqual(os.listdir(self.cache_dir), ["photos"])
+
+
+class EntityWorldTests(SimpleTestCase):
+    def setUp(self):
+        self.world = EntityWorld(seed=1)
+        # A floor whose top is y=10
+        self.index = SolidBlocks((x, 9, z) for x in range(-4, 40) for z in range(-4, 4))
+
+    def spawn(self, kind, position):
+        return int(self.world.spawn([kind], [position])[0])
+
+    def run_ticks(self, count, players):
+        for _ in range(count):
+            self.world.tick(0.1, np.array(players, dtype=np.float32).reshape(-1, 3), self.index)
+
+    def position(self, entity_id):
+        return self.world.position[self.world.slot_of(entity_id)].tolist()
+
+    def test_mobs_fall_onto_the_ground(self):
+        zombie = self.spawn(ZOMBIE, (0.5, 14, 0.5))
+        self.run_ticks(20, [(0.5, 11, 0.5)])
+        self.assertEqual(self.position(zombie)[1], 10)
+
+    def test_removed_ground_is_noticed(self):
+        pig = self.spawn(PIG, (0.5, 10, 0.5))
+        self.run_ticks(2, [(30.5, 11, 0.5)])
+        self.index.solid.discard((0, 9, 0))
+        self.index.solid.add((0, 6, 0))
+        self.index.version += 1
+        self.world.state[self.world.slot_of(pig)] = WANDER
+        self.world.velocity[self.world.slot_of(pig)] = 0
+        self.world.timer[self.world.slot_of(pig)] = 100
+        self.world.heading[self.world.slot_of(pig)] = 0
+        self.run_ticks(1, [(30.5, 11, 0.5)])
+        self.assertLess(self.position(pig)[1], 10)
+
+    def test_hostiles_chase_the_nearest_player(self):
+        zombie = self.spawn(ZOMBIE, (0.5, 10, 0.5))
+        self.run_ticks(10, [(20.5, 11, 0.5), (-60, 11, 0.5)])
+        slot = self.world.slot_of(zombie)
+        self.assertEqual(self.world.state[slot], CHASE)
+        self.assertAlmostEqual(float(self.world.heading[slot]), math.pi / 2, places=5)
+        x, y, z = self.position(zombie)
+        self.assertAlmostEqual(x, 0.5 + 2.3, places=3)
+        self.assertAlmostEqual(z, 0.5, places=3)
+
+    def test_walls_stop_mobs_and_steps_are_climbed(self):
+        walled = self.spawn(ZOMBIE, (0.5, 10, 0.5))
+        stepping = self.spawn(ZOMBIE, (0.5, 10, 2.5))
+        self.index.solid.update([(3, 10, 0), (3, 11, 0), *((x, 10, 2) for x in range(3, 40))])
+        self.index.version += 1
+        self.run_ticks(20, [(30.5, 11, 0.5), (30.5, 11, 2.5)])
+
+        x, y, z = self.position(walled)
+        self.assertLess(x, 3)
+        self.assertEqual(y, 10)
+        x, y, z = self.position(stepping)
+        self.assertGreater(x, 4)
+        self.assertEqual(y, 11)
+
+    def test_far_mobs_despawn(self):
+        near = self.spawn(PIG, (0.5, 10, 0.5))
+        far = self.spawn(PIG, (200.5, 10, 0.5))
+        self.run_ticks(1, [(10.5, 11, 0.5)])
+        self.assertIsNotNone(self.world.slot_of(near))
+        self.assertIsNone(self.world.slot_of(far))
+
+        self.run_ticks(1, [])
+        self.assertEqual(len(self.world), 0)
+        self.assertEqual(self.world.count, 0)
+
+    def test_visible_from(self):
+        ids = self.world.spawn([PIG, PIG, PIG], [(0, 10, 0), (10, 10, 0), (0, 10, 30)])
+        self.world.despawn([0])
+        slots = self.world.visible_from((0, 10, 0), 20)
+        self.assertEqual(self.world.ids[slots].tolist(), [ids[1]])
+
+
+class EntitySyncTests(SimpleTestCase):
+    async def test_empty_frames_are_sent_once(self):
+        simulation = EntitySimulation(sync_every=1)
+        layer = mock.Mock(send=mock.AsyncMock())
+        players = {"near": {"position": {"x": 0.5, "y": 11, "z": 0.5}},
+                   "far": {"position": {"x": 100.5, "y": 11, "z": 0.5}}}
+        entity_id = int(simulation.world.spawn([PIG], [(0.5, 10, 0.5)])[0])
+
+        with mock.patch.object(occupancy_index, "load", mock.AsyncMock()):
+            await simulation.step(0.1, players, layer)
+            simulation.world.damage(entity_id, 100)
+            await simulation.step(0.1, players, layer)
+            await simulation.step(0.1, players, layer)
+
+        sent = [(call.args[0], json.loads(call.args[1]["text"])["ids"]) for call in layer.send.await_args_list]
+        self.assertEqual(sent, [("near", [entity_id]), ("near", [])])
+
+
+class ExplosionTests(TestCase):
+    def setUp(self):
+        world_store.world = None
+        world_store.chunks.clear()
+        self.simulation = EntitySimulation()
+
+    async def spawn(self, kind, position):
+        # Standing on the generated ground, so the blast has blocks to clear
+        await occupancy_index.load(nearby_chunks(position))
+        x, z = position[0], position[2]
+        y = next(y for y in range(255, 0, -1) if occupancy_index.is_solid(x, y - 1, z))
+        return int(self.simulation.world.spawn(np.array([kind]), np.array([[x, y, z]]))[0]), (x, y, z)
+
+    async def test_creeper_explosion_clears_crater(self):
+        entity_id, position = await self.spawn(CREEPER, (8.5, 0, 8.5))
+        self.simulation.explode(entity_id, position)
+        await asyncio.gather(*jobs)
+
+        self.assertIsNone(self.simulation.world.slot_of(entity_id))
+        chunk = await Chunk.objects.aget(x=0, z=0)
+        self.assertTrue(chunk.modifications)
+        self.assertEqual(set(chunk.modifications.values()), {blocks.AIR})
+        self.assertFalse(occupancy_index.is_solid(8, position[1], 8))
+
+    async def test_only_nearby_creepers_explode(self):
+        zombie, position = await self.spawn(ZOMBIE, (8.5, 0, 8.5))
+        creeper, position = await self.spawn(CREEPER, (8.5, 0, 8.5))
+        self.simulation.explode(zombie, position)
+        self.simulation.explode(creeper, (position[0] + 20, position[1], position[2]))
+        await asyncio.gather(*jobs)
+
+        self.assertIsNotNone(self.simulation.world.slot_of(zombie))
+        self.assertIsNotNone(self.simulation.world.slot_of(creeper))
+        self.assertFalse(await Chunk.objects.aexists())
+
+
+class WorldClockTests(TestCase):
+    def setUp(self):
+        world_store.world = None
+        world_store.chunks.clear()
+        self.clock = WorldClock(rate=20)
+        patcher = mock.patch("game.clock.time.monotonic", return_value=100.0)
+        self.monotonic = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_time_advances_from_the_anchor(self):
+        self.clock.set(23000)
+        self.monotonic.return_value = 110.0
+        self.assertEqual(self.clock.now(), 23200)
+        self.assertTrue(self.clock.is_night())
+        self.monotonic.return_value = 160.0
+        self.assertEqual(self.clock.now(), 200)
+        self.assertFalse(self.clock.is_night())
+
+    async def test_load_resumes_saved_time(self):
+        await World.objects.acreate(name="World 1", time=15000)
+        await self.clock.load()
+        self.monotonic.return_value = 101.0
+        self.assertEqual(self.clock.now(), 15020)
+
+    async def test_persist_writes_current_time(self):
+        await self.clock.load()
+        self.clock.set(13000)
+        self.monotonic.return_value = 105.5
+        await self.clock.persist()
+        self.assertEqual((await World.objects.aget()).time, 13110)
+
+    def test_save_at_exit(self):
+        self.clock.save()  # never loaded: nothing to write
+        self.assertFalse(World.objects.exists())
+
+        async_to_sync(self.clock.load)()
+        self.clock.set(1000)
+        self.clock.save()
+        self.assertEqual(World.objects.get().time, 1000)
+
+        self.clock.set(2000)
+        with mock.patch.dict(connection.settings_dict, NAME="another.sqlite3"):
+            self.clock.save()
+        self.assertEqual(World.objects.get().time, 1000)
+
+    async def test_sync_message_and_broadcast(self):
+        self.clock.set(6000)
+        self.monotonic.return_value = 100.25
+        self.assertEqual(json.loads(self.clock.sync_message()), {"type": "time_sync", "time": 6005.0, "rate": 20})
+
+        layer = mock.Mock(group_send=mock.AsyncMock())
+        await self.clock.broadcast(layer)
+        layer.group_send.assert_awaited_once_with(
+            "game_world", {"type": "time_sync", "text": self.clock.sync_message()},
+        )
+
+
+class ArchiveTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "world.vxw")
+
+    def call(self, *args, **kwargs):
+        call_command(*args, stdout=StringIO(), **kwargs)
+
+    def test_export_import_round_trip(self):
+        world = World.objects.create(name="World 1", seed=42, time=1234, motd="hi")
+        Chunk.objects.bulk_create([
+            Chunk(world=world, x=x, z=z, modifications={f"{x * 16},{n},{z * 16}": n for n in range(x + 2)})
+            for x in range(-3, 3) for z in range(2)
+        ])
+        Player.objects.create(username="alice", x=1.5, y=70, z=-2, inventory=[{"id": 3, "count": 5}], health=7)
+        self.call("export_world", self.path)
+
+        Chunk.objects.filter(x=0).update(modifications={})
+        Player.objects.filter(username="alice").update(x=100, health=20)
+        self.call("import_world", self.path, replace=True, batch_size=4)
+
+        imported = World.objects.get(name="World 1")
+        self.assertNotEqual(imported.pk, world.pk)
+        self.assertEqual((imported.seed, imported.time, imported.motd), (42, 1234, "hi"))
+        self.assertEqual(World.objects.count(), 1)
+        chunks = {(chunk.x, chunk.z): chunk.modifications for chunk in Chunk.objects.filter(world=imported)}
+        self.assertEqual(len(chunks), 12)
+        self.assertEqual(chunks[(0, 1)], {"0,0,16": 0, "0,1,16": 1})
+        alice = Player.objects.get(username="alice")
+        self.assertEqual((alice.x, alice.health, alice.inventory), (1.5, 7, [{"id": 3, "count": 5}]))
+
+    def test_players_are_upserted_one_frame_at_a_time(self):
+        World.objects.create(name="World 1")
+        Player.objects.bulk_create([Player(username=f"p{n}", x=n) for n in range(5)])
+        with mock.patch("game.management.commands.export_world.PLAYER_BATCH", 2):
+            self.call("export_world", self.path)
+        Player.objects.all().update(x=-1)
+
+        bulk_create = Player.objects.bulk_create
+        with mock.patch.object(Player.objects, "bulk_create", side_effect=bulk_create) as upsert:
+            self.call("import_world", self.path, replace=True)
+        self.assertEqual([len(call.args[0]) for call in upsert.call_args_list], [2, 2, 1])
+        self.assertEqual(sorted(Player.objects.values_list("x", flat=True)), [0, 1, 2, 3, 4])
+
+    def test_failed_import_leaves_players_alone(self):
+        World.objects.create(name="World 1")
+        Player.objects.create(username="alice", x=1.5)
+        self.call("export_world", self.path)
+        Player.objects.filter(username="alice").update(x=100)
+
+        with mock.patch("game.management.commands.import_world.delete_world", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.call("import_world", self.path, replace=True)
+        self.assertEqual(Player.objects.get(username="alice").x, 100)
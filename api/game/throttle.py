@@ -0,0 +1,84 @@
+import re
+import time
+from collections import Counter
+
+# Every client frame starts with its type: JSON.stringify({type: ..., ...})
+_TYPE_PREFIX = re.compile(r'\{\s*"type"\s*:\s*"(\w+)"')
+
+# Game traffic since startup: "received", "oversized", "coalesced",
+# "throttled", and "throttled.<type>" or "throttled.connection"
+inbound_stats = Counter()
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    Holds up to ``capacity`` tokens and refills ``rate`` tokens per second.
+    Each allowed action consumes one token (or ``cost``).
+    """
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated_at')
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def allow(self, cost=1):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+def peek_type(text):
+    """The message type of a raw client frame, without parsing it (None if unsure)."""
+    match = _TYPE_PREFIX.match(text)
+    return match.group(1) if match else None
+
+
+class InboundLimiter:
+    """Limits on the frames one connection may send.
+
+    A frame must fit in ``max_bytes`` and pass a bucket for the whole
+    connection (``total``) and one for its type; ``rates`` maps types to
+    ``(capacity, refill per second)``, other types get ``default``.
+    """
+
+    __slots__ = ('max_bytes', 'total', 'rates', 'default', 'buckets')
+
+    def __init__(self, total, rates, default, max_bytes):
+        self.max_bytes = max_bytes
+        self.total = TokenBucket(*total)
+        self.rates = rates
+        self.default = default
+        self.buckets = {}
+
+    def allow_frame(self, text):
+        inbound_stats["received"] += 1
+        if len(text) > self.max_bytes:
+            inbound_stats["oversized"] += 1
+            return False
+        if not self.total.allow():
+            inbound_stats["throttled"] += 1
+            inbound_stats["throttled.connection"] += 1
+            return False
+        return True
+
+    def allow_type(self, message_type):
+        if message_type not in self.rates:
+            # Unknown types share one bucket so made-up names cannot grow this dict
+            message_type = "other"
+        bucket = self.buckets.get(message_type)
+        if bucket is None:
+            bucket = self.buckets[message_type] = TokenBucket(*self.rates.get(message_type, self.default))
+        if bucket.allow():
+            return True
+        inbound_stats["throttled"] += 1
+        inbound_stats[f"throttled.{message_type}"] += 1
+        return False
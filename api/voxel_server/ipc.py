@@ -0,0 +1,584 @@
+"""Channel layer for several worker processes on one host.
+
+Workers talk through a hub over a Unix domain socket; no external
+service is needed. The hub is not a separate program: the first worker
+to take an exclusive lock on ``<path>.lock`` starts it inside its own
+event loop, and when that worker dies the lock is released and the next
+worker to reconnect takes over. Every worker, the hub's own included,
+then connects to the socket as a client.
+
+Channel names embed the id of the worker that created them, so the hub
+routes ``send()`` without a lookup. Group membership is held by the hub
+per worker: ``group_send()`` delivers to local members directly and
+sends the message once to each other worker with members, which fans
+it out to its own. After a hub change each worker re-registers its
+groups and shared entries, so no state lives only in the hub.
+
+Besides channels, workers share:
+
+* ``SharedDict``: a dict mirrored in every worker. Each worker writes
+  its own keys; the keys of a worker that goes away are removed.
+* ``publish(topic, payload)``: a message to ``subscribe()``-d callbacks
+  of every other worker, for cache invalidation.
+* ``is_leader()``: true in exactly one connected worker (the hub's), for
+  work that must run once per host such as the mob simulation.
+* ``is_shared()``: whether other workers run at all, for caches of rows
+  that every worker writes.
+
+Without this layer (e.g. the in-memory one) all of the above degrade to
+plain in-process behaviour. Messages must be JSON-serializable.
+
+All of it belongs to the event loop thread. Model signal receivers run
+in the thread of the ORM call instead (sync_to_async's, for the async
+ORM), so they go through ``in_loop`` to touch caches or ``publish()``.
+"""
+import asyncio
+import collections
+import fcntl
+import functools
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+
+from asgiref.sync import SyncToAsync
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">II")
+RECONNECT_DELAY = 0.05  # seconds between attempts while the hub changes
+TOUCH_DELAY = 0.1  # seconds changes made with SharedDict.touch() may be batched
+PENDING_PUBLISHES = 1000  # publish() frames kept while there is no hub
+CLEAN_INTERVAL = 1.0  # seconds between sweeps for expired messages
+
+_layer = None
+_subscribers = {}
+_shared = {}
+
+
+def pack(header, body=b""):
+    header = json.dumps(header, separators=(',', ':')).encode()
+    return _HEADER.pack(len(header), len(body)) + header + body
+
+
+async def read_frame(reader):
+    """Return (header dict, raw frame bytes, body bytes)."""
+    prefix = await reader.readexactly(_HEADER.size)
+    header_size, body_size = _HEADER.unpack(prefix)
+    data = await reader.readexactly(header_size + body_size)
+    return json.loads(data[:header_size]), prefix + data, data[header_size:]
+
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def worker_of(channel):
+    # "<prefix>.<worker>!<random>"
+    return channel.partition("!")[0].rpartition(".")[2]
+
+
+def call_in_loop(callback, *args):
+    """Run ``callback(*args)`` on the event loop thread.
+
+    From a sync_to_async thread the call is handed to the loop that is
+    waiting for it; without a running loop (management commands) it runs
+    at once.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # Set by asgiref for the sync code it runs on behalf of a loop
+        loop = getattr(SyncToAsync.threadlocal, "main_event_loop", None)
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(callback, *args)
+            return
+    callback(*args)
+
+
+def in_loop(receiver):
+    """Decorator for signal receivers that must run on the event loop."""
+    @functools.wraps(receiver)
+    def wrapper(*args, **kwargs):
+        call_in_loop(functools.partial(receiver, *args, **kwargs))
+    return wrapper
+
+
+def is_leader():
+    return _layer is None or _layer.is_hub
+
+
+def is_shared():
+    """True when other worker processes may write the same database rows."""
+    return _layer is not None
+
+
+def publish(topic, payload=None):
+    """Send ``payload`` to the ``topic`` subscribers of every other worker."""
+    if _layer is not None:
+        call_in_loop(_layer.post, {"op": "publish", "topic": topic}, encode(payload))
+
+
+def subscribe(topic):
+    def register(callback):
+        _subscribers.setdefault(topic, []).append(callback)
+        return callback
+    return register
+
+
+def shared_dict(name):
+    if name not in _shared:
+        _shared[name] = SharedDict(name)
+    return _shared[name]
+
+
+class SharedDict:
+    """Dict mirrored in every worker process.
+
+    A worker owns the keys it sets and only changes those. Assigning or
+    deleting a key is sent at once; a value mutated in place is sent
+    after ``touch(key)``, at most every TOUCH_DELAY seconds. ``on_change``
+    callbacks run with the key after every local or remote change.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.data = {}
+        self.owned = set()
+        self.callbacks = []
+        self._touched = set()
+        self._flush = None
+
+    def on_change(self, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def _changed(self, key):
+        for callback in self.callbacks:
+            callback(key)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.owned.add(key)
+        self._touched.discard(key)
+        if _layer is not None:
+            _layer.post({"op": "set", "name": self.name, "key": key}, encode(value))
+        self._changed(key)
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.owned.discard(key)
+        self._touched.discard(key)
+        if _layer is not None:
+            _layer.post({"op": "del", "name": self.name, "key": key})
+        self._changed(key)
+
+    def touch(self, key):
+        """Share an in-place change of ``key``'s value."""
+        if _layer is not None and key in self.owned:
+            self._touched.add(key)
+            if self._flush is None:
+                self._flush = asyncio.get_running_loop().call_later(TOUCH_DELAY, self._send_touched)
+        self._changed(key)
+
+    def _send_touched(self):
+        self._flush = None
+        touched, self._touched = self._touched, set()
+        for key in touched:
+            if key in self.owned and _layer is not None:
+                _layer.post({"op": "set", "name": self.name, "key": key}, encode(self.data[key]))
+
+    # Remote side
+
+    def apply(self, op, key, value=None):
+        if key in self.owned:
+            return
+        if op == "set":
+            self.data[key] = value
+        elif self.data.pop(key, None) is None:
+            return
+        self._changed(key)
+
+    def drop_remote(self):
+        for key in [key for key in self.data if key not in self.owned]:
+            del self.data[key]
+            self._changed(key)
+
+
+class Hub:
+    """Routes frames between the workers connected to the socket."""
+
+    def __init__(self):
+        self.workers = {}
+        self.groups = {}  # group -> {worker: set(channels)}
+        self.shared = {}  # name -> {key: (worker, encoded value)}
+        self.server = None
+        self.connections = {}  # writer -> serving task, including workers yet to say hello
+
+    async def start(self, path):
+        self.server = await asyncio.start_unix_server(self.serve, path=path)
+        os.chmod(path, 0o600)
+
+    async def serve(self, reader, writer):
+        worker = None
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                header, raw, body = await read_frame(reader)
+                op = header["op"]
+                if op == "hello":
+                    worker = header["worker"]
+                    self.workers[worker] = writer
+                    self.hello(worker, writer, json.loads(body))
+                elif op == "send":
+                    target = self.workers.get(worker_of(header["channel"]))
+                    if target is not None:
+                        target.write(raw)
+                elif op == "group":
+                    for other in self.groups.get(header["group"], ()):
+                        if other != worker:
+                            self.workers[other].write(raw)
+                elif op == "group_add":
+                    self.groups.setdefault(header["group"], {}).setdefault(worker, set()).add(header["channel"])
+                elif op == "group_discard":
+                    self.discard(header["group"], worker, header["channel"])
+                elif op in ("set", "del"):
+                    entries = self.shared.setdefault(header["name"], {})
+                    if op == "set":
+                        entries[header["key"]] = (worker, body)
+                    else:
+                        entries.pop(header["key"], None)
+                    self.forward(raw, worker)
+                elif op == "publish":
+                    self.forward(raw, worker)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception("Dropping worker %s after a bad frame", worker)
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+            if worker is not None and self.workers.get(worker) is writer:
+                self.goodbye(worker)
+
+    def hello(self, worker, writer, state):
+        for group, channels in state["groups"].items():
+            self.groups.setdefault(group, {})[worker] = set(channels)
+        for name, entries in state["shared"].items():
+            for key, value in entries.items():
+                self.shared.setdefault(name, {})[key] = (worker, encode(value))
+                self.forward(pack({"op": "set", "name": name, "key": key}, encode(value)), worker)
+
+        snapshot = {
+            name: {key: json.loads(value) for key, (owner, value) in entries.items() if owner != worker}
+            for name, entries in self.shared.items()
+        }
+        writer.write(pack({"op": "snapshot"}, encode(snapshot)))
+
+    def goodbye(self, worker):
+        del self.workers[worker]
+        for group in list(self.groups):
+            self.groups[group].pop(worker, None)
+            if not self.groups[group]:
+                del self.groups[group]
+        for name, entries in self.shared.items():
+            for key in [key for key, (owner, value) in entries.items() if owner == worker]:
+                del entries[key]
+                self.forward(pack({"op": "del", "name": name, "key": key}), worker)
+
+    def discard(self, group, worker, channel):
+        members = self.groups.get(group, {})
+        channels = members.get(worker)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del members[worker]
+        if not members:
+            self.groups.pop(group, None)
+
+    async def close(self):
+        self.server.close()
+        for writer in self.connections:
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+
+    def forward(self, raw, origin):
+        for worker, writer in self.workers.items():
+            if worker != origin:
+                writer.write(raw)
+
+
+class IPCChannelLayer(BaseChannelLayer):
+    """Channel layer shared by the worker processes of one host (see module docs)."""
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, path, expiry=60, capacity=100, channel_capacity=None, **kwargs):
+        global _layer
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.path = str(path)
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.channels = {}
+        self.groups = {}  # group -> set of this worker's channels
+        self.is_hub = False
+        self.hub = None
+        self._lock_file = None
+        self._writer = None
+        self._connected = None
+        self._connecting = None
+        self._pending = collections.deque(maxlen=PENDING_PUBLISHES)
+        self._next_clean = 0.0
+        _layer = self
+
+    # Connection to the hub
+
+    async def _ensure_connected(self):
+        if self._connected is None:
+            self._connected = asyncio.Event()
+            self._connecting = asyncio.create_task(self._run())
+        await self._connected.wait()
+
+    def _try_become_hub(self):
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._lock_file = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    async def _connect(self):
+        while True:
+            if not self.is_hub and self._try_become_hub():
+                # A socket file left by a dead hub would make bind() fail
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
+                self.hub = Hub()
+                await self.hub.start(self.path)
+                self.is_hub = True
+                logger.info("Worker %s is now the channel layer hub", self.worker_id)
+            try:
+                return await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _run(self):
+        while True:
+            reader, writer = await self._connect()
+            for shared in _shared.values():
+                shared.drop_remote()
+            writer.write(pack({"op": "hello", "worker": self.worker_id}, encode({
+                "groups": {group: sorted(channels) for group, channels in self.groups.items()},
+                "shared": {name: {key: shared.data[key] for key in shared.owned} for name, shared in _shared.items()},
+            })))
+            while self._pending:
+                writer.write(self._pending.popleft())
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    header, raw, body = await read_frame(reader)
+                    self._dispatch(header, body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning("Lost the channel layer hub, reconnecting")
+            finally:
+                self._writer = None
+                self._connected.clear()
+                writer.close()
+
+    def post(self, header, body=b""):
+        """Queue a frame for the hub.
+
+        Without a hub, shared entries are dropped (they are resent on hello)
+        and published messages are kept until the next one.
+        """
+        if self._writer is not None:
+            self._writer.write(pack(header, body))
+        elif header["op"] == "publish":
+            if len(self._pending) == self._pending.maxlen:
+                logger.warning("No channel layer hub, dropping a %s message", header["topic"])
+            self._pending.append(pack(header, body))
+
+    async def _send_to_hub(self, header, body=b""):
+        # A frame lost with a failing hub is sent again through the next one
+        while True:
+            await self._ensure_connected()
+            writer = self._writer
+            writer.write(pack(header, body))
+            try:
+                await writer.drain()
+                return
+            except ConnectionError:
+                while self._writer is writer:
+                    await asyncio.sleep(RECONNECT_DELAY)
+
+    def _dispatch(self, header, body):
+        op = header["op"]
+        if op == "send":
+            try:
+                self._deliver(header["channel"], json.loads(body))
+            except ChannelFull:
+                pass
+        elif op == "group":
+            message = json.loads(body)
+            for channel in self.groups.get(header["group"], ()):
+                try:
+                    self._deliver(channel, dict(message))
+                except ChannelFull:
+                    pass
+        elif op in ("set", "del"):
+            value = json.loads(body) if op == "set" else None
+            shared_dict(header["name"]).apply(op, header["key"], value)
+        elif op == "snapshot":
+            for name, entries in json.loads(body).items():
+                shared = shared_dict(name)
+                for key, value in entries.items():
+                    shared.apply("set", key, value)
+        elif op == "publish":
+            payload = json.loads(body)
+            for callback in _subscribers.get(header["topic"], ()):
+                try:
+                    callback(payload)
+                except Exception:
+                    logger.exception("Subscriber of %s failed", header["topic"])
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _deliver(self, channel, message):
+        now = time.time()
+        if now >= self._next_clean:
+            self._next_clean = now + CLEAN_INTERVAL
+            self._clean_expired(now)
+        try:
+            self._queue(channel).put_nowait((now + self.expiry, message))
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    def _clean_expired(self, now):
+        # Nobody reads a channel whose messages expire (its connection is
+        # gone): drop the queue and the channel's groups, like the in-memory layer
+        for channel, queue in list(self.channels.items()):
+            expired = False
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                expired = True
+            if not expired:
+                continue
+            # An empty queue that was not emptied here may have a receiver waiting
+            if queue.empty():
+                del self.channels[channel]
+            for group in [group for group, channels in self.groups.items() if channel in channels]:
+                self.groups[group].discard(channel)
+                if not self.groups[group]:
+                    del self.groups[group]
+                self.post({"op": "group_discard", "group": group, "channel": channel})
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        if worker_of(channel) == self.worker_id or "!" not in channel:
+            self._deliver(channel, message)
+        else:
+            await self._send_to_hub({"op": "send", "channel": channel}, encode(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        queue = self._queue(channel)
+        while True:
+            try:
+                expires, message = await queue.get()
+            finally:
+                if queue.empty() and self.channels.get(channel) is queue:
+                    del self.channels[channel]
+            if expires >= time.time():
+                return message
+
+    async def new_channel(self, prefix="specific."):
+        await self._ensure_connected()
+        return f"{prefix.rstrip('.')}.{self.worker_id}!{uuid.uuid4().hex[:12]}"
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+
+    async def close(self):
+        """Leave the hub, and stop it if this worker runs it."""
+        if self._connecting is not None:
+            self._connecting.cancel()
+            try:
+                await self._connecting
+            except asyncio.CancelledError:
+                pass
+            self._connecting = self._connected = None
+        if self.hub is not None:
+            hub, self.hub = self.hub, None
+            await hub.close()
+        if self._lock_file is not None:
+            # Releases the lock, so another worker takes over
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_hub = False
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.groups.setdefault(group, set()).add(channel)
+        await self._send_to_hub({"op": "group_add", "group": group, "channel": channel})
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        channels = self.groups.get(group)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self.groups[group]
+        await self._send_to_hub({"op": "group_discard", "group": group, "channel": channel})
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        # Local members directly, other workers through the hub, once each
+        for channel in self.groups.get(group, ()):
+            try:
+                self._deliver(channel, dict(message))
+            except ChannelFull:
+                pass
+        await self._send_to_hub({"op": "group", "group": group}, encode(message))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,13 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Set by `manage.py runworkers` so its worker processes share one layer
+if os.environ.get("VOXEL_IPC_SOCKET"):
+    CHANNEL_LAYERS["default"] = {
+        "BACKEND": "voxel_server.ipc.IPCChannelLayer",
+        "CONFIG": {"path": os.environ["VOXEL_IPC_SOCKET"]},
+    }
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,6 +96,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections warm between consumer queries instead of reopening per query
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # WAL lets readers (joins, exports) proceed while a block update is being written
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -132,3 +148,65 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Game server
+
+# Player rows kept in memory between reconnects (see game.cache)
+PLAYER_CACHE_SIZE = 1024
+PLAYER_CACHE_TTL = 600  # seconds
+
+# Where /profile dump writes .pstats files (see console.profiler)
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+# Server-side minimap tiles (see game.minimap)
+MINIMAP_CACHE_DIR = BASE_DIR / 'minimap_cache'
+MINIMAP_CACHE_TILES = 4096
+MINIMAP_DISK_TILES = 16384  # tile files kept in MINIMAP_CACHE_DIR
+MINIMAP_TILE_RADIUS = 384  # blocks around a player that tiles are served for
+WORLD_STORE_CHUNKS = 4096  # chunk rows kept in memory (see game.store)
+
+# Server-side mob simulation (see game.entities)
+ENTITY_TICK_RATE = 10  # ticks per second
+ENTITY_VIEW_DISTANCE = 64  # blocks
+ENTITY_MAX = 5000
+
+# Movement validation (see game.occupancy)
+MOVE_MAX_SPEED = 80  # blocks/s: elytra top speed and terminal velocity are just below
+OCCUPANCY_CHUNKS = 1024  # 8 KiB each
+
+# Largest /fill or /clone region, in blocks (see game.regions)
+REGION_MAX_BLOCKS = 4_000_000
+
+# zlib level of the cached world_data/players_list join frames (see game.frames)
+JOIN_FRAME_COMPRESSION = 6
+
+# Server world clock (see game.clock)
+WORLD_TIME_RATE = 20  # ticks per second: a 24000-tick day lasts 20 minutes
+WORLD_TIME_PERSIST_INTERVAL = 60  # seconds between saves of World.time
+WORLD_TIME_SYNC_INTERVAL = 300  # seconds between time_sync broadcasts
+
+# Console history and batched fan-out (see console.logbuffer)
+CONSOLE_LOG_SIZE = 200  # lines kept for new connections
+CONSOLE_LOG_FLUSH_INTERVAL = 0.05  # seconds
+
+# Inbound game traffic limits per connection, as (burst, per second) (see game.throttle)
+GAME_MAX_MESSAGE_BYTES = 65536
+GAME_MESSAGE_RATE = (200, 100)  # all message types together
+GAME_MESSAGE_RATES = {
+    "join": (2, 0.2),
+    "update": (40, 30),  # clients send 20 per second
+    "block_update": (40, 20),
+    "inventory_update": (10, 5),
+    "map_tiles": (20, 10),
+    "entity_hit": (10, 5),
+    "entity_explode": (5, 1),
+    "respawn": (2, 0.2),
+    "spawn_point": (2, 0.2),  # sent when sleeping in a bed
+}
+GAME_MESSAGE_DEFAULT_RATE = (10, 5)  # any other type
+GAME_UPDATE_TICK = 0.04  # seconds; position updates closer together are coalesced
+
+# Multi-process serving (see `manage.py runworkers` and voxel_server.ipc)
+GAME_WORKERS = None  # processes started by runworkers; None for one per CPU
+GAME_IPC_SOCKET = BASE_DIR / "run" / "channels.sock"  # the channel layer hub
@@ -0,0 +1,171 @@
+import asyncio
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from . import ipc
+
+# A second worker process: shares one entry, then exits on a line from stdin
+WORKER = """
+import asyncio, sys
+from voxel_server import ipc
+
+async def main():
+    layer = ipc.IPCChannelLayer(sys.argv[1])
+    await layer.new_channel()
+    ipc.shared_dict("test")["child"] = {"x": 1}
+    print("ready", flush=True)
+    await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+
+asyncio.run(main())
+"""
+
+
+class CallInLoopTests(SimpleTestCase):
+    async def test_calls_from_orm_threads_run_on_the_loop(self):
+        ran = []
+
+        def callback(value):
+            ran.append((value, threading.get_ident()))
+
+        await sync_to_async(ipc.call_in_loop, thread_sensitive=False)(callback, 1)
+        await asyncio.sleep(0)
+        self.assertEqual(ran, [(1, threading.get_ident())])
+
+    def test_without_a_loop_runs_at_once(self):
+        ran = []
+        ipc.call_in_loop(ran.append, 1)
+        self.assertEqual(ran, [1])
+
+
+def closing_layers(test):
+    # Each async test runs in its own event loop: close the layers before it stops
+    @functools.wraps(test)
+    async def wrapper(self):
+        try:
+            await test(self)
+        finally:
+            for layer in self.layers:
+                await layer.close()
+    return wrapper
+
+
+class IPCChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "channels.sock")
+        self.layers = []
+        self.addCleanup(setattr, ipc, "_layer", None)
+
+    def tearDown(self):
+        ipc._shared.pop("test", None)
+        ipc._subscribers.pop("test", None)
+
+    async def layer(self):
+        layer = ipc.IPCChannelLayer(self.path)
+        self.layers.append(layer)
+        await layer.new_channel()
+        return layer
+
+    async def eventually(self, check, timeout=5):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not check():
+            self.assertLess(asyncio.get_running_loop().time(), deadline, "timed out")
+            await asyncio.sleep(0.01)
+
+    @closing_layers
+    async def test_group_send_reaches_other_workers(self):
+        first, second = await self.layer(), await self.layer()
+        self.assertTrue(first.is_hub)
+        self.assertFalse(second.is_hub)
+        local, remote = await first.new_channel(), await second.new_channel()
+        await first.group_add("game_world", local)
+        await second.group_add("game_world", remote)
+        await asyncio.sleep(0.05)  # group_add reaches the hub
+
+        await first.group_send("game_world", {"type": "hello"})
+        self.assertEqual(await asyncio.wait_for(first.receive(local), 1), {"type": "hello"})
+        self.assertEqual(await asyncio.wait_for(second.receive(remote), 1), {"type": "hello"})
+
+        await second.send(local, {"type": "direct"})
+        self.assertEqual(await asyncio.wait_for(first.receive(local), 1), {"type": "direct"})
+
+    @closing_layers
+    async def test_hub_failover(self):
+        hub, second, third = await self.layer(), await self.layer(), await self.layer()
+        channel = await third.new_channel()
+        await third.group_add("game_world", channel)
+
+        await hub.close()
+        await self.eventually(lambda: second.is_hub or third.is_hub)
+        self.assertFalse(second.is_hub and third.is_hub)
+
+        # The new hub learns the groups again from the workers' hello
+        async def deliver():
+            await second.group_send("game_world", {"type": "after"})
+            try:
+                return await asyncio.wait_for(third.receive(channel), 0.1)
+            except asyncio.TimeoutError:
+                return None
+        deadline = asyncio.get_running_loop().time() + 5
+        while (message := await deliver()) is None:
+            self.assertLess(asyncio.get_running_loop().time(), deadline, "timed out")
+        self.assertEqual(message, {"type": "after"})
+
+    @closing_layers
+    async def test_publish_waits_for_a_hub(self):
+        received = []
+        ipc.subscribe("test")(received.append)
+        await self.layer()
+        late = ipc.IPCChannelLayer(self.path)
+        self.layers.append(late)
+
+        ipc.publish("test", {"n": 1})  # not connected yet
+        await late.new_channel()
+        await self.eventually(lambda: received)
+        self.assertEqual(received, [{"n": 1}])
+
+    @closing_layers
+    async def test_expired_channels_are_dropped(self):
+        layer = await self.layer()
+        gone, alive = await layer.new_channel(), await layer.new_channel()
+        await layer.group_add("game_world", gone)
+        layer.expiry = -1
+        await layer.send(gone, {"type": "lost"})
+
+        layer.expiry = 60
+        layer._next_clean = 0
+        await layer.send(alive, {"type": "kept"})
+        self.assertNotIn(gone, layer.channels)
+        self.assertNotIn("game_world", layer.groups)
+        self.assertEqual(await layer.receive(alive), {"type": "kept"})
+
+    @closing_layers
+    async def test_shared_dict_mirrors_other_processes(self):
+        await self.layer()
+        shared = ipc.shared_dict("test")
+        worker = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", WORKER, self.path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, cwd=settings.BASE_DIR,
+        )
+        try:
+            self.assertEqual(await asyncio.wait_for(worker.stdout.readline(), 10), b"ready\n")
+            await self.eventually(lambda: shared.get("child") == {"x": 1})
+
+            # The entries of a worker that goes away go with it
+            worker.stdin.write(b"\n")
+            await worker.stdin.drain()
+            await asyncio.wait_for(worker.wait(), 10)
+            await self.eventually(lambda: "child" not in shared)
+        finally:
+            if worker.returncode is None:
+                worker.kill()
+                await worker.wait()
@@ -17,6 +17,13 @@ export class Console {
               args: [['on', 'off']] },
             { cmd: 'gamemode', requiresOp: true, usage: '/gamemode <survival|creative> [player]',
               args: [['survival', 'creative'], '__players__'] },
+            { cmd: 'profile', requiresOp: true, usage: '/profile <start|stop|dump> [count]',
+              args: [['start', 'stop', 'dump']] },
+            { cmd: 'netstats', requiresOp: true, usage: '/netstats' },
+            { cmd: 'fill', requiresOp: true, usage: '/fill <x1> <y1> <z1> <x2> <y2> <z2> <block>' },
+            { cmd: 'clone', requiresOp: true, usage: '/clone <x1> <y1> <z1> <x2> <y2> <z2> <x> <y> <z>' },
+            { cmd: 'loglevel', requiresOp: false, usage: '/loglevel <chat|info|error>',
+              args: [['chat', 'info', 'error']] },
         ];
 
         this.suggestions = [];
@@ -57,9 +64,9 @@ export class Console {
             case 'console_log':
                 this.log(data.message, data.level);
                 break;
-            case 'time_update':
-                this.game.time = data.time;
-                this.log(`Time synced to ${data.time}`);
+            case 'console_batch':
+            case 'console_backlog':
+                this.logEntries(data.entries);
                 break;
             case 'teleport':
                 this.game.player.camera.position.set(data.x, data.y, data.z);
@@ -195,10 +202,19 @@ export class Console {
     }
 
     log(message, type = 'info') {
-        const line = document.createElement('div');
-        line.textContent = message;
-        line.className = `console-line ${type}`;
-        this.output.appendChild(line);
+        this.logEntries([{ message, level: type }]);
+    }
+
+    logEntries(entries) {
+        // One DOM insertion and one scroll per batch
+        const lines = document.createDocumentFragment();
+        for (const entry of entries) {
+            const line = document.createElement('div');
+            line.textContent = entry.message;
+            line.className = `console-line ${entry.level}`;
+            lines.appendChild(line);
+        }
+        this.output.appendChild(lines);
         this.output.scrollTop = this.output.scrollHeight;
     }
 
@@ -106,6 +106,8 @@ export class Creeper {
     const distSq = dx * dx + dz * dz;
     const dist = Math.sqrt(distSq);
 
+    this.updateAttack(dt);
+
     if (distSq < this.detectionRange * this.detectionRange) {
       const angle = Math.atan2(dx, dz);
       this.rotation = angle;
@@ -115,52 +117,13 @@ export class Creeper {
         this.isMoving = true;
         this.velocity.x = Math.sin(angle) * this.moveSpeed;
         this.velocity.z = Math.cos(angle) * this.moveSpeed;
-
-        // Cancel fuse if player runs away
-        if (this.isFusing && dist > 5) {
-          this.isFusing = false;
-          this.fuseTimer = 0;
-          this.resetFlash();
-        }
       } else {
-        // Close enough - start fusing
+        // Close enough - stop and fuse
         this.isMoving = false;
         this.velocity.x = 0;
         this.velocity.z = 0;
-
-        if (!this.isFusing) {
-          this.isFusing = true;
-          this.fuseTimer = 0;
-        }
-
-        this.fuseTimer += dt;
-
-        // Flash effect
-        this.flashTimer += dt * 10;
-        const flash = Math.sin(this.flashTimer * (this.fuseTimer / this.fuseTime * 5)) > 0;
-        this.mesh.children.forEach(c => {
-          if (c.material) {
-            c.material.emissive = flash ?
-              new THREE.Color(1, 1, 1) :
-              new THREE.Color(0, 0, 0);
-          }
-        });
-        // Scale up slightly
-        const scale = 1 + (this.fuseTimer / this.fuseTime) * 0.15;
-        this.mesh.scale.set(scale, scale, scale);
-
-        if (this.fuseTimer >= this.fuseTime) {
-          this.explode();
-        }
       }
     } else {
-      // Cancel fuse if player is out of detection range
-      if (this.isFusing) {
-        this.isFusing = false;
-        this.fuseTimer = 0;
-        this.resetFlash();
-      }
-
       // Wander
       this.wanderTimer -= dt;
       if (this.wanderTimer <= 0) {
@@ -184,6 +147,50 @@ export class Creeper {
     }
   }
 
+  // Also run for server-driven creepers, against the local player
+  updateAttack(dt) {
+    const playerPos = this.game.player.camera.position;
+    const dx = playerPos.x - this.position.x;
+    const dz = playerPos.z - this.position.z;
+    const dist = Math.sqrt(dx * dx + dz * dz);
+
+    if (dist > 3) {
+      // Cancel fuse if player runs away
+      if (this.isFusing && dist > 5) {
+        this.isFusing = false;
+        this.fuseTimer = 0;
+        this.resetFlash();
+      }
+      return;
+    }
+
+    // Close enough - start fusing
+    if (!this.isFusing) {
+      this.isFusing = true;
+      this.fuseTimer = 0;
+    }
+
+    this.fuseTimer += dt;
+
+    // Flash effect
+    this.flashTimer += dt * 10;
+    const flash = Math.sin(this.flashTimer * (this.fuseTimer / this.fuseTime * 5)) > 0;
+    this.mesh.children.forEach(c => {
+      if (c.material) {
+        c.material.emissive = flash ?
+          new THREE.Color(1, 1, 1) :
+          new THREE.Color(0, 0, 0);
+      }
+    });
+    // Scale up slightly
+    const scale = 1 + (this.fuseTimer / this.fuseTime) * 0.15;
+    this.mesh.scale.set(scale, scale, scale);
+
+    if (this.fuseTimer >= this.fuseTime) {
+      this.explode();
+    }
+  }
+
   resetFlash() {
     this.mesh.children.forEach(c => {
       if (c.material) c.material.emissive = new THREE.Color(0, 0, 0);
@@ -197,18 +204,11 @@ export class Creeper {
     const cz = Math.floor(this.position.z);
     const r = this.explosionRadius;
 
-    // Destroy blocks in radius
-    for (let x = -r; x <= r; x++) {
-      for (let y = -r; y <= r; y++) {
-        for (let z = -r; z <= r; z++) {
-          if (x * x + y * y + z * z <= r * r) {
-            const block = this.game.world.getBlock(cx + x, cy + y, cz + z);
-            if (block !== BlockType.BEDROCK && block !== 0) {
-              this.game.world.setBlock(cx + x, cy + y, cz + z, 0);
-            }
-          }
-        }
-      }
+    if (this.remote) {
+      // The server clears the crater and sends it to everyone as a region_update
+      this.game.networkManager.send({ type: 'entity_explode', id: this.serverId });
+    } else {
+      this.destroyBlocks(cx, cy, cz, r);
     }
 
     // Damage player
@@ -233,6 +233,21 @@ export class Creeper {
     this.health = 0;
   }
 
+  destroyBlocks(cx, cy, cz, r) {
+    for (let x = -r; x <= r; x++) {
+      for (let y = -r; y <= r; y++) {
+        for (let z = -r; z <= r; z++) {
+          if (x * x + y * y + z * z <= r * r) {
+            const block = this.game.world.getBlock(cx + x, cy + y, cz + z);
+            if (block !== BlockType.BEDROCK && block !== 0) {
+              this.game.world.setBlock(cx + x, cy + y, cz + z, 0);
+            }
+          }
+        }
+      }
+    }
+  }
+
   updatePhysics(dt) {
     this.velocity.y -= 32.0 * dt;
 
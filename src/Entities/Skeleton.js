@@ -104,7 +104,7 @@ export class Skeleton {
     const distSq = dx * dx + dz * dz;
     const dist = Math.sqrt(distSq);
 
-    this.attackCooldown = Math.max(0, this.attackCooldown - dt);
+    this.updateAttack(dt);
 
     // Sun damage (daytime = 0-12000, night = 12000-24000)
     const isDay = this.game.time < 12000;
@@ -141,12 +141,6 @@ export class Skeleton {
         this.velocity.x = Math.sin(strafeAngle) * this.moveSpeed * 0.4;
         this.velocity.z = Math.cos(strafeAngle) * this.moveSpeed * 0.4;
       }
-
-      // Shoot arrow
-      if (dist < this.attackRange && this.attackCooldown <= 0) {
-        this.attackCooldown = 1.5 + Math.random();
-        this.shootArrow();
-      }
     } else {
       // Wander
       this.wanderTimer -= dt;
@@ -171,6 +165,20 @@ export class Skeleton {
     }
   }
 
+  // Also run for server-driven skeletons, against the local player
+  updateAttack(dt) {
+    this.attackCooldown = Math.max(0, this.attackCooldown - dt);
+
+    // Shoot arrow
+    const playerPos = this.game.player.camera.position;
+    const dx = playerPos.x - this.position.x;
+    const dz = playerPos.z - this.position.z;
+    if (dx * dx + dz * dz < this.attackRange * this.attackRange && this.attackCooldown <= 0) {
+      this.attackCooldown = 1.5 + Math.random();
+      this.shootArrow();
+    }
+  }
+
   shootArrow() {
     const playerPos = this.game.player.camera.position;
     const spawnPos = new THREE.Vector3(
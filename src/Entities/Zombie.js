@@ -114,7 +114,7 @@ export class Zombie {
     const dz = playerPos.z - this.position.z;
     const distSq = dx * dx + dz * dz;
 
-    this.attackCooldown = Math.max(0, this.attackCooldown - dt);
+    this.updateAttack(dt);
 
     // Sun damage (daytime = 0-12000, night = 12000-24000)
     const isDay = this.game.time < 12000;
@@ -139,13 +139,6 @@ export class Zombie {
       const speed = this.moveSpeed;
       this.velocity.x = Math.sin(angle) * speed;
       this.velocity.z = Math.cos(angle) * speed;
-
-      // Attack if close enough
-      const dist3D = Math.sqrt(distSq + Math.pow(playerPos.y - this.position.y - 1, 2));
-      if (dist3D < this.attackRange && this.attackCooldown <= 0) {
-        this.attackCooldown = 1.0;
-        this.game.player.takeDamage(this.damage);
-      }
     } else {
       // Wander
       this.wanderTimer -= dt;
@@ -170,6 +163,21 @@ export class Zombie {
     }
   }
 
+  // Also run for server-driven zombies, against the local player
+  updateAttack(dt) {
+    this.attackCooldown = Math.max(0, this.attackCooldown - dt);
+
+    // Attack if close enough
+    const playerPos = this.game.player.camera.position;
+    const dx = playerPos.x - this.position.x;
+    const dz = playerPos.z - this.position.z;
+    const dist3D = Math.sqrt(dx * dx + dz * dz + Math.pow(playerPos.y - this.position.y - 1, 2));
+    if (dist3D < this.attackRange && this.attackCooldown <= 0) {
+      this.attackCooldown = 1.0;
+      this.game.player.takeDamage(this.damage);
+    }
+  }
+
   updatePhysics(dt) {
     this.velocity.y -= 32.0 * dt;
 
@@ -80,6 +80,8 @@ export class Game {
     
     this.droppedItems = [];
     this.entities = [];
+    this.serverEntities = new Map(); // server id -> entity, for mobs simulated by the server
+    this.killedServerEntities = new Set();
 
     // Network
     this.networkManager = new NetworkManager(this);
@@ -414,6 +416,12 @@ export class Game {
     // document.getElementById('chunk-count').innerText = this.world.chunks.size;
   }
 
+  syncTime(time, rate) {
+    // The server's clock: advance from its time at its rate until the next sync
+    this.time = time;
+    this.timeSpeed = rate / 10;
+  }
+
   updateDayNightCycle(delta) {
     const oldTime = this.time;
     this.time += this.timeSpeed * delta * 10; // Speed up a bit
@@ -556,23 +564,70 @@ export class Game {
     // this.isPlaying = true; // Will be set by NetworkManager on player_init
   }
 
-  spawnEntity(type, position) {
+  createEntity(type, position) {
       if (type === 'pig') {
-          const pig = new Pig(this, position);
-          this.entities.push(pig);
+          return new Pig(this, position);
       } else if (type === 'chicken') {
-          const chicken = new Chicken(this, position);
-          this.entities.push(chicken);
+          return new Chicken(this, position);
       } else if (type === 'zombie') {
-          const zombie = new Zombie(this, position);
-          this.entities.push(zombie);
+          return new Zombie(this, position);
       } else if (type === 'skeleton') {
-          const skeleton = new Skeleton(this, position);
-          this.entities.push(skeleton);
+          return new Skeleton(this, position);
       } else if (type === 'creeper') {
-          const creeper = new Creeper(this, position);
-          this.entities.push(creeper);
+          return new Creeper(this, position);
       }
+      return null;
+  }
+
+  spawnEntity(type, position) {
+      const entity = this.createEntity(type, position);
+      if (entity) this.entities.push(entity);
+  }
+
+  // Apply a batched mob snapshot from the server (see game/entities.py)
+  syncServerEntities(data) {
+      const seen = new Set();
+      for (let i = 0; i < data.ids.length; i++) {
+          const id = data.ids[i];
+          if (this.killedServerEntities.has(id)) continue;
+          seen.add(id);
+
+          const x = data.pos[i * 3], y = data.pos[i * 3 + 1], z = data.pos[i * 3 + 2];
+          let entity = this.serverEntities.get(id);
+          if (!entity) {
+              entity = this.createEntity(data.names[data.kinds[i]], new THREE.Vector3(x, y, z));
+              if (!entity) continue;
+              entity.remote = true;
+              entity.serverId = id;
+              entity.targetPosition = new THREE.Vector3(x, y, z);
+              this.serverEntities.set(id, entity);
+              this.entities.push(entity);
+          }
+          entity.targetPosition.set(x, y, z);
+          entity.rotation = data.rot[i];
+      }
+
+      for (const [id, entity] of this.serverEntities) {
+          if (seen.has(id)) continue;
+          this.serverEntities.delete(id);
+          const index = this.entities.indexOf(entity);
+          if (index !== -1) {
+              entity.dispose();
+              this.entities.splice(index, 1);
+          }
+      }
+      for (const id of this.killedServerEntities) {
+          if (!data.ids.includes(id)) this.killedServerEntities.delete(id);
+      }
+  }
+
+  updateRemoteEntity(entity, delta) {
+      // Server snapshots arrive ~5 times a second; smooth in between
+      entity.position.lerp(entity.targetPosition, Math.min(1, delta * 10));
+      entity.mesh.position.copy(entity.position);
+      entity.mesh.rotation.y = entity.rotation + Math.PI;
+      // Movement is the server's, attacks on the local player are resolved here
+      if (entity.updateAttack) entity.updateAttack(delta);
   }
 
   igniteTNT(x, y, z) {
@@ -586,6 +641,9 @@ export class Game {
   maxPassiveMobs = 10;
 
   updateMobSpawning(delta) {
+    // Online, mobs are spawned and simulated by the server
+    if (this.networkManager.connected) return;
+
     this.mobSpawnTimer += delta;
     if (this.mobSpawnTimer < 5) return; // Check every 5 seconds
     this.mobSpawnTimer = 0;
@@ -695,6 +753,9 @@ export class Game {
       }
 
       closest.takeDamage(damage);
+      if (closest.remote) {
+        this.networkManager.send({ type: 'entity_hit', id: closest.serverId, damage });
+      }
 
       // Knockback (base + enchantment)
       let knockbackMult = 5;
@@ -732,7 +793,13 @@ export class Game {
       this.updateTorchLights();
 
       // Update entities
-      this.entities.forEach(entity => entity.update(delta));
+      this.entities.forEach(entity => {
+        if (entity.remote) {
+          this.updateRemoteEntity(entity, delta);
+        } else {
+          entity.update(delta);
+        }
+      });
 
       // Remove dead entities and spawn drops
       for (let i = this.entities.length - 1; i >= 0; i--) {
@@ -767,6 +834,10 @@ export class Game {
           const xpAmount = xpTable[entity.type] || 0;
           if (xpAmount && this.player) this.player.addXP(xpAmount);
           
+          if (entity.remote) {
+            this.serverEntities.delete(entity.serverId);
+            this.killedServerEntities.add(entity.serverId);
+          }
           entity.dispose();
           this.entities.splice(i, 1);
         }
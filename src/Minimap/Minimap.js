@@ -4,7 +4,7 @@ export class Minimap {
     constructor(game) {
         this.game = game;
         this.size = 200; // Size of the minimap in pixels
-        this.viewRadius = 64; // Radius of the area to show in blocks
+        this.viewRadius = 256; // Radius of the area to show in blocks, past the render distance
         this.zoom = 1; // Scale factor
         
         // Container
@@ -40,6 +40,18 @@ export class Minimap {
         
         this.lastUpdate = 0;
         this.updateInterval = 50; // Update every 50ms (20fps)
+
+        // Server-computed tiles cover areas without loaded chunks
+        this.tileLevel = Math.max(0, Math.min(4, Math.floor(Math.log2(this.viewRadius / 64))));
+        this.tileStep = 1 << this.tileLevel;
+        this.tileSpan = 16 * this.tileStep;
+        this.tiles = new Map();
+        this.pendingTiles = new Set();
+        this.staleTiles = new Set(); // edited since received: still drawn, asked for again
+        this.tileKeepMargin = 2; // tiles kept past the view before they are dropped
+        this.lastTileRequest = 0;
+        this.tileRequestInterval = 1000;
+        this.maxTilesPerRequest = 64; // MAX_TILES_PER_REQUEST on the server
         
         this.visible = true;
     }
@@ -56,6 +68,7 @@ export class Minimap {
         const pz = Math.floor(playerPos.z);
         const py = Math.floor(playerPos.y);
         const playerRotation = this.game.player.camera.rotation.y;
+        this.requestTiles(px, pz, now);
         const cos = Math.cos(playerRotation);
         const sin = Math.sin(playerRotation);
 
@@ -147,51 +160,54 @@ export class Minimap {
                     lastCz = cz;
                 }
 
+                let topBlock = null;
                 if (chunk) {
                     let lx = wx % chunkSize;
                     let lz = wz % chunkSize;
                     if (lx < 0) lx += chunkSize;
                     if (lz < 0) lz += chunkSize;
 
-                    const topBlock = chunk.getTopBlock(lx, lz);
-                    
-                    if (topBlock && topBlock.id !== BlockType.AIR) {
-                        const def = BlockDefinitions[topBlock.id];
-                        if (def && def.color) {
-                            // Simple shading based on height difference
-                            // We compare with player height or absolute height?
-                            // Let's use absolute height for terrain relief.
-                            // We can't easily get neighbor height here without more lookups.
-                            // So let's just use the color.
-                            
-                            let color = def.color;
-                            
-                            // Height shading: darker if lower
-                            // Base brightness on height relative to sea level (40)
-                            // This gives a topographic map feel
-                            const heightDiff = topBlock.y - py;
-                            let brightness = 1.0;
-                            
-                            if (heightDiff < -10) brightness = 0.7;
-                            else if (heightDiff < -5) brightness = 0.8;
-                            else if (heightDiff > 5) brightness = 1.1;
-                            else if (heightDiff > 10) brightness = 1.2;
-                            
-                            // Apply global brightness (Day/Night)
-                            brightness *= globalBrightness;
-
-                            // Apply brightness
-                            const r = Math.min(255, Math.max(0, ((color >> 16) & 255) * brightness));
-                            const g = Math.min(255, Math.max(0, ((color >> 8) & 255) * brightness));
-                            const b = Math.min(255, Math.max(0, (color & 255) * brightness));
-                            
-                            // Write to buffer (ABGR format for little-endian)
-                            this.pixelBuffer[y * this.size + x] = 
-                                (255 << 24) | // Alpha
-                                (b << 16) |   // Blue
-                                (g << 8) |    // Green
-                                r;            // Red
-                        }
+                    topBlock = chunk.getTopBlock(lx, lz);
+                } else {
+                    topBlock = this.getTileTop(wx, wz);
+                }
+
+                if (topBlock && topBlock.id !== BlockType.AIR) {
+                    const def = BlockDefinitions[topBlock.id];
+                    if (def && def.color) {
+                        // Simple shading based on height difference
+                        // We compare with player height or absolute height?
+                        // Let's use absolute height for terrain relief.
+                        // We can't easily get neighbor height here without more lookups.
+                        // So let's just use the color.
+                        
+                        let color = def.color;
+                        
+                        // Height shading: darker if lower
+                        // Base brightness on height relative to sea level (40)
+                        // This gives a topographic map feel
+                        const heightDiff = topBlock.y - py;
+                        let brightness = 1.0;
+                        
+                        if (heightDiff < -10) brightness = 0.7;
+                        else if (heightDiff < -5) brightness = 0.8;
+                        else if (heightDiff > 5) brightness = 1.1;
+                        else if (heightDiff > 10) brightness = 1.2;
+                        
+                        // Apply global brightness (Day/Night)
+                        brightness *= globalBrightness;
+
+                        // Apply brightness
+                        const r = Math.min(255, Math.max(0, ((color >> 16) & 255) * brightness));
+                        const g = Math.min(255, Math.max(0, ((color >> 8) & 255) * brightness));
+                        const b = Math.min(255, Math.max(0, (color & 255) * brightness));
+                        
+                        // Write to buffer (ABGR format for little-endian)
+                        this.pixelBuffer[y * this.size + x] = 
+                            (255 << 24) | // Alpha
+                            (b << 16) |   // Blue
+                            (g << 8) |    // Green
+                            r;            // Red
                     }
                 }
             }
@@ -228,6 +244,107 @@ export class Minimap {
         this.ctx.fillText('N', nx, ny);
     }
 
+    requestTiles(px, pz, now) {
+        const network = this.game.networkManager;
+        if (!network || !network.connected) return;
+        if (now - this.lastTileRequest < this.tileRequestInterval) return;
+        this.lastTileRequest = now;
+
+        const minTx = Math.floor((px - this.viewRadius) / this.tileSpan);
+        const maxTx = Math.floor((px + this.viewRadius) / this.tileSpan);
+        const minTz = Math.floor((pz - this.viewRadius) / this.tileSpan);
+        const maxTz = Math.floor((pz + this.viewRadius) / this.tileSpan);
+
+        // Tiles left far behind are dropped, so the cache follows the player
+        const margin = this.tileKeepMargin;
+        for (const key of this.tiles.keys()) {
+            const [tx, tz] = key.split(',').map(Number);
+            if (tx < minTx - margin || tx > maxTx + margin || tz < minTz - margin || tz > maxTz + margin) {
+                this.tiles.delete(key);
+                this.staleTiles.delete(key);
+            }
+        }
+
+        let missing = [];
+        for (let tx = minTx; tx <= maxTx; tx++) {
+            for (let tz = minTz; tz <= maxTz; tz++) {
+                const key = `${tx},${tz}`;
+                if (this.pendingTiles.has(key)) continue;
+                if (this.tiles.has(key) && !this.staleTiles.has(key)) continue;
+                missing.push([tx, tz]);
+            }
+        }
+
+        // Nearest first; the rest is asked for on the next intervals
+        const half = this.tileSpan / 2;
+        const distance = ([tx, tz]) => Math.hypot(tx * this.tileSpan + half - px, tz * this.tileSpan + half - pz);
+        missing.sort((a, b) => distance(a) - distance(b));
+        missing = missing.slice(0, this.maxTilesPerRequest);
+        for (const [tx, tz] of missing) {
+            this.pendingTiles.add(`${tx},${tz}`);
+        }
+
+        if (missing.length > 0) {
+            network.send({ type: 'map_tiles', level: this.tileLevel, tiles: missing });
+        }
+    }
+
+    setTiles(level, tiles, refused = []) {
+        if (level !== this.tileLevel) return;
+        // Refused tiles (too far from the player by now) can be asked for again
+        for (const [tx, tz] of refused) {
+            this.pendingTiles.delete(`${tx},${tz}`);
+        }
+        for (const tile of tiles) {
+            const key = `${tile.x},${tile.z}`;
+            const bytes = Uint8Array.from(atob(tile.data), c => c.charCodeAt(0));
+            // 256 heights followed by 256 little-endian uint16 block ids, indexed [x * 16 + z]
+            this.tiles.set(key, {
+                heights: bytes.subarray(0, 256),
+                blocks: new Uint16Array(bytes.buffer, 256, 256)
+            });
+            this.pendingTiles.delete(key);
+            this.staleTiles.delete(key);
+        }
+    }
+
+    // Blocks changed in the box: the server has patched its tiles, fetch them again
+    invalidateArea(x1, z1, x2, z2) {
+        const minTx = Math.floor(Math.min(x1, x2) / this.tileSpan);
+        const maxTx = Math.floor(Math.max(x1, x2) / this.tileSpan);
+        const minTz = Math.floor(Math.min(z1, z2) / this.tileSpan);
+        const maxTz = Math.floor(Math.max(z1, z2) / this.tileSpan);
+        for (let tx = minTx; tx <= maxTx; tx++) {
+            for (let tz = minTz; tz <= maxTz; tz++) {
+                const key = `${tx},${tz}`;
+                if (this.tiles.has(key)) this.staleTiles.add(key);
+            }
+        }
+    }
+
+    invalidateRegion(data) {
+        if (!data.blocks) {
+            this.invalidateArea(data.min[0], data.min[2], data.max[0], data.max[2]);
+            return;
+        }
+        const blocks = data.blocks;
+        for (let i = 0; i < blocks.length; i += 4) {
+            this.invalidateArea(blocks[i], blocks[i + 2], blocks[i], blocks[i + 2]);
+        }
+    }
+
+    getTileTop(wx, wz) {
+        const tx = Math.floor(wx / this.tileSpan);
+        const tz = Math.floor(wz / this.tileSpan);
+        const tile = this.tiles.get(`${tx},${tz}`);
+        if (!tile) return null;
+
+        const i = Math.floor((wx - tx * this.tileSpan) / this.tileStep);
+        const j = Math.floor((wz - tz * this.tileSpan) / this.tileStep);
+        const index = i * 16 + j;
+        return { id: tile.blocks[index], y: tile.heights[index] };
+    }
+
     getChunkAt(x, z) {
         // Helper to get chunk from world
         // Assuming World has a way to get chunk by key or we calculate key
@@ -7,6 +7,8 @@ export class NetworkManager {
         this.connected = false;
         this.remotePlayers = new Map();
         this.playerId = null;
+        // Messages are handled in arrival order, even while a compressed one is inflated
+        this.received = Promise.resolve();
     }
 
     connect(username) {
@@ -46,15 +48,22 @@ export class NetworkManager {
             clearTimeout(connectionTimeout);
             console.log('Connected to server');
             this.connected = true;
-            this.send({
+            const join = {
                 type: 'join',
                 username: username
-            });
+            };
+            // Lets the server send the large join frames pre-compressed
+            if (typeof DecompressionStream !== 'undefined') {
+                join.compression = 'deflate';
+            }
+            this.send(join);
         };
 
         this.socket.onmessage = (event) => {
-            const data = JSON.parse(event.data);
-            this.handleMessage(data);
+            this.received = this.received
+                .then(() => this.decode(event.data))
+                .then((data) => this.handleMessage(data))
+                .catch((error) => console.error('Error handling message:', error));
         };
 
         this.socket.onclose = (event) => {
@@ -76,6 +85,15 @@ export class NetworkManager {
         };
     }
 
+    async decode(message) {
+        if (typeof message === 'string') {
+            return JSON.parse(message);
+        }
+        // Binary frames are zlib-compressed JSON
+        const stream = message.stream().pipeThrough(new DecompressionStream('deflate'));
+        return JSON.parse(await new Response(stream).text());
+    }
+
     send(data) {
         if (this.connected) {
             this.socket.send(JSON.stringify(data));
@@ -83,6 +101,7 @@ export class NetworkManager {
     }
 
     sendBlockUpdate(x, y, z, blockType) {
+        if (this.game.minimap) this.game.minimap.invalidateArea(x, z, x, z);
         this.send({
             type: 'block_update',
             position: { x, y, z },
@@ -174,8 +193,18 @@ export class NetworkManager {
                     this.showMotd(data.motd);
                 }
                 break;
+            case 'time_sync':
+                this.game.syncTime(data.time, data.rate);
+                break;
             case 'block_update':
                 this.game.world.addModification(data.position.x, data.position.y, data.position.z, data.blockType);
+                if (this.game.minimap) {
+                    this.game.minimap.invalidateArea(data.position.x, data.position.z, data.position.x, data.position.z);
+                }
+                break;
+            case 'region_update':
+                this.game.world.applyRegionUpdate(data);
+                if (this.game.minimap) this.game.minimap.invalidateRegion(data);
                 break;
             case 'players_list':
                 data.players.forEach(player => {
@@ -199,6 +228,14 @@ export class NetworkManager {
             case 'player_update':
                 this.updateRemotePlayer(data.id, data.position, data.rotation);
                 break;
+            case 'map_tiles':
+                if (this.game.minimap) {
+                    this.game.minimap.setTiles(data.level, data.tiles, data.refused);
+                }
+                break;
+            case 'entities':
+                this.game.syncServerEntities(data);
+                break;
         }
     }
 
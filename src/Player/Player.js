@@ -225,6 +225,9 @@ export class Player {
   useBed(x, y, z) {
     // Set spawn point
     this.spawnPoint.set(x, y + 1, z);
+    if (this.game.networkManager && this.game.networkManager.connected) {
+      this.game.networkManager.send({ type: 'spawn_point', position: { x, y: y + 1, z } });
+    }
 
     // Can only sleep at night (time 12000-24000)
     if (this.game.time >= 12000 || this.game.time < 100) {
@@ -412,6 +415,9 @@ export class Player {
     // Respawn at spawn point (bed) or default
     this.camera.position.copy(this.spawnPoint);
     this.velocity.set(0, 0, 0);
+    if (this.game.networkManager && this.game.networkManager.connected) {
+      this.game.networkManager.send({ type: 'respawn' });
+    }
     
     this.updateHealthUI();
     this.updateHungerUI();
@@ -518,8 +518,14 @@ export class Chunk {
     this.minY = Math.max(0, this.minY);
 
     // Generate Minimap Data
+    this.updateTopMap();
+  }
+
+  updateTopMap() {
     for (let x = 0; x < this.size; x++) {
         for (let z = 0; z < this.size; z++) {
+            this.topMap[x + z * this.size] = 0;
+            this.heightMap[x + z * this.size] = -1;
             for (let y = this.height - 1; y >= 0; y--) {
                 const index = x + this.size * (y + this.height * z);
                 const id = this.data[index];
@@ -1181,6 +1187,18 @@ export class Chunk {
     this.updateMesh();
   }
 
+  // Batched setBlock for region edits: [[x, y, z, type], ...] in local
+  // coordinates, with a single minimap pass and mesh rebuild
+  setBlocks(entries) {
+    for (const [x, y, z, type] of entries) {
+      if (x < 0 || x >= this.size || y < 0 || y >= this.height || z < 0 || z >= this.size) continue;
+      this.data[this.getBlockIndex(x, y, z)] = type;
+      if (type !== BlockType.AIR && y > this.maxY) this.maxY = y;
+    }
+    this.updateTopMap();
+    this.updateMesh();
+  }
+
   updateMesh() {
     // Dispose existing meshes (geometry only, materials are shared)
     Object.values(this.meshes).forEach(mesh => {
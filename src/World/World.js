@@ -284,6 +284,64 @@ export class World {
       this.setBlock(x, y, z, type);
   }
 
+  // Apply a /fill or /clone broadcast: either a box filled with one block
+  // or a flat [x, y, z, type, ...] list. Each chunk is rebuilt once.
+  applyRegionUpdate(data) {
+      const byChunk = new Map();
+      const apply = (x, y, z, type) => {
+          this.modifications.set(`${x},${y},${z}`, type);
+          const chunkX = Math.floor(x / this.chunkSize);
+          const chunkZ = Math.floor(z / this.chunkSize);
+          const key = `${chunkX},${chunkZ}`;
+          let entries = byChunk.get(key);
+          if (!entries) {
+              entries = [];
+              byChunk.set(key, entries);
+          }
+          entries.push([x - chunkX * this.chunkSize, y, z - chunkZ * this.chunkSize, type]);
+      };
+
+      if (data.blocks) {
+          const blocks = data.blocks;
+          for (let i = 0; i < blocks.length; i += 4) {
+              apply(blocks[i], blocks[i + 1], blocks[i + 2], blocks[i + 3]);
+          }
+      } else {
+          // A fill (one blockType) or a clone (volume: one id per block, same order)
+          const [x1, y1, z1] = data.min;
+          const [x2, y2, z2] = data.max;
+          const volume = data.volume;
+          let i = 0;
+          for (let x = x1; x <= x2; x++) {
+              for (let y = y1; y <= y2; y++) {
+                  for (let z = z1; z <= z2; z++) {
+                      apply(x, y, z, volume ? volume[i++] : data.blockType);
+                  }
+              }
+          }
+      }
+
+      const neighbors = new Set();
+      for (const [key, entries] of byChunk) {
+          const chunk = this.chunks.get(key);
+          if (!chunk) continue;
+          chunk.setBlocks(entries);
+
+          // Faces on chunk borders belong to the neighbor meshes too
+          const [chunkX, chunkZ] = key.split(',').map(Number);
+          for (const [x, , z] of entries) {
+              if (x === 0) neighbors.add(`${chunkX - 1},${chunkZ}`);
+              else if (x === this.chunkSize - 1) neighbors.add(`${chunkX + 1},${chunkZ}`);
+              if (z === 0) neighbors.add(`${chunkX},${chunkZ - 1}`);
+              else if (z === this.chunkSize - 1) neighbors.add(`${chunkX},${chunkZ + 1}`);
+          }
+      }
+      for (const key of neighbors) {
+          const neighbor = byChunk.has(key) ? null : this.chunks.get(key);
+          if (neighbor) neighbor.updateMesh();
+      }
+  }
+
   getBiome(x, z) {
     const elevation = this.biomeNoise(x * 0.001, z * 0.001);
     const humidity = this.humidityNoise(x * 0.001, z * 0.001);